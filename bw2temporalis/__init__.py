@@ -4,6 +4,7 @@ __all__ = [
     'dynamic_methods',
     'DynamicIAMethod',
     'DynamicLCA',
+    'ExchangeIndex',
     'TemporalDistribution',
     'Timeline',
     'create_climate_methods',
@@ -19,6 +20,7 @@ from bw2data import config
 from .multi_dlca import MultiDynamicLCA
 from .dynamic_ia_methods import dynamic_methods, DynamicIAMethod
 from .dynamic_lca import DynamicLCA
+from .exchange_index import ExchangeIndex
 from .temporal_distribution import TemporalDistribution
 from .timeline import Timeline, data_point
 from .dyn_methods.timedependent_lca import time_dependent_LCA
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+from eight import *
+
+from .timeline import save_timeline, load_timeline
+from bw2data import projects
+import collections
+import hashlib
+import numpy as np
+import os
+import weakref
+
+
+class LRUCache(object):
+    """Least recently used cache bounded by the memory used by its values.
+
+    When adding a value would exceed `max_size` (in bytes) the least recently used values are evicted.
+    The number of `hits` and `misses` is counted at every ``get``.
+
+Args:
+    * *max_size* (int): maximum size in bytes of the values stored. If 0 nothing is stored.
+
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()  #key -> (value, size)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def get(self, key, default=None):
+        """Return the value for `key` and mark it as most recently used"""
+        try:
+            value, size = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data[key] = (value, size)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, size):
+        """Store `value` for `key`. `size` is the memory used by `value` in bytes"""
+        if key in self._data:
+            self.size -= self._data.pop(key)[1]
+        if size > self.max_size:
+            return
+        while self._data and self.size + size > self.max_size:
+            self.size -= self._data.popitem(last=False)[1][1]
+        self._data[key] = (value, size)
+        self.size += size
+
+    def clear(self):
+        self._data.clear()
+        self.size = 0
+
+
+class ResultCache(object):
+    """On disk cache of the timelines of ``DynamicLCA``, stored in a file per result (columnar format of ``save_timeline``, memory mapped when loaded) named with the hash of the data that identify it.
+
+    When storing a timeline would exceed `max_size` (in bytes) the least recently used results (by modification time, updated at every hit) are deleted.
+    The number of `hits` and `misses` is counted at every ``get``.
+    Before a result is deleted or overwritten the timelines returned by ``get`` for it are loaded in memory, since an open memory map prevents deleting its file on Windows
+    (arrays taken from those timelines before, e.g. ``timeline.times``, still refer to the file).
+
+Args:
+    * *dirpath* (str, default=None): folder of the cache, by default the `temporalis_cache` folder of the current project.
+    * *max_size* (int, default=2**30): maximum size in bytes of the files of the cache.
+
+    """
+    extension = '.bw2tl'
+
+    def __init__(self, dirpath=None, max_size=2 ** 30):
+        self.dirpath = dirpath or projects.request_directory('temporalis_cache')
+        if not os.path.isdir(self.dirpath):
+            os.makedirs(self.dirpath)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._mapped = {}  #path -> timelines returned by ``get`` memory mapped from it
+
+    def key(self, data):
+        """Return the key (hex digest of the hash of its representation) of `data`"""
+        return hashlib.sha1(repr(data).encode('utf-8')).hexdigest()
+
+    def __contains__(self, key):
+        return os.path.isfile(self._path(key))
+
+    def get(self, key, default=None):
+        """Return the timeline stored for `key` and mark it as most recently used"""
+        path = self._path(key)
+        try:
+            timeline, _ = load_timeline(path)
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return default
+        os.utime(path, None)
+        self._mapped.setdefault(path, weakref.WeakSet()).add(timeline)
+        self.hits += 1
+        return timeline
+
+    def set(self, key, timeline):
+        """Store `timeline` for `key` and delete the least recently used results if the cache is too big"""
+        self._release(self._path(key))
+        save_timeline(self._path(key), timeline)
+        self._evict()
+
+    def invalidate(self, key):
+        """Delete the result stored for `key`, if present"""
+        if key in self:
+            self._remove(self._path(key))
+
+    def clear(self):
+        """Delete all the results"""
+        for path, _, _ in self._entries():
+            self._remove(path)
+
+    @property
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.dirpath, key + self.extension)
+
+    def _entries(self):
+        """Return (path, size, modification time) of the results stored"""
+        entries = []
+        for name in os.listdir(self.dirpath):
+            if name.endswith(self.extension):
+                stat = os.stat(os.path.join(self.dirpath, name))
+                entries.append((os.path.join(self.dirpath, name), stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        while entries and size > self.max_size:
+            path, entry_size, _ = entries.pop(0)
+            self._remove(path)
+            size -= entry_size
+
+    def _release(self, path):
+        """Load in memory the columns of the timelines returned by ``get`` that are memory mapped from `path`, closing their memory maps"""
+        for timeline in self._mapped.pop(path, ()):
+            for name in ('_times', '_flows', '_processes', '_amounts'):
+                setattr(timeline, name, np.array(getattr(timeline, name)))
+
+    def _remove(self, path):
+        self._release(path)
+        os.remove(path)
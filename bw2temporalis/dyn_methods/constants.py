@@ -2,42 +2,106 @@
 from __future__ import print_function, unicode_literals
 from eight import *
 
-from .metrics import AGTP,RadiativeForcing
+"""AGTP and radiative forcing temporal distributions of one unit of emission (yearly, 1000 years) used by the dynamic climate methods.
+
+They are created at the first access of the attribute (e.g. ``constants.co2_agtp_ar5_td``) and saved in the `temporalis_constants` folder of the current project,
+from where they are loaded memory mapped afterwards."""
+
+from ..temporal_distribution import TemporalDistribution
+from bw2data import projects
 import numpy as np
+import os
+import sys
+import types
+
+#increase when the metrics change to recalculate the cached constants
+CACHE_VERSION = 1
+CUTOFF = 1000
+
+#gas in the name of the constant and in the metric
+GASES = (("co2", "co2"), ("co2bio", "co2_biogenic"), ("ch4", "ch4"), ("ch4_fossil", "ch4_fossil"), ("n2o", "n2o"), ("sf6", "sf6"))
+#metric in the name of the constant, metric function name and its method (None for the default)
+METRICS = (
+    ("agtp_ar5", "AGTP", None),
+    ("agtp_base", "AGTP", "op_base"),
+    ("agtp_low", "AGTP", "op_low"),
+    ("agtp_high", "AGTP", "op_high"),
+    ("rf", "RadiativeForcing", None),
+)
+#name of the constant: (metric function name, gas, method)
+CONSTANTS = {
+    "{}_{}_td".format(gas_name, metric_name): (function, gas, method)
+    for metric_name, function, method in METRICS for gas_name, gas in GASES
+}
+
+__all__ = sorted(CONSTANTS)
+
+#constants already created
+_constants = {}
+
+
+def _calculate(name):
+    """Calculate the constant `name` with its metric"""
+    from . import metrics
+    function, gas, method = CONSTANTS[name]
+    args = (gas, np.array((1.,)), np.array((0,), dtype=('timedelta64[Y]')), 'Y', CUTOFF)
+    return getattr(metrics, function)(*(args + ((method,) if method else ())))
+
+
+def _cache_paths(name):
+    dirpath = projects.request_directory('temporalis_constants')
+    return [os.path.join(dirpath, '{}.{}.v{}.npy'.format(name, field, CACHE_VERSION)) for field in ('times', 'values')]
+
+
+def _load(name):
+    """Return the constant `name` loaded from the cache, calculating and saving it if not there"""
+    try:
+        paths = _cache_paths(name)
+    except (IOError, OSError):
+        #e.g. project folder not writable, use the constant without caching it
+        return _calculate(name)
+    try:
+        times, values = [np.load(path, mmap_mode='r') for path in paths]
+        return TemporalDistribution(times.view('timedelta64[s]'), values)
+    except (IOError, OSError, ValueError):
+        pass
+    td = _calculate(name)
+    try:
+        for path, array in zip(paths, (td.times.astype('timedelta64[s]').view(np.int64), td.values)):
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(path + '.tmp', path)
+    except (IOError, OSError):
+        pass
+    return td
+
+
+def __getattr__(name):
+    if name not in CONSTANTS:
+        raise AttributeError("module {} has no attribute {}".format(__name__, name))
+    if name not in _constants:
+        _constants[name] = _load(name)
+    return _constants[name]
+
+
+def __dir__():
+    return sorted(set(globals()).union(CONSTANTS))
+
+
+class _LazyModule(types.ModuleType):
+    """This module for Python versions without module ``__getattr__`` (PEP 562), creating the constants at the first access as well"""
+    def __init__(self, module):
+        super(_LazyModule, self).__init__(module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        #keep the original module alive, Python 2 clears the globals of deleted modules
+        self._module = module
+
+    def __getattr__(self, name):
+        return __getattr__(name)
+
+    def __dir__(self):
+        return __dir__()
+
 
-#create AGTP timeline (add other gasses)
-co2_agtp_ar5_td = AGTP("co2", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
-co2bio_agtp_ar5_td = AGTP("co2_biogenic", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
-ch4_agtp_ar5_td = AGTP("ch4", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
-ch4_fossil_agtp_ar5_td = AGTP("ch4_fossil", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
-n2o_agtp_ar5_td = AGTP("n2o", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
-sf6_agtp_ar5_td = AGTP("sf6", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
-
-co2_agtp_base_td = AGTP("co2", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_base")
-co2bio_agtp_base_td = AGTP("co2_biogenic", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_base")
-ch4_agtp_base_td = AGTP("ch4", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_base")
-ch4_fossil_agtp_base_td = AGTP("ch4_fossil", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_base")
-n2o_agtp_base_td = AGTP("n2o", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_base")
-sf6_agtp_base_td = AGTP("sf6", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_base")
-
-co2_agtp_low_td = AGTP("co2", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_low")
-co2bio_agtp_low_td = AGTP("co2_biogenic", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_low")
-ch4_agtp_low_td = AGTP("ch4", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_low")
-ch4_fossil_agtp_low_td = AGTP("ch4_fossil", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_low")
-n2o_agtp_low_td = AGTP("n2o", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_low")
-sf6_agtp_low_td = AGTP("sf6", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_low")
-
-co2_agtp_high_td = AGTP("co2", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_high")
-co2bio_agtp_high_td = AGTP("co2_biogenic", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_high")
-ch4_agtp_high_td = AGTP("ch4", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_high")
-ch4_fossil_agtp_high_td = AGTP("ch4_fossil", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_high")
-n2o_agtp_high_td = AGTP("n2o", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_high")
-sf6_agtp_high_td = AGTP("sf6", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000, "op_high")
-
-#create RF timeline (add other gasses)
-co2_rf_td = RadiativeForcing("co2", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
-co2bio_rf_td = RadiativeForcing("co2_biogenic", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
-ch4_rf_td = RadiativeForcing("ch4", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
-ch4_fossil_rf_td = RadiativeForcing("ch4_fossil", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
-n2o_rf_td = RadiativeForcing("n2o", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
-sf6_rf_td = RadiativeForcing("sf6", np.array((1.,)), np.array((0,),dtype=('timedelta64[Y]')), 'Y', 1000)
+if sys.version_info < (3, 7):
+    sys.modules[__name__] = _LazyModule(sys.modules[__name__])
@@ -7,7 +7,6 @@ from eight import *
 We wrap this library to provide dynamic LCIA methods that fit the Temporalis data model."""
 
 from ..dynamic_ia_methods import DynamicIAMethod
-from .constants import *
 from bw2data import config, Database
 import itertools
 
@@ -79,7 +78,8 @@ def create_climate_methods():
                         cf_data[bio_key] = function.format(gas,met_func)                            
         method.register(
             from_function="create_climate_methods",
-            library="dyn_methods"
+            library="dyn_methods",
+            shift_invariant=True
         )   
         method.write(cf_data)     
 
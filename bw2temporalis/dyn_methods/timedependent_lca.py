@@ -4,7 +4,7 @@ from eight import *
 
 import numpy as np
 from ..dynamic_lca import DynamicLCA
-from .constants import co2_agtp_ar5_td,co2_rf_td
+from . import constants
 
 # from .dynamic_ia_methods import dynamic_methods, DynamicIAMethod
 # from .temporal_distribution import TemporalDistribution
@@ -44,8 +44,8 @@ Args:
     #~dyn_lca=([int(x) for x in dyn_lca[0]],dyn_lca[1]) #convert years to int, but better not to be consistent with resolution less than years
 
     #pick denominator based on metric
-    if dyn_m[dynIAM]=='GWP':co2=co2_rf_td
-    if dyn_m[dynIAM]=='GTP':co2=co2_agtp_ar5_td
+    if dyn_m[dynIAM]=='GWP':co2=constants.co2_rf_td
+    if dyn_m[dynIAM]=='GTP':co2=constants.co2_agtp_ar5_td
 
     #calculate lenght of th from first emission occuring
     length=len([int(yr) for yr in dyn_lca[0] if int(yr) <= th_end])
@@ -53,7 +53,7 @@ Args:
 
     #calculate agwp for demand and co2 and then gwp
     res=np.trapz(x=dyn_lca[0][:length] , y=dyn_lca[1][:length]) / np.trapz(
-                 x=(co2_rf_td.times.astype('timedelta64[Y]').astype('int') + dyn_lca[0][0])[:length],
-                 y=co2_rf_td.values[:length])
+                 x=(constants.co2_rf_td.times.astype('timedelta64[Y]').astype('int') + dyn_lca[0][0])[:length],
+                 y=constants.co2_rf_td.values[:length])
     
     return res
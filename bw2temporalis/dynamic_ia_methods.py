@@ -3,24 +3,114 @@ from __future__ import print_function, unicode_literals
 from eight import *
 
 from .utils import get_maximum_value, get_function_name
-from bw2data import DataStore, Method, methods
+from bw2data import DataStore, Method, methods, projects
 from bw2data.serialization import SerializedDict
-from bw2data.utils import random_string
+import numpy as np
+import collections
+import datetime
+import hashlib
+import marshal
+import multiprocessing
+import os
+import sys
 import warnings
 
+#emission datetime used to evaluate the dynamic CF functions when creating kernels
+KERNEL_REFERENCE = datetime.datetime(2000, 1, 1)
+#folder of the on disk cache of the bytecode of CF functions (True for the `temporalis_bytecode` folder of the current project), not used if None.
+#Set it before starting worker processes to avoid compiling the same functions in each of them
+BYTECODE_CACHE = None
+
+#value of CF functions, (datetime, amount)
+cf_value = collections.namedtuple('cf_value', ['dt', 'amount'])
+
+#compiled code of CF functions by source string
+_code_cache = {}
+#functions created by `DynamicIAMethod.create_functions` by (method name, hash of the method data)
+_functions_cache = {}
+#maximum values of CF functions by (hash of the function string, array protocol, arguments of `get_maximum_value`), see `DynamicIAMethod.to_worst_case_method`
+_maximum_cache = {}
+
+
+def _compile(func_string):
+    """Return the code object of `func_string`, compiling it only if not already compiled in this process or saved in the `BYTECODE_CACHE` folder"""
+    if func_string in _code_cache:
+        return _code_cache[func_string]
+    path = None
+    if BYTECODE_CACHE is not None:
+        dirpath = projects.request_directory('temporalis_bytecode') if BYTECODE_CACHE is True else BYTECODE_CACHE
+        name = hashlib.sha1(func_string.encode('utf-8')).hexdigest()
+        path = os.path.join(dirpath, '{}.{}.marshal'.format(name, sys.implementation.cache_tag))
+        try:
+            with open(path, 'rb') as f:
+                _code_cache[func_string] = marshal.load(f)
+            return _code_cache[func_string]
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            pass
+    code = _code_cache[func_string] = compile(func_string, '<dynamic CF function>', 'exec')
+    if path is not None:
+        #temporary file per process, workers may compile the same function at the same time
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                marshal.dump(code, f)
+            os.replace(tmp_path, path)
+        except (IOError, OSError):
+            #e.g. folder not writable, the function is compiled again next time
+            pass
+    return code
+
 
 class FunctionWrapper(object):
+    #True if the function follows the array protocol, see `ArrayFunctionWrapper`
+    vectorized = False
+
     def __init__(self, func_string):
         self.func_name = get_function_name(func_string)
         if not self.func_name:
             raise ValueError
-        exec(func_string)
-        self.function = locals()[self.func_name]
+        self.source = func_string
+        #module namespace as when the function was executed here
+        namespace = dict(globals())
+        exec(_compile(func_string), namespace)
+        self.function = namespace[self.func_name]
 
     def __call__(self, *args, **kwargs):
         return self.function(*args, **kwargs)
 
 
+class ArrayFunctionWrapper(FunctionWrapper):
+    """Wrapper of a CF function of the array protocol (methods registered with ``function_protocol='array'``).
+    The function takes an array of emission datetimes (`datetime64[s]`) and returns an array of offsets from the emission (`timedelta64` or seconds)
+    and an array of values (emissions x offsets, or only offsets when the values are the same for all the emissions i.e. a kernel).
+    Calling the wrapper with a single datetime returns a list of `cf_value` as the functions of the scalar protocol."""
+    vectorized = True
+
+    def evaluate(self, times):
+        """Return the offsets in seconds (int64) and the 2D array of values (emissions x offsets) of the CF for the array of emission `times`"""
+        times = np.asarray(times).astype('datetime64[s]')
+        offsets, values = self.function(times)
+        offsets = np.asarray(offsets)
+        if offsets.dtype.kind == 'm':
+            offsets = offsets.astype('timedelta64[s]')
+        offsets = offsets.astype(np.int64)
+        values = np.asarray(values, dtype=np.float64).reshape((-1, offsets.shape[0]))
+        return offsets, np.broadcast_to(values, (times.shape[0], offsets.shape[0]))
+
+    def __call__(self, dt):
+        offsets, values = self.evaluate([np.datetime64(dt, 's')])
+        dts = (np.datetime64(dt, 's') + offsets.astype('timedelta64[s]')).astype(datetime.datetime).tolist()
+        return [cf_value(dt, amount) for dt, amount in zip(dts, values[0].tolist())]
+
+
+def _maximum_value(args):
+    """Return the maximum value of a CF function passed as (function string, True if of the array protocol, arguments of `get_maximum_value`), in a worker process"""
+    func_string, vectorized, kwargs = args
+    function = ArrayFunctionWrapper(func_string) if vectorized else FunctionWrapper(func_string)
+    return get_maximum_value(function, **kwargs)
+
+
 class DynamicMethods(SerializedDict):
     """A dictionary for dynamic impact assessment method metadata. File data is saved in ``dynamic-methods.json``."""
     filename = "dynamic-methods.json"
@@ -30,38 +120,56 @@ dynamic_methods = DynamicMethods()
 
 
 class DynamicIAMethod(DataStore):
-    """A dynamic impact assessment method. Not translated into matrices, so no ``process`` method."""
+    """A dynamic impact assessment method. Not translated into matrices, so no ``process`` method.
+
+    If the method is registered with ``shift_invariant=True`` its CF functions return the same values for any datetime of emission,
+    only shifted in time, and they can be used as numerical kernels (see ``create_kernels``)."""
     _metadata = dynamic_methods
 
-    def to_worst_case_method(self, name, lower=None, upper=None, dynamic=True,register=True):
+    @property
+    def vectorized(self):
+        """True if the CF functions of the method follow the array protocol (registered with ``function_protocol='array'``, see ``ArrayFunctionWrapper``)"""
+        return dynamic_methods.get(self.name, {}).get('function_protocol') == 'array'
+
+    @property
+    def shift_invariant(self):
+        """True if the CF functions of the method do not depend on the datetime of emission other than by shifting their results"""
+        return bool(self.metadata.get('shift_invariant', False))
+
+    def to_worst_case_method(self, name, lower=None, upper=None, dynamic=True,register=True,coarse_step=1,workers=None):
         """Create a static LCA method using the worst case for each dynamic CF function.
-        Default time interval over which to test for maximum CF is `datetime.now()` to `datetime.now()+relativedelta(years=100)`.
+        Default time interval over which to test for maximum CF is the current day to the current day + 100 years.
+        The maximum of each different function string is calculated once and cached for the same bounds and options.
         
 Args:
     * *name* (string): method name.
-    * *lower* (datetime, default=datetime(2010, 1, 1): lower bound of the interval to consider.
-    * *upper* (datetime, default=lower + relativedelta(years=100): upper bound of the interval to consider.
-    * *dynamic* (bool, default=True): If total CF function of time of emission 
+    * *lower* (datetime, default=today): lower bound of the interval to consider.
+    * *upper* (datetime, default=lower + 100 years): upper bound of the interval to consider.
+    * *dynamic* (bool, default=True): If total CF function of time of emission. Not used for `shift_invariant` methods, whose total CF does not depend on it
     * *register* (bool, default=True): If to register the method   
+    * *coarse_step* (int, default=1): weeks between the first evaluations of the search of the maximum, refined every week around the local maxima (see ``get_maximum_value``).
+      By default every week is evaluated, larger values are faster but can miss narrow peaks
+    * *workers* (int, default=None): if passed the maximum of the different functions are calculated by a pool of this number of processes
 
         """
-        kwargs = {'dynamic': dynamic}
-        if lower is not None:
-            kwargs['lower'] = lower
-        if upper is not None:
-            kwargs['upper'] = upper
+        lower = np.datetime64('today') if lower is None else lower
+        lower = np.datetime64(lower, 's')
+        upper = lower + np.timedelta64(100, 'Y').astype('timedelta64[s]') if upper is None else np.datetime64(upper, 's')
+        kwargs = {'dynamic': dynamic and not self.shift_invariant, 'lower': lower, 'upper': upper, 'coarse_step': coarse_step}
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             worst_case_method = Method(tuple(name))
             if worst_case_method.name not in methods:
                 worst_case_method.register(dynamic_method = self.name)
         data = self.load()
-        data.update(self.create_functions())
+        functions = self.create_functions(data)
+        maxima = self._get_maximum_values(functions.values(), kwargs, workers)
+        data = {key: maxima[functions[key].source] if key in functions else get_maximum_value(value, **kwargs) for key, value in data.items()}
         # for now just characterize all the 'Carbon dioxide, in air' to be sure they are not skipped
         # should think better on how to deal with this
         method=[
-        [('biosphere3', 'cc6a1abb-b123-4ca6-8f16-38209df609be'),abs(get_maximum_value(value, **kwargs))] if key == ('static_forest',"C_biogenic") else 
-        [key, abs(get_maximum_value(value, **kwargs))] for key, value in data.items()
+        [('biosphere3', 'cc6a1abb-b123-4ca6-8f16-38209df609be'),abs(value)] if key == ('static_forest',"C_biogenic") else 
+        [key, abs(value)] for key, value in data.items()
         ]
         #needed for GWP function to avoid registration every time
         if not register:
@@ -70,6 +178,25 @@ Args:
         worst_case_method.process() #GIU: guess not needed anymore right?
         return worst_case_method
 
+    def _get_maximum_values(self, functions, kwargs, workers=None):
+        """Return a dictionary {function string: maximum value} of `functions`, calculating only the ones not in the cache"""
+        cache_key = lambda function: (
+            hashlib.sha1(function.source.encode('utf-8')).hexdigest(), function.vectorized, str(kwargs['lower']), str(kwargs['upper']), kwargs['dynamic'], kwargs['coarse_step']
+        )
+        missing = {function.source: function for function in functions if cache_key(function) not in _maximum_cache}
+        if workers and len(missing) > 1:
+            pool = multiprocessing.Pool(workers)
+            try:
+                values = pool.map(_maximum_value, [(source, function.vectorized, kwargs) for source, function in missing.items()])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            values = [get_maximum_value(function, **kwargs) for function in missing.values()]
+        for function, value in zip(missing.values(), values):
+            _maximum_cache[cache_key(function)] = value
+        return {function.source: _maximum_cache[cache_key(function)] for function in functions}
+
     def from_static_method(self, name):
         """Turn a static LCIA method into a dynamic one.
 
@@ -85,11 +212,40 @@ Args:
         self.register(**metadata)
         self.write(cfs)
 
+    def create_kernels(self, data=None):
+        """Evaluate the CF functions once and turn them into numerical kernels. Valid only for shift invariant methods.
+        Returns a dictionary with flows as keys and a tuple of arrays (offsets from the emission in seconds, values) as values."""
+        reference = np.datetime64(KERNEL_REFERENCE, 's')
+        kernels = {}
+        for key, function in self.create_functions(data).items():
+            if function.vectorized:
+                offsets, values = function.evaluate([reference])
+                kernels[key] = (offsets, values[0].copy())
+                continue
+            items = function(KERNEL_REFERENCE)
+            offsets = np.array([item[0] for item in items], dtype='datetime64[s]') - reference
+            kernels[key] = (offsets.astype(np.int64), np.array([item[1] for item in items], dtype=np.float64))
+        return kernels
+
+    def write(self, data, *args, **kwargs):
+        """Write the method data and remove its functions from the cache of `create_functions`"""
+        for key in [key for key in _functions_cache if key[0] == self.name]:
+            del _functions_cache[key]
+        return super(DynamicIAMethod, self).write(data, *args, **kwargs)
+
     def create_functions(self, data=None):
-        """Take method data that defines functions in strings, and turn them into actual Python code. Returns a dictionary with flows as keys and functions as values."""
+        """Take method data that defines functions in strings, and turn them into actual Python code. Returns a dictionary with flows as keys and functions as values.
+        Functions are cached by method name and data, and the compiled code by function string (see also `BYTECODE_CACHE`)"""
         if data is None:
             data = self.load()
-        prefix = "created_function_{}_".format(random_string())
+        key = (self.name, self.vectorized, hashlib.sha1(repr(sorted(
+            (repr(flow), value) for flow, value in data.items() if isinstance(value, str)
+        )).encode('utf-8')).hexdigest())
+        if key not in _functions_cache:
+            _functions_cache[key] = self._create_functions(data)
+        return dict(_functions_cache[key])
+
+    def _create_functions(self, data):
         functions = {}
         for key, value in data.items():
             if isinstance(value, str):
@@ -100,5 +256,5 @@ Args:
                         DeprecationWarning
                     )
                     value = value % "created_function"
-                functions[key] = FunctionWrapper(value)
+                functions[key] = ArrayFunctionWrapper(value) if self.vectorized else FunctionWrapper(value)
         return functions
@@ -2,23 +2,39 @@
 from __future__ import print_function, unicode_literals
 from eight import *
 
-from .temporal_distribution import TemporalDistribution
-from .timeline import Timeline
+from .temporal_distribution import TemporalDistribution, resolution_to_seconds
+from .timeline import Timeline, save_timeline
+from .exchange_index import ExchangeIndex
+from .cache import LRUCache, ResultCache
+from .utils import strongly_connected_components
 from .dyn_methods.forest import get_static_forest_keys
 from bw2calc import LCA
-from bw2data import Database, get_activity, databases
+from bw2data import Database, Method, get_activity, databases
 from bw2data.logs import get_logger
+from bw2speedups import consolidate
 from heapq import heappush, heappop
+from scipy import sparse
+from scipy.sparse.linalg import spsolve, splu
 import numpy as np
 import pprint
 import warnings
 import collections
-import gzip
+import itertools
+import hashlib
 import datetime
 import os
-import pickle
 import datetime
 
+#number of static datasets solved together in `DynamicLCA._precompute_static_inventories`
+STATIC_BATCH_SIZE = 128
+#maximum number of terms of the series of convolutions of a loop and relative size of the last term to consider it converged
+MAX_LOOP_TERMS = 100
+LOOP_TOLERANCE = 1e-6
+#time grid and maximum distance from `t0` of the time expanded technosphere of the `matrix` engine
+MATRIX_RESOLUTION = 'Y'
+MATRIX_HORIZON = np.timedelta64(200, 'Y')
+ENGINES = ('traversal', 'matrix')
+
 
 class FakeLog(object):
     """Like a log object, but does nothing"""
@@ -34,7 +50,8 @@ class DynamicLCA(object):
 
 Args:
     * *demand* (dict): The functional unit. Same format as in LCA class.
-    * *worst_case_method* (tuple): LCIA method. Same format as in LCA class.
+    * *worst_case_method* (tuple or list): LCIA method. Same format as in LCA class. If a list of methods is passed a node is discarded only if it is below the cutoff for all of them,
+      so that the same timeline can be characterized with all their dynamic methods. Scores (e.g. for the heap and `completeness`) are then rescaled to the first method
     * *cutoff* (float, default=0.005): Cutoff criteria to stop LCA calculations. Relative score of total, i.e. 0.005 will cutoff if a dataset has a score less than 0.5 percent of the total.
     * *max_calc_number* (int, default=10000): Maximum number of LCA calculations to perform.
     * *loop_cutoff* (int, default=10): Maximum number of times loops encountered will be traversed.
@@ -45,10 +62,30 @@ Args:
     * *grouping_field* (string, default='tempo_group': The bw2 field to look for when grouping impacts upstream. When ``group`==True and a process has `grouping_field==whatever` the impacts are grouped upstream with name ``whatever` untill another  process with `grouping_field==another name` is found. If `grouping_field==True` it simply uses the name of the process
     * *log* (int, default=False): If True to make log file
     * *lca_object* (LCA object,default=None): do dynamic LCA for the object passed (must have "characterized_inventory" i.e. LCA_object.lcia() has been called)
+    * *precompute_scores* (Boolean, default=False): If True calculate once the cumulative score per unit of every activity with a transposed solve (characterization x biosphere x A^-1) and use it for the cutoff of the nodes instead of a new LCA calculation for every edge
+    * *exchange_index* (Boolean or ExchangeIndex, default=False): If True load all the activities and exchanges of the non static databases in an ``ExchangeIndex`` at every ``calculate()`` and read the graph from it instead of querying the database for every node. An existing ``ExchangeIndex`` can be passed to share it among many ``DynamicLCA``
+    * *static_cache_size* (float, default=128): Maximum memory (in MB) of the cache of the cumulative inventories of static datasets (and datasets where loops are cut). Least recently used inventories are evicted first. Hits and misses are counted in `self.static_cache.hits` and `self.static_cache.misses`
+    * *precompute_static* (Boolean, default=False): If True before the traversal find the static datasets directly used by the dynamic datasets reachable from the demand and calculate all their cumulative inventories with a single multi-column solve of the factorized technosphere
+    * *time_resolution* (str, timedelta64 or int, default=None): If passed the times of the temporal distributions calculated during the traversal are rounded to multiples of it (a numpy datetime unit e.g. 'D', 'M', 'Y', a `timedelta64` or seconds)
+      and values with the same time summed, so that their length does not grow with the depth of the supply chain
+    * *target_error* (float, default=None): If passed stop the traversal when the score not yet added to the timeline (of the nodes still in the heap plus the discarded ones)
+      is lower than this fraction of the total score. Nodes are always traversed from the one with the highest score, and the fraction of the score in the timeline is in `self.completeness`
+    * *loop_series* (Boolean, default=False): If True find the loops (strongly connected components) of the dynamic datasets reachable from the demand and, when one of their datasets is reached, calculate at once the supply of all the datasets of the loop
+      as the series of the convolutions of the TDs of the loop (on the `time_resolution` grid if passed) until converged, instead of traversing the loop `loop_cutoff` times. Loops with `datetime64` TDs or that do not converge are traversed as usual
+    * *memoize* (Boolean, default=False): If True calculate once, for each dynamic dataset, the TDs of the biosphere flows of its upstream supply chain per unit of output (relative to the time of demand), and add them to the timeline
+      with a convolution every time the dataset is reached instead of traversing again its supply chain. A stored profile is reused only if it was calculated with a cutoff at least as strict as the one needed, and datasets reached again
+      while calculating their own profile (loops) use their static inventory. Since this depends on the path followed in a loop, a profile is stored only if it does not use the static inventory of another dataset
+      and is reused only if none of the datasets it expanded is being calculated. Reuse statistics are in `self.profile_stats`.
+      `self.nodes` includes the datasets of the profiles, while `self.edges` and `self.product_amount` only cover the datasets reached directly by the traversal
+    * *engine* (string, default='traversal'): 'traversal' for the graph traversal or 'matrix' to solve a time expanded technosphere (each dynamic dataset x time bin of `time_resolution`, yearly by default) of all the dynamic datasets reachable from the demand
+      with a single sparse solve. 'matrix' does not apply the cutoff and is faster when datasets are reached by many paths, times are rounded to the grid and supply beyond 200 years from `t0` in loops is dropped. Not available with `group`
+    * *cache* (Boolean or ResultCache, default=None): If True (default ``ResultCache`` of the project) or a ``ResultCache`` is passed, ``calculate()`` returns the timeline stored for the same demand, methods, `t0`, options and database modification times,
+      if present, without calculating anything else; otherwise it calculates it and stores it. `t0` must be passed for results to be reused, the default (now) changes every second
     """
-    def __init__(self, demand, worst_case_method, t0=None, max_calc_number=1e4, cutoff=0.001,loop_cutoff=10,group=False,grouping_field="tempo_group", log=False, lca_object=None):
+    def __init__(self, demand, worst_case_method, t0=None, max_calc_number=1e4, cutoff=0.001,loop_cutoff=10,group=False,grouping_field="tempo_group", log=False, lca_object=None, precompute_scores=False, exchange_index=False, static_cache_size=128, precompute_static=False, time_resolution=None, target_error=None, loop_series=False, memoize=False, engine='traversal', cache=None):
         self.demand = demand
-        self.worst_case_method = worst_case_method
+        self.worst_case_methods = list(worst_case_method) if isinstance(worst_case_method, list) else [worst_case_method]
+        self.worst_case_method = self.worst_case_methods[0]
         self.t0=np.datetime64('now', dtype="datetime64[s]") if t0 is None else np.datetime64(t0).astype("datetime64[s]")
         self.max_calc_number = max_calc_number
         self.cutoff_value = cutoff
@@ -57,12 +94,30 @@ Args:
         self.lca_object=lca_object
         self.group=group
         self.grouping_field=grouping_field
+        self.precompute_scores=precompute_scores
+        self.build_exchange_index = exchange_index is True
+        self.static_cache_size = static_cache_size
+        self.precompute_static = precompute_static
+        self.time_resolution = time_resolution
+        self.target_error = target_error
+        self.loop_series = loop_series
+        self.memoize = memoize
+        if engine not in ENGINES:
+            raise ValueError(u"Unknown engine {}, must be one of {}".format(engine, ENGINES))
+        if engine == 'matrix' and group:
+            raise ValueError(u"Grouping is not available with the 'matrix' engine")
+        self.engine = engine
+        self.cache = ResultCache() if cache is True else (cache or None)
+        if self.cache is not None and t0 is None:
+            warnings.warn("`t0` is not passed, the cached results will not be reused by later calculations")
+        self.exchange_index = exchange_index if isinstance(exchange_index, ExchangeIndex) else None
         self.stat_for_keys=get_static_forest_keys() #return forest processes
         self.loops=collections.Counter() #to count loops iterations
 
         #return static db and create set where will be added nodes as traversed
-        all_databases = set.union(*[Database(key[0]).find_graph_dependents() for key in self.demand])
-        self.static_databases = {name for name in all_databases if databases[name].get('static')}
+        self.all_databases = set.union(*[Database(key[0]).find_graph_dependents() for key in self.demand])
+        self.static_databases = {name for name in self.all_databases if databases[name].get('static')}
+        self.dynamic_databases = self.all_databases.difference(self.static_databases)
         self.product_amount=collections.defaultdict(int) #to check supply amount calculated for each product
         self.nodes=set()
         self.edges=set()
@@ -77,13 +132,55 @@ Args:
 
     def calculate(self):
         """Calculate"""
+        if self.cache is None:
+            return self._calculate()
+        self.cache_key = self.cache.key(self._cache_data())
+        timeline = self.cache.get(self.cache_key)
+        if timeline is not None:
+            self.timeline = timeline
+            return timeline
+        self.cache.set(self.cache_key, self._calculate())
+        return self.timeline
+
+    def _cache_data(self):
+        """Return the data that identify the results of the calculation, used as key of the ``ResultCache``"""
+        return (
+            sorted(self.demand.items()),
+            self.worst_case_methods,
+            #the characterization factors change the cutoff and the order of the traversal
+            [hashlib.sha1(repr(Method(method).load()).encode('utf-8')).hexdigest() for method in self.worst_case_methods],
+            str(self.t0),
+            self.cutoff_value,
+            self.max_calc_number,
+            self.loop_cutoff_value,
+            self.group,
+            self.grouping_field,
+            str(self.time_resolution),
+            self.target_error,
+            self.loop_series,
+            self.memoize,
+            self.engine,
+            sorted((name, databases[name].get('modified'), bool(databases[name].get('static'))) for name in self.all_databases),
+        )
+
+    def _calculate(self):
+        """Calculate the timeline"""
         self.timeline = Timeline()
-        self.heap = [] #heap with dynamic exchanges to loop over (impact,edge,datetime, TemporalDistribution)
+        self.heap = [] #heap with dynamic exchanges to loop over (-abs(impact),counter,edge,datetime, TemporalDistribution,tag)
+        self.heap_counter = itertools.count() #break ties in insertion order without comparing edges and TDs
+        self.unexplored_score = 0. #sum of the absolute scores of the nodes in the heap
+        self.discarded_score = 0. #sum of the absolute scores of the nodes discarded by the cutoff
         self.calc_number = 0
+        self.profiles = {} #key -> (unit cutoff, profile, discarded score per unit, datasets visited), see `_get_profile`
+        self.profile_stats = collections.Counter()
+        self._profile_stack = set() #datasets whose profile is being calculated
+        self.static_cache = LRUCache(int(self.static_cache_size * 2 ** 20))
+        if self.build_exchange_index:
+            self.exchange_index = ExchangeIndex(self.dynamic_databases)
         
         #run worst case LCA if lca_object not passed else redo for demand and worst_case method
         if self.lca_object:
-            _redo_lcia(self, self.lca_object, self.demand,self.worst_case_method)
+            self._redo_lcia(self.lca_object, self.demand,self.worst_case_method)
         else:
             self.lca = LCA(self.demand,self.worst_case_method)
             self.lca.lci()
@@ -92,6 +189,14 @@ Args:
         #reverse matrix and calculate cutoff
         self.reverse_activity_dict, self.reverse_prod_dict, self.reverse_bio_dict = self.lca.reverse_dict()        
         self.cutoff = abs(self.lca.score) * self.cutoff_value
+        self.total_score = self.lca.score #`self.lca` is reused during the traversal
+        self.characterization_matrices, self.method_weights = self._get_characterization_matrices()
+        self.unit_scores = self._calculate_unit_scores() if self.precompute_scores else None
+        self.static_columns = {}
+        if self.precompute_static:
+            self._precompute_static_inventories()
+        self.loop_components = self._find_loop_components() if self.loop_series else {}
+        self.loop_component_data = {} #component -> (edges, scale values, has datetime64 TDs, responses by dataset of entry), see `_get_loop_component_data`
                 
         #logs
         self.log.info("Starting dynamic LCA")
@@ -104,37 +209,149 @@ Args:
         self.log.info("Cutoff score: %.4g." % self.cutoff)
 
 
+        if self.engine == 'matrix':
+            self._calculate_time_expanded() if self.lca.score!=0 else self.timeline.add(self.t0.astype(datetime.datetime) , None, None,0)
+            return self.timeline
+
         # Initialize heap
         #MAYBE NOT NECESSARY ANYMORE
-        heappush(
-            self.heap,
-            (
-                None,
-                ("Functional unit","Functional unit",), 
-                self.t0,
-                TemporalDistribution(
-                    np.array([0,],dtype='timedelta64[s]'), # need int
-                    np.array((1.,)).astype(float)                     
-                ),
-                'Functional unit' #with tag
-            )
+        self._push(
+            self.lca.score,
+            ("Functional unit","Functional unit",), 
+            self.t0,
+            TemporalDistribution(
+                np.array([0,],dtype='timedelta64[s]'), # need int
+                np.array((1.,)).astype(float),
+                resolution=self.time_resolution #propagated to all the TDs convoluted with it
+            ),
+            'Functional unit' #with tag
         ) if self.lca.score!=0 else self.timeline.add(self.t0.astype(datetime.datetime) , None, None,0) #deal with demand with no impact (doing so does not return error in LCIA)
 
         while self.heap:
             if self.calc_number >= self.max_calc_number:
                 warnings.warn("Stopping traversal due to calculation count.")
                 break
+            if self.target_error is not None and self.relative_error <= self.target_error:
+                self.log.info("Stopping traversal due to target error")
+                break
             self._iterate()
         
+        self.log.info("Completeness: %.4g (unexplored score: %.4g, discarded score: %.4g)" % (self.completeness, self.unexplored_score, self.discarded_score))
+        self.log.info("Static inventories cache hits: %i, misses: %i" % (self.static_cache.hits, self.static_cache.misses))
         self.log.info("NODES: " + pprint.pformat(self.nodes))
         self.log.info("EDGES: " + pprint.pformat(self.edges))    
         
         return self.timeline
 
+    @property
+    def relative_error(self):
+        """Upper bound of the fraction of the total score not added to the timeline (score in the heap plus discarded score over the absolute LCA score)"""
+        if not self.total_score:
+            return 0.
+        return (self.unexplored_score + self.discarded_score) / abs(self.total_score)
+
+    @property
+    def completeness(self):
+        """Lower bound of the fraction of the total score added to the timeline"""
+        return min(max(1. - self.relative_error, 0.), 1.)
+
     ##############
     #INTERNAL USE#
     ##############
 
+    def _calculate_time_expanded(self):
+        """Calculate the supply of the datasets reachable from the demand over time with a time expanded technosphere and add their biosphere flows to the timeline.
+        The supply `s` of dataset `i` in bin `k` is `s[i, k] = demand[i, k] + sum_j sum_tau TD_ji[tau] / scale_j * s[j, k - tau]` where `TD_ji` are the TDs of the
+        exchanges of `j` from `i` rounded to the grid (datetime64 TDs go to fixed bins for every bin of `j`). Static datasets are included but their exchanges are not, as in the traversal"""
+        step = resolution_to_seconds(self.time_resolution if self.time_resolution is not None else MATRIX_RESOLUTION)
+        horizon = MATRIX_HORIZON.astype('timedelta64[s]').astype(np.int64) // step
+
+        #dynamic graph with TDs as bins and values per unit of output
+        graph, scales = {}, {}
+        queue = list(self.demand)
+        while queue:
+            key = queue.pop()
+            if key in graph:
+                continue
+            graph[key] = []
+            if key[0] in self.static_databases or self._get_activity(key).get('type', 'process') != "process":
+                continue
+            scales[key] = self._get_scale_value(key)
+            for input_key, edge_td in self._get_dynamic_edges(key).items():
+                edge_td = edge_td / scales[key]
+                is_datetime = 'datetime64' in str(edge_td.times.dtype)
+                if is_datetime:
+                    edge_td = edge_td.datetime_to_timedelta(self.t0)
+                bins, values = consolidate(np.round(edge_td.times.view('int64') / step).astype(np.int64), edge_td.values)
+                graph[key].append((input_key, bins, values, is_datetime))
+                queue.append(input_key)
+        keys = sorted(graph)
+        index = {key: i for i, key in enumerate(keys)}
+
+        #bounds of the bins reached by each dataset (relaxation of the longest and shortest paths) until nothing changes.
+        #After len(keys) passes bounds change only because of loops that move in time, that reach the horizon: they are moved there directly
+        lower, upper = {key: 0 for key in self.demand}, {key: 0 for key in self.demand}
+        passes, changed = 0, True
+        while changed:
+            passes, changed = passes + 1, False
+            for key in keys:
+                if key not in lower:
+                    continue
+                for input_key, bins, values, is_datetime in graph[key]:
+                    low, high = (bins.min(), bins.max()) if is_datetime else (lower[key] + bins.min(), upper[key] + bins.max())
+                    low, high = max(low, -horizon), min(high, horizon)
+                    if input_key not in lower:
+                        lower[input_key], upper[input_key] = low, high
+                        changed = True
+                        continue
+                    if low < lower[input_key]:
+                        lower[input_key] = -horizon if passes > len(keys) else low
+                        changed = True
+                    if high > upper[input_key]:
+                        upper[input_key] = horizon if passes > len(keys) else high
+                        changed = True
+        start, n_bins = min(lower.values()), max(upper.values()) - min(lower.values()) + 1
+
+        #time expanded technosphere (rows: input x bin, columns: output x bin)
+        rows, cols, data = [], [], []
+        bin_range = np.arange(n_bins)
+        for key in keys:
+            for input_key, bins, values, is_datetime in graph[key]:
+                for bin_, value in zip(bins, values):
+                    if is_datetime:
+                        target = np.full(n_bins, bin_ - start)
+                    else:
+                        target = bin_range + bin_
+                    valid = (target >= 0) & (target < n_bins)
+                    rows.append(index[input_key] * n_bins + target[valid])
+                    cols.append(index[key] * n_bins + bin_range[valid])
+                    data.append(np.full(valid.sum(), value))
+        size = len(keys) * n_bins
+        matrix = sparse.identity(size, format='csc')
+        if rows:
+            matrix = matrix - sparse.csc_matrix((np.hstack(data), (np.hstack(rows), np.hstack(cols))), shape=(size, size))
+        demand = np.zeros(size)
+        for key, amount in self.demand.items():
+            demand[index[key] * n_bins - start] += amount
+        supply = np.atleast_1d(spsolve(matrix, demand))
+        self.calc_number += 1
+
+        for key in keys:
+            key_supply = supply[index[key] * n_bins:(index[key] + 1) * n_bins]
+            bins = np.flatnonzero(key_supply)
+            if not bins.shape[0]:
+                continue
+            td = TemporalDistribution(((bins + start) * step).astype('timedelta64[s]'), key_supply[bins], resolution=self.time_resolution)
+            self.product_amount[key] += td.total
+            self.nodes.add(key)
+            self.scale_value = scales.get(key, 1)
+            self._add_biosphere_flows(("Functional unit", key), td, key)
+
+    def _push(self, score, edge, dt, td, tag):
+        """Add an edge to the heap, nodes with the highest absolute score are popped first"""
+        heappush(self.heap, (-abs(score), next(self.heap_counter), edge, dt, td, tag))
+        self.unexplored_score += abs(score)
+
     def _iterate(self):
         """Iterate over the datasets starting from the FU"""
         # Ignore the calculated impact
@@ -143,7 +360,8 @@ Args:
         # `td` is a TemporalDistribution instance, which gives
         # how much of the dataset is used over time at
         # this point in the graph traversal
-        _, ed, dt, td,ups_tag = heappop(self.heap)  # Don't care about impact #with tag
+        priority, _, ed, dt, td,ups_tag = heappop(self.heap)  #with tag
+        self.unexplored_score += priority #priority is -abs(score)
 
         #do not remeber what is this, check
         if ed!=("Functional unit","Functional unit",):
@@ -154,13 +372,25 @@ Args:
             self.log.info("._iterate(): %s, %s, %s" % (ed, dt, td))
             
         #get bw2 activity for node
-        node=get_activity(ed[1]) if ed[1] != "Functional unit" else {'FU':False} #trick to deal with FU in LCA with results==0
+        node=self._get_activity(ed[1]) if ed[1] != "Functional unit" else {'FU':False} #trick to deal with FU in LCA with results==0
 
         #tag ds with label if present otherwise inherit upstream tag
         ed_tag=ed[1]
         if self.group==True:
             ed_tag=ups_tag if node.get(self.grouping_field,False) == False else ed[1] #with tags ed[0]
         
+        #expand at once all the datasets of the loop
+        if ed[1] in self.loop_components and node['database'] not in self.static_databases and self._expand_loop_component(ed, dt, td, ed_tag):
+            return
+
+        #add the memoized supply chain of the dataset
+        if self.memoize and ed[1] != "Functional unit" and node['database'] not in self.static_databases:
+            self.nodes.add(ed[1])
+            self.edges.add(ed)
+            self._add_profile(ed, td, ed_tag)
+            self.calc_number += 1
+            return
+
         #add bio flows (both dynamic and static)
         self._add_biosphere_flows(ed, td,ed_tag) #with tag
 
@@ -173,21 +403,22 @@ Args:
                         np.array([0,],dtype='timedelta64[s]'), # need int
                         np.array((value,)).astype(float)
                 )
-                new_td=self._calculate_new_td(dyn_edges[key],td) 
                 # Calculate lca and discard if node impact is lower than cutoff
-                if self._discard_node(
+                # (the total of the new TD is known without convoluting)
+                discard, score = self._discard_node(
                         key,
-                        new_td.total):
+                        self._calculate_new_total(dyn_edges[key],td))
+                if discard:
                     continue
                 
                 #else add to the heap the ds of this exchange with the new TD
-                heappush(self.heap, (
-                    abs(1 / self.lca.score),  
+                self._push(
+                    score,
                     (ed[1],key),
                     dt,
-                    new_td,
+                    self._calculate_new_td(dyn_edges[key],td),
                     ed_tag #with tag
-                ))
+                )
             self.calc_number += 1
             
         #for all the other datasets
@@ -202,62 +433,233 @@ Args:
             self.loops[ed]+=1
             
             #dict with all edges of this node
-            dyn_edges={}
-            #loop dynamic_technosphere edges for node
-            for exc in node.exchanges():
-                #deal with technophsere and substitution exchanges
-                if exc.get("type") in ["technosphere",'substitution']:
-                    if self.log:
-                        self.log.info("._iterate:edge: " + pprint.pformat(exc))
-                    #Have to be careful here, because can have
-                    #multiple exchanges with same input/output
-                    #Sum up multiple edges with same input, if present
-                    #~print(exc.get('name'),exc.get('input'),exc.get('system'))
-                    dyn_edges[exc['input']] = (
-                    self._get_temporal_distribution(exc) +
-                    dyn_edges.get(exc['input'], 0))
-                    
-                #deal with coproducts
-                if exc.get('type')=='production' and exc.get('input')!=ed[1]:
-                    if self.log:
-                        self.log.info("._iterate:edge: " + pprint.pformat(exc))
-                    #Have to be careful here, because can have
-                    #multiple exchanges with same input/output
-                    #Sum up multiple edges with same input, if present
-                    dyn_edges[exc['input']] = (
-                    self._get_temporal_distribution(exc) +
-                    dyn_edges.get(exc['input'], 0))
+            dyn_edges=self._get_dynamic_edges(ed[1])
 
             #GIU: test if it is necessary all this or just loop all of them
             for edge,edge_td in dyn_edges.items():
-                #Recalculate edge TD convoluting its TD with TD of the node consuming it (ds)
-                #return a new_td with timedelta as times
-                new_td=self._calculate_new_td(edge_td,td)
-                
                 # Calculate lca and discard if node impact is lower than cutoff
-                if self._discard_node(
+                # (the total of the new TD is known without convoluting)
+                discard, score = self._discard_node(
                         edge,
-                        new_td.total):
+                        self._calculate_new_total(edge_td,td))
+                if discard:
                     continue
                 
                 #else add to the heap the ds of this exchange with the new TD
-                heappush(self.heap, (
-                    abs(1 / self.lca.score),
+                #Recalculate edge TD convoluting its TD with TD of the node consuming it (ds)
+                #return a new_td with timedelta as times
+                self._push(
+                    score,
                     (ed[1],edge),
                     dt,
-                    new_td,
+                    self._calculate_new_td(edge_td,td),
                     ed_tag  #with tag          
-                ))
+                )
             self.calc_number += 1
 
+    def _get_dynamic_edges(self, key):
+        """Return a dict with the TD of all the technosphere, substitution and coproduct exchanges of the dataset by input"""
+        dyn_edges={}
+        #loop dynamic_technosphere edges for node
+        for exc in self._get_exchanges(key):
+            #deal with technophsere and substitution exchanges
+            if exc.get("type") in ["technosphere",'substitution']:
+                if self.log:
+                    self.log.info("._iterate:edge: " + pprint.pformat(exc))
+                #Have to be careful here, because can have
+                #multiple exchanges with same input/output
+                #Sum up multiple edges with same input, if present
+                #~print(exc.get('name'),exc.get('input'),exc.get('system'))
+                dyn_edges[exc['input']] = (
+                self._get_temporal_distribution(exc) +
+                dyn_edges.get(exc['input'], 0))
+                
+            #deal with coproducts
+            if exc.get('type')=='production' and exc.get('input')!=key:
+                if self.log:
+                    self.log.info("._iterate:edge: " + pprint.pformat(exc))
+                #Have to be careful here, because can have
+                #multiple exchanges with same input/output
+                #Sum up multiple edges with same input, if present
+                dyn_edges[exc['input']] = (
+                self._get_temporal_distribution(exc) +
+                dyn_edges.get(exc['input'], 0))
+        return dyn_edges
+
+    def _expand_loop_component(self, ed, dt, td, tag):
+        """Add the biosphere flows of all the datasets of the loop of `ed[1]` and push to the heap the edges leaving the loop.
+        The supply of the datasets of the loop is the convolution of `td` with the response of the loop to one unit demanded from `ed[1]` (see `_get_loop_response`).
+        Return False, without changing anything, if the loop has `datetime64` TDs or the series does not converge"""
+        component = self.loop_components[ed[1]]
+        edges, scales, has_datetime, responses = self._get_loop_component_data(component)
+        if has_datetime:
+            return False
+        if ed[1] not in responses:
+            responses[ed[1]] = self._get_loop_response(component, ed[1])
+        if responses[ed[1]] is None:
+            return False
+        if self.time_resolution is not None:
+            td = td.snap(self.time_resolution)
+        supply = {key: td * key_td for key, key_td in responses[ed[1]].items()}
+
+        self.product_amount[ed[1]] -= td.total #added again below with the loop contribution
+        for key, key_td in supply.items():
+            self.scale_value = scales[key]
+            key_tag = key
+            if self.group==True:
+                key_tag = tag if self._get_activity(key).get(self.grouping_field,False) == False else key
+            self.product_amount[key] += key_td.total
+            self.nodes.add(key)
+            self._add_biosphere_flows((ed[0], key), key_td, key_tag)
+            for input_key, edge_td in edges[key].items():
+                if input_key in component:
+                    self.edges.add((key, input_key))
+                    continue
+                discard, score = self._discard_node(input_key, self._calculate_new_total(edge_td, key_td))
+                if discard:
+                    continue
+                self._push(
+                    score,
+                    (key, input_key),
+                    dt,
+                    self._calculate_new_td(edge_td, key_td),
+                    key_tag
+                )
+        self.edges.add(ed)
+        self.calc_number += 1
+        return True
+
+    def _get_loop_component_data(self, component):
+        """Return the dynamic edges and the scale value of the datasets of the loop `component`, if any of the edges inside it has `datetime64` TDs
+        and the dict of the responses of the loop by dataset of entry (filled by `_expand_loop_component`), calculated at the first call"""
+        if component not in self.loop_component_data:
+            edges = {key: self._get_dynamic_edges(key) for key in component}
+            scales = {key: self._get_scale_value(key) for key in component}
+            has_datetime = any('datetime64' in str(edge_td.times.dtype) for key in component for input_key, edge_td in edges[key].items() if input_key in component)
+            self.loop_component_data[component] = (edges, scales, has_datetime, {})
+        return self.loop_component_data[component]
+
+    def _get_loop_response(self, component, entry):
+        """Return the supply of the datasets of the loop `component` for one unit demanded from `entry` at time zero (a dict {dataset: TD}),
+        i.e. the converged series of the convolutions with the TDs of the edges of the loop: supply = demand + supply * (loop TDs / scale). Return None if the series does not converge"""
+        edges, scales = self.loop_component_data[component][:2]
+        term = {entry: TemporalDistribution(np.array([0], dtype='timedelta64[s]'), np.array([1.]), resolution=self.time_resolution)}
+        supply = dict(term)
+        for _ in range(MAX_LOOP_TERMS):
+            next_term = {}
+            for key, key_td in term.items():
+                for input_key, edge_td in edges[key].items():
+                    if input_key in component:
+                        input_td = (key_td * edge_td) / scales[key]
+                        next_term[input_key] = next_term[input_key] + input_td if input_key in next_term else input_td
+            term = next_term
+            for key, key_td in term.items():
+                supply[key] = supply[key] + key_td if key in supply else key_td
+            if sum(np.abs(key_td.values).sum() for key_td in term.values()) <= LOOP_TOLERANCE:
+                return supply
+        warnings.warn("Series of loop of {} not converged, traversing it".format(entry))
+        return None
+
+    def _add_profile(self, ed, td, tag):
+        """Add to the timeline the profile of `ed[1]` convoluted with `td`, with the cutoff of the traversal for the amount of `td`"""
+        amount = np.abs(td.values).sum()
+        profile, discarded, visited = self._get_profile(ed[1], self.cutoff / amount if amount else np.inf)
+        self.discarded_score += discarded * amount
+        self.nodes.update(key for key in visited if key[0] not in self.static_databases)
+        for (flow, flow_tag, relative), profile_td in profile.items():
+            new_td = td * profile_td if relative else profile_td * td.total
+            self._add_to_timeline(TemporalDistribution(new_td.times + self.t0, new_td.values), flow, tag if flow_tag is None else flow_tag)
+
+    def _get_profile(self, key, unit_cutoff):
+        """Return the profile of one unit of output of the dataset, the absolute score per unit discarded to calculate it and the set of dynamic datasets visited to calculate it.
+        The profile is a dict {(flow, tag, relative): TD} with timedelta TDs relative to the time of demand of the dataset if `relative`, otherwise relative to `t0`.
+        Tag is None for flows of datasets that inherit the tag of the dataset. Upstream datasets with absolute score per unit lower than `unit_cutoff` are discarded.
+        Datasets in `self._profile_stack` (being calculated, i.e. reached again in a loop) use their static profile, thus a profile is the same wherever it is calculated only if none of the datasets it visited is in the stack:
+        it is stored only in this case and reused only if this is still true"""
+        cached = self.profiles.get(key)
+        if cached is not None and cached[0] <= unit_cutoff and not (cached[3] & self._profile_stack):
+            self.profile_stats['hits'] += 1
+            return cached[1], cached[2], cached[3]
+        self.profile_stats['misses'] += 1
+
+        profile, discarded, visited = {}, 0., {key}
+        data = self._get_activity(key)
+        if data.get('type', 'process') != "process":
+            pass
+        elif data['database'] in self.static_databases:
+            profile = self._get_static_profile(key)
+        else:
+            self._profile_stack.add(key)
+            scale = self._get_scale_value(key)
+            for exc in self._get_exchanges(key, 'biosphere'):
+                bio_td = self._get_temporal_distribution(exc) / scale
+                #deal with forest biogenic C in dynamic db
+                flow = ('static_forest','C_biogenic') if exc['input']==('biosphere3', 'cc6a1abb-b123-4ca6-8f16-38209df609be') and key in self.stat_for_keys else exc['input']
+                if 'datetime64' in str(bio_td.times.dtype):
+                    self._add_to_profile(profile, (flow, None, False), bio_td.datetime_to_timedelta(self.t0))
+                else:
+                    self._add_to_profile(profile, (flow, None, True), bio_td)
+
+            for input_key, edge_td in self._get_dynamic_edges(key).items():
+                amount = edge_td.total / scale
+                score = self._get_score(input_key, amount)
+                if not amount or abs(score) < unit_cutoff:
+                    discarded += abs(score)
+                    continue
+                if input_key in self._profile_stack:
+                    self.profile_stats['loops'] += 1
+                    visited.add(input_key)
+                    input_profile = self._get_static_profile(input_key)
+                else:
+                    input_profile, input_discarded, input_visited = self._get_profile(input_key, unit_cutoff / abs(amount))
+                    discarded += input_discarded * abs(amount)
+                    visited.update(input_visited)
+
+                #flows of upstream datasets without tag get the one of the input
+                input_tag = None
+                if not self.group or self._get_activity(input_key).get(self.grouping_field,False) != False:
+                    input_tag = input_key
+                edge_td = edge_td / scale
+                is_datetime = 'datetime64' in str(edge_td.times.dtype)
+                if is_datetime:
+                    edge_td = edge_td.datetime_to_timedelta(self.t0)
+                for (flow, tag, relative), input_td in input_profile.items():
+                    self._add_to_profile(
+                        profile,
+                        (flow, input_tag if tag is None else tag, relative and not is_datetime),
+                        edge_td * input_td if relative else input_td * amount
+                    )
+            self._profile_stack.discard(key)
+
+        visited = frozenset(visited)
+        if not (visited & self._profile_stack):
+            self.profiles[key] = (unit_cutoff, profile, discarded, visited)
+        return profile, discarded, visited
+
+    def _get_static_profile(self, key):
+        """Return the profile (see `_get_profile`) of the cumulative inventory of one unit of the dataset"""
+        flows, amounts, bio_c = self._get_static_inventory(key)
+        profile = {}
+        for index, amount in zip(flows, amounts):
+            profile[(self.reverse_bio_dict[index], None, True)] = TemporalDistribution(np.array([0,], dtype='timedelta64[s]'), np.array([amount,]))
+        if bio_c is not None:
+            profile[(('static_forest','C_biogenic'), None, True)] = TemporalDistribution(np.array([0,], dtype='timedelta64[s]'), np.array([bio_c,]))
+        return profile
+
+    def _add_to_profile(self, profile, key, td):
+        """Sum `td` to the TD of `key` in `profile`"""
+        if self.time_resolution is not None:
+            td = td.snap(self.time_resolution)
+        profile[key] = profile[key] + td if key in profile else td
+
     def _add_biosphere_flows(self, edge, tech_td,tag): #with tag
 
-        """add temporally distributed biosphere exchanges for this ds to timeline.raw both if ds is static or dynamic"""
+        """add temporally distributed biosphere exchanges for this ds to timeline both if ds is static or dynamic"""
         
         ds=edge[1] #fix this (for now done just to avoid changing all the ds below)
         if ds == "Functional unit":
             return
-        data = get_activity(ds)
+        data = self._get_activity(ds)
         
         #add biosphere flow for process passed
         #check if new bw2 will need changes cause will differentiate import of products and activity (i.e. process)
@@ -267,76 +669,28 @@ Args:
         #Add cumulated inventory for static database (to make faster calc) and loops (to avoid infinite loops)
         if data['database'] in self.static_databases or self.loops[edge]>=self.loop_cutoff_value or (self.loops[edge]>=1 and tech_td.total>=1): #loop certain amount of time only if exc amoung <=1
                 
-            self.lca.redo_lci({data: 1})
-            
-            # #add product amount to product_amount (to be used when background dataset traversal will be implemented )
-            # for i,am in np.ndenumerate(self.lca.supply_array):
-                # product=self.reverse_prod_dict[i[0]]
-                # if product!=ds:
-                    # self.product_amount[product] += am*tech_td.total
-            
-            # #this only foreground
-            inventory_vector = np.array(self.lca.inventory.sum(axis=1)).ravel()
-            for index, amount in enumerate(inventory_vector):
-                if not amount or amount == 0 : #GIU: we can skip also 0 amounts that sometimes occurs right?
-                    continue
-                flow = self.reverse_bio_dict[index]
-                
-            ###benchmarked this below, takes the same time of the foreground the problem is the high memory usage that slow things down
-            # #this also background
-            # coo=self.lca.inventory.tocoo()
-            # for i,j,amount in zip(coo.row, coo.col, coo.data):
-                # flow = self.reverse_bio_dict[i]
-                # pr = self.reverse_prod_dict[j]
-        
-                
+            flows, amounts, bio_c = self._get_static_inventory(ds)
+            for index, amount in zip(flows, amounts):
                 dt_bio=self._calculate_bio_td_datetime(amount,tech_td)
-                for bio_dt, bio_amount_scaled in dt_bio:
-                    #TODO: best to use a better container for timeline.
-                    #maybe defaultdict with namedtuple as key to group amount when added 
-                    #fastest, see among others here https://gist.github.com/dpifke/2244911 (I also tested)
-                    if bio_amount_scaled !=0:
-                        self.timeline.add(bio_dt, flow, tag,bio_amount_scaled) #only foreground with tag
-                        # self.timeline.add(bio_dt, flow, pr,bio_amount_scaled) #with background
-                
-                #~#test for using TD
-                #~dt_bio_test=self._calculate_bio_td_datetime_test_timeline(amount,tech_td)
-                #~self.test_datetime[flow, ds] = dt_bio_test+self.test_datetime.get((flow, ds),0) 
+                self._add_to_timeline(dt_bio, self.reverse_bio_dict[index], tag) #only foreground with tag
 
-
-            ##deal with co2 biogenic dynamic in installed (static) databases (maybe can avoid this loop and do direclty above) 
-            if ('biosphere3', 'cc6a1abb-b123-4ca6-8f16-38209df609be') in self.lca.biosphere_dict:
-                row_bioc = self.lca.biosphere_dict[('biosphere3', 'cc6a1abb-b123-4ca6-8f16-38209df609be')] 
-                col_cbio = self.lca.biosphere_matrix[row_bioc, :].tocoo() #get coordinates Carbon dioxide, in air
-                
-                ## find inventory values and sum
-                ## in principle `CO2, in air` should have a negative 
-                ## but in ei it is positive so no need to change sign in bio_c
-                bio_c=sum([self.lca.inventory[row_bioc, index] for index in col_cbio.col if self.reverse_activity_dict[index] in self.stat_for_keys])
+            ##deal with co2 biogenic dynamic in installed (static) databases
+            if bio_c is not None:
                 dt_bio_c=self._calculate_bio_td_datetime(bio_c,tech_td)
-                for bio_dt, bio_amount_scaled in dt_bio_c:                   
-                    if bio_amount_scaled !=0:
-                        #~self.timeline.add(bio_dt, ('static_forest','C_biogenic'), ds, bio_amount_scaled)
-                        self.timeline.add(bio_dt, ('static_forest','C_biogenic'), tag, bio_amount_scaled) #with tag
-
-                #~#test for using TD
-                #~dt_bio_c_test=self._calculate_bio_td_datetime_test_timeline(bio_c,tech_td)
-                #~self.test_datetime[('static_forest','C_biogenic'), ds] = dt_bio_c_test+self.test_datetime.get((('static_forest','C_biogenic'), ds),0) 
+                self._add_to_timeline(dt_bio_c, ('static_forest','C_biogenic'), tag) #with tag
 
             return   
     
         #dynamic database
-        #get TD of bio exc, spread, convert to datetime and append to timeline.raw
-        for exc in data.biosphere():
+        #get TD of bio exc, spread, convert to datetime and append to timeline
+        for exc in self._get_exchanges(ds, 'biosphere'):
             bio_td=self._get_temporal_distribution(exc)
             td_bio_new=self._calculate_bio_td_datetime(bio_td,tech_td)
-            for bio_dt, bio_amount_scaled in td_bio_new:
-                if bio_amount_scaled !=0:
-                    #deal with forest biogenic C in dynamic db
-                    if exc['input']==('biosphere3', 'cc6a1abb-b123-4ca6-8f16-38209df609be') and ds in self.stat_for_keys:
-                        self.timeline.add(bio_dt, ('static_forest','C_biogenic'), tag,bio_amount_scaled) # with tag
-                    else:
-                        self.timeline.add(bio_dt, exc['input'], tag,bio_amount_scaled) # with tag
+            #deal with forest biogenic C in dynamic db
+            if exc['input']==('biosphere3', 'cc6a1abb-b123-4ca6-8f16-38209df609be') and ds in self.stat_for_keys:
+                self._add_to_timeline(td_bio_new, ('static_forest','C_biogenic'), tag) # with tag
+            else:
+                self._add_to_timeline(td_bio_new, exc['input'], tag) # with tag
 
             #~#test for using TD
             #~td_bio_new_test=self._calculate_bio_td_datetime_test_timeline(bio_td,tech_td)
@@ -346,15 +700,141 @@ Args:
                 #~self.test_datetime[exc['input'], ds] = td_bio_new_test+self.test_datetime.get((exc['input'], ds),0) 
 
                     
+    def _get_static_inventory(self, ds):
+        """Return the cumulative inventory for one unit of the dataset passed as a tuple of arrays (indices of the nonzero biosphere flows, amounts)
+        and the amount of `Carbon dioxide, in air` sequestered by the static forest processes (None if the flow is not in the biosphere).
+        Results are stored in `self.static_cache` so that activities reached many times are calculated only once"""
+        if ds in self.static_columns:
+            column = self.static_columns[ds]
+            start, end = self.static_inventories.indptr[column:column + 2]
+            return (
+                self.static_inventories.indices[start:end],
+                self.static_inventories.data[start:end],
+                None if self.static_bio_c is None else self.static_bio_c[column]
+            )
+        inventory = self.static_cache.get(ds)
+        if inventory is not None:
+            return inventory
+
+        self.lca.redo_lci({ds: 1})
+        # #this only foreground
+        inventory_vector = np.array(self.lca.inventory.sum(axis=1)).ravel()
+        flows = np.flatnonzero(inventory_vector)
+        amounts = inventory_vector[flows]
+
+        ##deal with co2 biogenic dynamic in installed (static) databases
+        bio_c = None
+        if ('biosphere3', 'cc6a1abb-b123-4ca6-8f16-38209df609be') in self.lca.biosphere_dict:
+            row_bioc = self.lca.biosphere_dict[('biosphere3', 'cc6a1abb-b123-4ca6-8f16-38209df609be')] 
+            col_cbio = self.lca.biosphere_matrix[row_bioc, :].tocoo() #get coordinates Carbon dioxide, in air
+            
+            ## find inventory values and sum
+            ## in principle `CO2, in air` should have a negative 
+            ## but in ei it is positive so no need to change sign in bio_c
+            bio_c=sum([self.lca.inventory[row_bioc, index] for index in col_cbio.col if self.reverse_activity_dict[index] in self.stat_for_keys])
+
+        inventory = (flows, amounts, bio_c)
+        self.static_cache.set(ds, inventory, flows.nbytes + amounts.nbytes)
+        return inventory
+
+    def _find_static_boundary(self):
+        """Return the set of static datasets directly used by the dynamic datasets reachable from the demand.
+        The walk does not enter static databases but ignores the cutoff, thus it visits every dynamic dataset reachable from the demand once (linear in the size of the dynamic foreground)"""
+        boundary, visited = set(), set()
+        queue = list(self.demand)
+        while queue:
+            key = queue.pop()
+            if key in visited:
+                continue
+            visited.add(key)
+            if key[0] in self.static_databases:
+                boundary.add(key)
+                continue
+            queue.extend(self._get_inputs(key))
+        return boundary
+
+    def _find_loop_components(self):
+        """Return a dict with the loop (strongly connected component, as frozenset) of each dynamic dataset reachable from the demand that is part of a loop"""
+        graph = {}
+        queue = list(self.demand)
+        while queue:
+            key = queue.pop()
+            if key in graph or key[0] in self.static_databases:
+                continue
+            graph[key] = self._get_inputs(key)
+            queue.extend(graph[key])
+        components = {}
+        for component in strongly_connected_components(graph):
+            key = next(iter(component))
+            if len(component) > 1 or key in graph.get(key, ()):
+                component = frozenset(component)
+                components.update((key, component) for key in component)
+        return components
+
+    def _get_inputs(self, key):
+        """Return the set of the datasets used by the dataset (technosphere, substitution and coproduct exchanges)"""
+        return {
+            exc['input'] for exc in self._get_exchanges(key)
+            if exc.get("type") in ["technosphere", 'substitution'] or
+               (exc.get('type') == 'production' and exc.get('input') != key)
+        }
+
+    def _precompute_static_inventories(self):
+        """Calculate the cumulative inventories of the static boundary datasets with a multi-column solve of the factorized technosphere.
+        Results are stored in `self.static_inventories`, a CSC matrix (biosphere flows x datasets) where the column of each dataset is in `self.static_columns`"""
+        keys = sorted(self._find_static_boundary())
+        self.static_columns = {key: column for column, key in enumerate(keys)}
+        self.static_bio_c = None
+        if not keys:
+            self.static_inventories = sparse.csc_matrix((len(self.lca.biosphere_dict), 0))
+            return
+
+        #forest biogenic carbon, see `_get_static_inventory`
+        bio_c_row = None
+        if ('biosphere3', 'cc6a1abb-b123-4ca6-8f16-38209df609be') in self.lca.biosphere_dict:
+            row_bioc = self.lca.biosphere_dict[('biosphere3', 'cc6a1abb-b123-4ca6-8f16-38209df609be')]
+            bio_c_row = self.lca.biosphere_matrix[row_bioc, :].toarray().ravel()
+            bio_c_row[[index for index in range(bio_c_row.shape[0]) if self.reverse_activity_dict[index] not in self.stat_for_keys]] = 0
+            self.static_bio_c = np.zeros(len(keys))
+
+        solver = self._get_solver()
+        blocks = []
+        for start in range(0, len(keys), STATIC_BATCH_SIZE):
+            batch = keys[start:start + STATIC_BATCH_SIZE]
+            demand = np.zeros((len(self.lca.product_dict), len(batch)))
+            demand[[self.lca.product_dict[key] for key in batch], np.arange(len(batch))] = 1
+            supply = solver.solve(demand)
+            blocks.append(sparse.csc_matrix(self.lca.biosphere_matrix * supply))
+            if bio_c_row is not None:
+                self.static_bio_c[start:start + len(batch)] = bio_c_row.dot(supply)
+        self.static_inventories = sparse.hstack(blocks, format='csc')
+        self.static_inventories.eliminate_zeros()
+        self.static_inventories.sort_indices()
+
+    def _get_solver(self):
+        """Return the LU factorization of the technosphere matrix (used for the static inventories and the unit scores), stored on the LCA object to be reused by all the ``DynamicLCA`` sharing it (see `lca_object`).
+        It is recalculated only if the technosphere matrix has been rebuilt"""
+        cached = getattr(self.lca, '_temporalis_splu', None)
+        if cached is None or cached[0] is not self.lca.technosphere_matrix:
+            cached = (self.lca.technosphere_matrix, splu(self.lca.technosphere_matrix.tocsc()))
+            self.lca._temporalis_splu = cached
+        return cached[1]
+
+    def _add_to_timeline(self, td, flow, tag):
+        """Add the nonzero values of a TemporalDistribution with datetime64 times to the timeline"""
+        nonzero = td.values != 0
+        if nonzero.any():
+            self.timeline.add_many(td.times[nonzero], flow, tag, td.values[nonzero])
+
     def _calculate_bio_td_datetime(self,bio_flows,td_tech):
         """Recalculate bio, both if datetime or timedelta, and add to timedelta.
-        td_tech is always timedelta64, bio_flows can be datetime64 or float for static db"""
+        td_tech is always timedelta64, bio_flows can be datetime64 or float for static db. Return a TemporalDistribution with datetime64 times"""
         #dynamic db with dt for bio_flows, multiply by node total
         if isinstance(bio_flows,TemporalDistribution) and 'datetime64' in str(bio_flows.times.dtype):
             return ( bio_flows * td_tech.total ) / self.scale_value 
         #both static db and dynamic with timedelta for bio_flows
         bio_td_delta = (td_tech * bio_flows) / self.scale_value 
-        return bio_td_delta.timedelta_to_datetime(self.t0)
+        return TemporalDistribution(bio_td_delta.times + self.t0, bio_td_delta.values)
     #~#test for using TD
     #~def _calculate_bio_td_datetime_test_timeline(self,bio_flows,td_tech):
         #~###a test to check `test_datetime` since timeline multiply only with timedelta
@@ -372,15 +852,31 @@ Args:
         node_td is always timedelta64, edge_td can be datetime"""
         if 'datetime64' in str(edge_td.times.dtype):
             #multiply by node.total and convert to timedelta
-            new_td=(edge_td * node_td.total) / self.scale_value 
-            return new_td.datetime_to_timedelta(self.t0)
+            new_td=((edge_td * node_td.total) / self.scale_value).datetime_to_timedelta(self.t0)
+            return new_td.snap(self.time_resolution) if self.time_resolution is not None else new_td
         #else just convolute 
         return (node_td * edge_td) / self.scale_value 
+
+    def _calculate_new_total(self,edge_td,node_td):
+        """Total of the TD returned by `_calculate_new_td` without building it: the total of a convolution is the product of the totals"""
+        return edge_td.total * node_td.total / self.scale_value
         
     ################
     #Data retrieval#
     ################
 
+    def _get_activity(self, key):
+        """Return the activity data from the ``ExchangeIndex`` if present, otherwise from the database"""
+        if self.exchange_index is not None and key in self.exchange_index:
+            return self.exchange_index.get(key)
+        return get_activity(key)
+
+    def _get_exchanges(self, key, kind=None):
+        """Return the exchanges (optionally only the ones of type `kind`) of the activity from the ``ExchangeIndex`` if present, otherwise from the database"""
+        if self.exchange_index is not None and key in self.exchange_index:
+            return self.exchange_index.exchanges(key, kind)
+        return [exc for exc in get_activity(key).exchanges() if kind is None or exc.get('type') == kind]
+
 
     def _get_temporal_distribution(self, exc):
         """get 'temporal distribution'and change sing in case of production or substitution exchange"""
@@ -405,14 +901,52 @@ Args:
         return td* sign
 
     def _discard_node(self, node, amount):
-        """Calculate lca for {node, amount} passed return True if lca.score lower than cutoff"""
-        self.lca.redo_lcia({node: amount})
-        discard = abs(self.lca.score) < self.cutoff
+        """Calculate lca for {node, amount} passed and return a tuple (True if lca.score lower than cutoff, lca.score)"""
+        score = self._get_score(node, amount)
+        discard = abs(score) < self.cutoff
         if discard:
+            self.discarded_score += abs(score)
             self.log.info(u"Discarding node: %s of %s (score %.4g)" % (
-                          amount, node, self.lca.score)
+                          amount, node, score)
                           )
-        return discard
+        return discard, score
+
+    def _get_score(self, node, amount):
+        """Return the cumulative score of `amount` of `node`. Use the unit scores when precomputed, otherwise redo the LCIA"""
+        if self.unit_scores is not None:
+            return float(self.unit_scores[self.lca.product_dict[node]] * amount)
+        if len(self.characterization_matrices) == 1:
+            self.lca.redo_lcia({node: amount})
+            return self.lca.score
+        self.lca.redo_lci({node: amount})
+        return max(
+            [weight * (matrix * self.lca.inventory).sum() for matrix, weight in zip(self.characterization_matrices, self.method_weights)],
+            key=abs
+        )
+
+    def _get_characterization_matrices(self):
+        """Return the characterization matrices of the worst case methods and the weights to rescale their scores to the first method (|total score of the first| / |total score|)"""
+        if len(self.worst_case_methods) == 1:
+            return [self.lca.characterization_matrix], [1.]
+        matrices, weights = [], []
+        for method in self.worst_case_methods:
+            self.lca.switch_method(method)
+            matrices.append(self.lca.characterization_matrix.copy())
+            total = abs((self.lca.characterization_matrix * self.lca.inventory).sum())
+            weights.append(float(abs(self.total_score) / total) if total else 0.)
+        self.lca.switch_method(self.worst_case_method)
+        return matrices, weights
+
+    def _calculate_unit_scores(self):
+        """Return the cumulative score per unit of each product (indexed as in `product_dict`).
+        The score is linear in the demand (score = c * B * A^-1 * f) thus a single solve of the transposed technosphere gives the score of all the products at once.
+        With many worst case methods return for each product the rescaled score with the highest absolute value"""
+        characterized_biosphere = np.column_stack([
+            weight * np.array((matrix * self.lca.biosphere_matrix).sum(axis=0)).ravel()
+            for matrix, weight in zip(self.characterization_matrices, self.method_weights)
+        ])
+        scores = self._get_solver().solve(characterized_biosphere, trans='T').reshape(characterized_biosphere.shape)
+        return scores[np.arange(scores.shape[0]), np.abs(scores).argmax(axis=1)]
 
     def _get_scale_value(self, ds):
         """Get production amount (diagonal in matrix A) for the dataset (ds) passed.
@@ -452,20 +986,20 @@ Args:
         return self.lca
         
     def save_dLCI(self,folderpath=None):
-        """Save the results of DynamicLCA to a (compressed) ``bw2lci`` file containing dictionary like 
-        ``'timeline':timeline object,
+        """Save the results of DynamicLCA to a ``bw2lci`` file (columnar format, see ``bw2temporalis.timeline.save_timeline``) containing the timeline and as metadata
         'demand':dLCI demand
         'wc_method':dLCI worst_case_method
-        The file is saved to the current working directory by default with the filename=demandkey_worstcase_method. Restoration is done using 'bw2temporalis.timeline.load_LCI'. 
+        The file is saved to the current working directory by default with the filename=hash of demand and worst case method. Restoration is done using 'bw2temporalis.timeline.load_dLCI'. 
+        Return the filepath.
         Args:
-            * *folderpath* (str, default=None): the filepath of the timeline (without file extension)
+            * *folderpath* (str, default=None): the folder of the timeline
         """
         
         assert hasattr(self, "timeline"), "Must do calculate first"
-        #make folder if not existing and give name of demand_worstcase_method to the file 
+        #make folder if not existing and give name of hash of demand_worstcase_method to the file, that is safe for any key
         os.makedirs(folderpath or '.', exist_ok=True) #create folder if not existing yet see  https://stackoverflow.com/a/12517490/4929813     
-        tl_path=os.path.join(folderpath or '.','{}_{}.bw2lci'.format(self.demand, self.worst_case_method))
-        f = gzip.open(tl_path,'wb')
-        pickle.dump({'timeline':self.timeline,'demand':self.demand,'wc_method':self.worst_case_method},f)
-        f.close()
+        name = hashlib.sha1(repr((sorted(self.demand.items()), self.worst_case_method)).encode('utf-8')).hexdigest()
+        tl_path=os.path.join(folderpath or '.','{}.bw2lci'.format(name))
+        save_timeline(tl_path, self.timeline, demand=self.demand, wc_method=self.worst_case_method)
+        return tl_path
 
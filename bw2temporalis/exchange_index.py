@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+from eight import *
+
+from bw2data import Database
+import numpy as np
+
+#exchange types as stored in `ExchangeIndex.types`
+EXCHANGE_TYPES = ['technosphere', 'production', 'substitution', 'biosphere']
+OTHER_TYPE = len(EXCHANGE_TYPES)
+TYPE_CODES = {name: code for code, name in enumerate(EXCHANGE_TYPES)}
+
+
+class ExchangeIndex(object):
+    """In memory snapshot of the activities and exchanges of a set of databases.
+
+    All the exchanges are loaded once with a bulk query per database (so also their `temporal distribution` are unpickled only once)
+    and stored in compact arrays sorted by output activity, similar to a CSR matrix. The same instance can be shared among many ``DynamicLCA``.
+
+Args:
+    * *database_names* (iterable): names of the databases to load (normally the non static databases of a ``DynamicLCA``).
+
+    """
+    def __init__(self, database_names):
+        self.databases = set(database_names)
+        self.keys = []  #code -> key of activities and flows
+        self.codes = {}  #key -> code
+        self.activities = {}  #key -> activity data without exchanges
+        self.tds = []  #temporal distributions referenced by `td_index`
+
+        outputs, inputs, types, amounts, td_index = [], [], [], [], []
+        for name in sorted(self.databases):
+            for key, ds in Database(name).load().items():
+                ds = dict(ds)
+                exchanges = ds.pop('exchanges', [])
+                ds.setdefault('database', key[0])
+                ds.setdefault('code', key[1])
+                self.activities[key] = ds
+                output = self._code(key)
+                for exc in exchanges:
+                    outputs.append(output)
+                    inputs.append(self._code(exc['input']))
+                    types.append(TYPE_CODES.get(exc.get('type'), OTHER_TYPE))
+                    amounts.append(exc['amount'])
+                    if 'temporal distribution' in exc:
+                        td_index.append(len(self.tds))
+                        self.tds.append(exc['temporal distribution'])
+                    else:
+                        td_index.append(-1)
+
+        #sort by output and build pointers (stable to keep order of exchanges)
+        order = np.argsort(np.array(outputs, dtype=np.int32), kind='mergesort')
+        self.inputs = np.array(inputs, dtype=np.int32)[order]
+        self.types = np.array(types, dtype=np.int8)[order]
+        self.amounts = np.array(amounts, dtype=np.float64)[order]
+        self.td_index = np.array(td_index, dtype=np.int32)[order]
+        self.indptr = np.zeros(len(self.keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(np.array(outputs, dtype=np.int32), minlength=len(self.keys)), out=self.indptr[1:])
+
+    def __contains__(self, key):
+        return key in self.activities
+
+    def __len__(self):
+        return len(self.activities)
+
+    def get(self, key, default=None):
+        """Return the data of activity `key` (without exchanges)"""
+        return self.activities.get(key, default)
+
+    def exchanges(self, key, kind=None):
+        """Return the exchanges of activity `key` as a list of dictionaries with the same fields used by bw2data exchanges
+        (`input`, `output`, `type`, `amount` and `temporal distribution` if present). When `kind` is passed return only the exchanges of that type"""
+        code = self.codes[key]
+        start, end = self.indptr[code], self.indptr[code + 1]
+        type_code = TYPE_CODES[kind] if kind is not None else None
+        exchanges = []
+        for i in range(start, end):
+            if type_code is not None and self.types[i] != type_code:
+                continue
+            exc = {
+                'input': self.keys[self.inputs[i]],
+                'output': key,
+                'type': EXCHANGE_TYPES[self.types[i]] if self.types[i] != OTHER_TYPE else None,
+                'amount': float(self.amounts[i]),
+            }
+            if self.td_index[i] >= 0:
+                exc['temporal distribution'] = self.tds[self.td_index[i]]
+            exchanges.append(exc)
+        return exchanges
+
+    def _code(self, key):
+        if key not in self.codes:
+            self.codes[key] = len(self.keys)
+            self.keys.append(key)
+        return self.codes[key]
@@ -1,13 +1,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, unicode_literals, division
 from eight import *
-from bw2data import methods
+from bw2data import methods, projects
+from bw2calc import LCA
 from .dynamic_lca import DynamicLCA
-from .timeline import load_dLCI
+from .timeline import load_dLCI, combine
 from .dynamic_ia_methods import dynamic_methods
+from .cache import LRUCache
 import glob, os
 import tarfile
 import warnings
+import collections
+import multiprocessing
+import time
+import numpy as np
 try:
     from bw2data import calculation_setups
 except ImportError:
@@ -30,10 +36,48 @@ except ImportError:
     #~"""
     #~filename = "dynamicsetups.pickle"
 
+#`MultiDynamicLCA` of each worker process of `MultiDynamicLCA.multi_lca`
+_worker_multi_dlca = None
+
+
+def _init_worker(project, cs_name, IA, by_process, dLCA_kwargs, IA_kwargs, reuse_timelines=False, timelines_size=256):
+    """Initialize a worker process of `MultiDynamicLCA.multi_lca` with its own `MultiDynamicLCA` (and thus its own factorized LCA object)"""
+    global _worker_multi_dlca
+    projects.set_current(project)
+    _worker_multi_dlca = MultiDynamicLCA(cs_name, IA, by_process, dLCA_kwargs, IA_kwargs, reuse_timelines, timelines_size)
+
+
+def _run_job(job):
+    """Calculate a (functional unit index, method) job in a worker process and return its results, timings and the timelines
+    it stored (only with `reuse_timelines`, otherwise timelines stay in the worker)"""
+    before = collections.Counter(_worker_multi_dlca.timings)
+    stored = set(_worker_multi_dlca.timelines)
+    results = _worker_multi_dlca._calculate_results(_worker_multi_dlca.func_units[job[0]], job[1])
+    timings = collections.Counter(_worker_multi_dlca.timings)
+    timings.subtract(before)
+    timelines = {key: _worker_multi_dlca.timelines.get(key) for key in _worker_multi_dlca.timelines if key not in stored}
+    return results, dict(timings), timelines
+
+
+def _run_saved(lci_path):
+    """Characterize a dynamic LCI saved with `DynamicLCA.save_dLCI` in a worker process and return its results and timings"""
+    before = collections.Counter(_worker_multi_dlca.timings)
+    results = _worker_multi_dlca._characterize_saved(lci_path)
+    timings = collections.Counter(_worker_multi_dlca.timings)
+    timings.subtract(before)
+    return results, dict(timings)
+
 
 class MultiDynamicLCA(object):
     """Wrapper class for performing dynamic LCI or LCIA with many functional units and IA methods.
     When performing LCA using dynamic LCIA need to pass ``IA='dynamic'`` and a ``dynamic_calculation_setups`` name as ``cs_name`` while when using static LCIA  need ``IA='static'`` and ``calculation_setups`` name again as ``cs_name``.
+    A single LCA object for all the functional units is built and factorized at the first calculation and reused (switching method and demand) by all the ``DynamicLCA``, unless an `lca_object` is passed in `dLCA_kwargs`.
+    When `t0` is not in `dLCA_kwargs` it is set to the current time once here, so that all the calculations (also the ones of `multi_lca` workers) share the same `t0`.
+    The seconds spent in factorization, traversal and characterization are summed in `self.timings`.
+    With `reuse_timelines` functional units of a single activity are calculated for one unit of it, the timeline is stored in `self.timelines` (by activity key, worst case method and `t0`)
+    and rescaled for other amounts of the same activity. Stored timelines can be combined with `portfolio`.
+    The rescaled timeline is the same of a new calculation only without loops: the traversal of a loop goes on while the amount of the loop is greater or equal than 1 (see `loop_cutoff` in ``DynamicLCA``),
+    thus depends on the amount of the functional unit.
     
     Args:
         * *cs_name* (string): name of the ``dynamic_calculation_setups`` (when ``IA='dynamic'``) or ``calculation_setup`` (when ``IA='static'``).
@@ -41,9 +85,11 @@ class MultiDynamicLCA(object):
         * *by_process* (Boolean,default=False): if True return results of LCIA by single process.
         * *dLCA_kwargs* (dict): optional arguments to pass to the class `DynamicLCA` (passed as {argument_name:value} ).
         * *IA_kwargs* (dict): optional arguments for the methods characterize_dynamic and/or characterize_static (passed as {argument_name:value} ).
+        * *reuse_timelines* (Boolean,default=False): if True store the timelines of one unit of the activities of single activity functional units and rescale them for other amounts (not exact with loops, see above).
+        * *timelines_size* (float,default=256): Maximum memory (in MB) of the timelines stored with `reuse_timelines`. Least recently used timelines are evicted first.
     """
     
-    def __init__(self, cs_name,IA='static',by_process=False,dLCA_kwargs={},IA_kwargs={}):
+    def __init__(self, cs_name,IA='static',by_process=False,dLCA_kwargs={},IA_kwargs={},reuse_timelines=False,timelines_size=256):
         
         assert IA in ['static','dynamic'],"IA must be `static` or `dynamic`" 
          
@@ -82,44 +128,132 @@ class MultiDynamicLCA(object):
         self.cs_name=cs_name
         self.IA=IA
         self.func_units = cs['inv']
-        self.dLCA_kwargs=dLCA_kwargs
+        #pin `t0` so that every calculation and worker uses the same one
+        self.dLCA_kwargs=dict(dLCA_kwargs,t0=np.datetime64('now','s') if dLCA_kwargs.get('t0') is None else dLCA_kwargs['t0'])
         self.IA_kwargs=IA_kwargs
         self.by_process=by_process
+        self.lca=dLCA_kwargs.get('lca_object')
+        self.timings=collections.Counter()
+        self.reuse_timelines=reuse_timelines
+        self.timelines_size=timelines_size
+        self.timelines=LRUCache(int(timelines_size*2**20))
             
+    def _get_lca(self,method):
+        """Return the LCA object shared by all the calculations, building and factorizing it for all the functional units at the first call"""
+        if self.lca is None:
+            start=time.time()
+            self.lca=LCA({key:1 for fu in self.func_units for key in fu},method[0] if isinstance(method,list) else method)
+            self.lca.lci(factorize=True)
+            self.lca.lcia()
+            self.timings['factorization']+=time.time()-start
+        return self.lca
+
+    def _calculate_results(self,fu,method):
+        """Return the results (as in `self.dlca_results`) of the functional unit and worst case method passed.
+        If a list of worst case methods is passed the timeline is calculated once and characterized with all of them"""
+        return self._characterize(self._get_timeline(fu,method),fu,method)
+
+    def _characterize(self,timeline,fu,method):
+        """Return the results (as in `self.dlca_results`) of the `timeline` of the functional unit passed characterized with the worst case method (or list of them) passed
+        (with the static method itself or the dynamic one associated to it)"""
+        results={}
+        start=time.time()
+        for met in (method if isinstance(method,list) else [method]):
+            if self.IA=='static':
+                if self.by_process:
+                    res_proc=timeline.characterize_static_by_process(met,self.IA_kwargs)
+                    results.update({(list(fu.keys())[0],list(fu.values())[0],met,prod):res[0] for (prod, res) in res_proc.items()})
+                else:
+                    yr,imp=timeline.characterize_static(met,**self.IA_kwargs)
+                    results[(list(fu.keys())[0],list(fu.values())[0],met)]=[yr,imp]
+            else:
+                dyn=self.methods[met]
+                if self.by_process:
+                    res_proc=timeline.characterize_dynamic_by_process(dyn,self.IA_kwargs)
+                    results.update({(list(fu.keys())[0],list(fu.values())[0],met,dyn,prod):res[0] for (prod, res) in res_proc.items()})
+                else:
+                    yr,imp=timeline.characterize_dynamic(dyn,**self.IA_kwargs)
+                    results[(list(fu.keys())[0],list(fu.values())[0],met,dyn)]=[yr,imp]
+        self.timings['characterization']+=time.time()-start
+        return results
+
+    def _timeline_key(self,key,method):
+        """Return the key of `self.timelines` for the activity and worst case method (or list of them) passed"""
+        return (key,tuple(method) if isinstance(method,list) else method,str(self.dLCA_kwargs.get('t0')))
+
+    def _store_timeline(self,timeline_key,timeline):
+        """Store `timeline` in `self.timelines` with its size (bytes of its columns)"""
+        self.timelines.set(timeline_key,timeline,len(timeline)*24)
+
+    def _get_timeline(self,fu,method):
+        """Return the timeline of the functional unit and worst case method passed. With `reuse_timelines` rescale the stored one of the same activity if present"""
+        if not self.reuse_timelines or len(fu)!=1:
+            return self._calculate(fu,method).timeline
+        key,amount=list(fu.items())[0]
+        timeline_key=self._timeline_key(key,method)
+        timeline=self.timelines.get(timeline_key)
+        if timeline is None:
+            timeline=self._calculate({key:1},method).timeline
+            self._store_timeline(timeline_key,timeline)
+        return timeline.scaled(amount)
+
+    def portfolio(self,demand,method):
+        """Return the timeline of the linear combination of activities `demand` (in the form {activity key: amount}) using the timelines stored in `self.timelines` for `method`, without any traversal.
+        Raise KeyError if an activity has not been calculated with `method` (as functional unit of a single activity) by `multi_lca` with `reuse_timelines`, or its timeline has been evicted"""
+        keys=[self._timeline_key(key,method) for key in demand]
+        missing=[key for key,timeline_key in zip(demand,keys) if timeline_key not in self.timelines]
+        if missing:
+            raise KeyError("No stored timeline for {} with method {}".format(missing,method))
+        return combine([self.timelines.get(timeline_key) for timeline_key in keys],list(demand.values()))
+
+    def _calculate(self,fu,method):
+        """Return the ``DynamicLCA`` for the functional unit and worst case method passed after calculating it with the shared LCA object"""
+        dlca_kwargs=dict(self.dLCA_kwargs,lca_object=self._get_lca(method))
+        start=time.time()
+        dynlca=DynamicLCA(fu,method,**dlca_kwargs)
+        dynlca.calculate()
+        self.timings['traversal']+=time.time()-start
+        return dynlca
+
         
-    def multi_lca(self,return_dataframe=False):
+    def multi_lca(self,return_dataframe=False,workers=None,single_traversal=False):
         """Method for performing multiple dynamic LCA calculations (both LCI and LCIA) with many functional units and LCIA methods.
         It creates `self.dlca_results`, which is a dictionary with keys=[functional_unit:method] and values = [years,impacts].
         
         If ``to_dataframe=True`` returns the results in the form of a pandas dataframe
         Args:
         * *to_dataframe* (Boolean, default=False): if to return the results in pandas dataframe format
+        * *workers* (int, default=None): if passed the (functional unit, method) calculations are spread over a pool of this number of processes, each one with its own factorized LCA object.
+          Results are merged in the same order of the serial calculation. An `lca_object` in `dLCA_kwargs` is not passed to the workers, and the timelines calculated by the workers are sent back and stored in `self.timelines` only with `reuse_timelines`
+        * *single_traversal* (Boolean, default=False): if True traverse each functional unit only once, with a cutoff conservative for all the worst case methods (see ``DynamicLCA``), and characterize the same timeline with all the methods
 
         """
     
         self.dlca_results = {}
-                
-        #do not do anything fency for now, just loop over fu and ia and run DLCA
-        for fu in self.func_units:
-            if self.IA=='static':
-                for met in self.methods:
-                    dynlca = DynamicLCA(fu,met,**self.dLCA_kwargs).calculate()
-                    if self.by_process:
-                        res_proc=dynlca.characterize_static_by_process(met,self.IA_kwargs)
-                        self.dlca_results.update({(list(fu.keys())[0],list(fu.values())[0],met,prod):res[0] for (prod, res) in res_proc.items()})
-                    else:
-                        yr,imp=dynlca.characterize_static(met,**self.IA_kwargs)
-                        self.dlca_results[(list(fu.keys())[0],list(fu.values())[0],met)]=[yr,imp]
+        wc_methods=self.methods if self.IA=='static' else list(self.methods.keys())
+        if single_traversal:
+            jobs=[(i,list(wc_methods)) for i in range(len(self.func_units))]
+        else:
+            jobs=[(i,met) for i in range(len(self.func_units)) for met in wc_methods]
 
-            else:
-                for wc,dyn in self.methods.items():
-                    dynlca = DynamicLCA(fu,wc,**self.dLCA_kwargs).calculate()
-                    if self.by_process:
-                        res_proc=dynlca.characterize_dynamic_by_process(dyn,self.IA_kwargs)
-                        self.dlca_results.update({(list(fu.keys())[0],list(fu.values())[0],wc,dyn,prod):res[0] for (prod, res) in res_proc.items()})
-                    else:
-                        yr,imp=dynlca.characterize_dynamic(dyn,**self.IA_kwargs)
-                        self.dlca_results[(list(fu.keys())[0],list(fu.values())[0],wc,dyn)]=[yr,imp]
+        if workers:
+            pool=multiprocessing.Pool(
+                workers,
+                initializer=_init_worker,
+                initargs=(projects.current,self.cs_name,self.IA,self.by_process,self.dLCA_kwargs_for_workers,self.IA_kwargs,self.reuse_timelines,self.timelines_size)
+            )
+            try:
+                for results,timings,timelines in pool.map(_run_job,jobs,chunksize=1):
+                    self.dlca_results.update(results)
+                    self.timings.update(timings)
+                    for timeline_key,timeline in timelines.items():
+                        self._store_timeline(timeline_key,timeline)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for i,met in jobs:
+                self.dlca_results.update(self._calculate_results(self.func_units[i],met))
         if return_dataframe:
             return self.to_dataframe()
         
@@ -183,8 +317,7 @@ class MultiDynamicLCA(object):
         #do not do anything fency for now, just loop fu and ia and run DLCA
         for fu in self.func_units:
             for met in wc_methods:
-                dynlca = DynamicLCA(fu,met,**self.dLCA_kwargs)
-                tl=dynlca.calculate()
+                dynlca = self._calculate(fu,met)
                 dynlca.save_dLCI(folder_cs)
         
         #save all to tarfile
@@ -198,15 +331,28 @@ class MultiDynamicLCA(object):
  #~
 
            
-    def multi_lcia_from_saved_LCI(self,folderpath,return_dataframe=False):
+    def _characterize_saved(self,lci_path):
+        """Return the results (as in `self.dlca_results`) of the dynamic LCI saved in `lci_path`"""
+        lci=load_dLCI(lci_path)
+        return self._characterize(lci['timeline'],lci['demand'],lci['wc_method'])
+
+    @property
+    def dLCA_kwargs_for_workers(self):
+        """`dLCA_kwargs` without the `lca_object`, that is not passed to the worker processes"""
+        return {k:v for k,v in self.dLCA_kwargs.items() if k!='lca_object'}
+
+    def multi_lcia_from_saved_LCI(self,folderpath,return_dataframe=False,workers=None,progress=False):
         """Method for performing multiple dynamic LCIA using already performed and saved dynamic LCI as results of ``save_multi_lci``. Usefull when LCIA for the same FU need to be performed many time and want to avoid redoing every time also the LCI.
         
         It creates `self.dlca_results`, which is a dictionary with keys=[functional_unit:method] and values = [years,impacts].
         If ``to_dataframe=True`` returns the results in the form of a pandas dataframe     
+        Files are loaded (memory mapped) and characterized one at a time, and each timeline is released before the next one is loaded, so that memory does not grow with the number of files.
            
         Args:
             * *folderpath* (string): folder where the ``bw2lci`` files are saved. It must have the name in the form of ``calculationssetupsname_IA`` otherwise an error is  returned
             * *to_dataframe* (Boolean, default=False): if to return the results in pandas dataframe format
+            * *workers* (int, default=None): if passed the files are characterized by a pool of this number of processes, each one loading a file at a time and returning only its results
+            * *progress* (Boolean or callable, default=False): if True print the number of files characterized, if a callable call it with the number of files characterized and the total number of files after each file
 
         """   
         
@@ -224,22 +370,30 @@ class MultiDynamicLCA(object):
             warnings.warn("Number of file in the folder is {} while for the calculations setups passed should be (). Might have different results from what is expected.".format(len(files),len(self.func_units)*len(self.methods)))
                 
         self.dlca_results = {}
+        files=sorted(files)
+        if progress is True:
+            progress=lambda done,total:print('\r{}/{} dynamic LCI characterized'.format(done,total),end='\n' if done==total else '')
         
-        for lci_path in files:
-            lci=load_dLCI(lci_path)
-            if self.IA=='static':
-                if self.by_process:
-                    res_proc=lci['timeline'].characterize_static_by_process(lci['wc_method'],self.IA_kwargs)
-                    self.dlca_results.update({(list(lci['demand'].keys())[0],list(lci['demand'].values())[0],lci['wc_method'],prod):res[0] for (prod, res) in res_proc.items()})
-                else:
-                    yr,imp=lci['timeline'].characterize_static(lci['wc_method'],**self.IA_kwargs)
-                    self.dlca_results[(list(lci['demand'].keys())[0],list(lci['demand'].values())[0],lci['wc_method'])]=[yr,imp]
-            else:
-                if self.by_process:
-                    res_proc=lci['timeline'].characterize_dynamic_by_process(self.methods[lci['wc_method']],self.IA_kwargs)
-                    self.dlca_results.update({(list(lci['demand'].keys())[0],list(lci['demand'].values())[0],lci['wc_method'],self.methods[lci['wc_method']],prod):res[0] for (prod, res) in res_proc.items()})
-                else:
-                    yr,imp=lci['timeline'].characterize_dynamic(self.methods[lci['wc_method']],**self.IA_kwargs)
-                    self.dlca_results[(list(lci['demand'].keys())[0],list(lci['demand'].values())[0],lci['wc_method'],self.methods[lci['wc_method']])] = [yr,imp]
+        if workers:
+            pool=multiprocessing.Pool(
+                workers,
+                initializer=_init_worker,
+                initargs=(projects.current,self.cs_name,self.IA,self.by_process,self.dLCA_kwargs_for_workers,self.IA_kwargs)
+            )
+            try:
+                #results are streamed one file at a time, in the order of the serial calculation
+                for done,(results,timings) in enumerate(pool.imap(_run_saved,files),1):
+                    self.dlca_results.update(results)
+                    self.timings.update(timings)
+                    if progress:
+                        progress(done,len(files))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for done,lci_path in enumerate(files,1):
+                self.dlca_results.update(self._characterize_saved(lci_path))
+                if progress:
+                    progress(done,len(files))
         if return_dataframe:
             return self.to_dataframe()
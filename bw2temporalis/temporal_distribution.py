@@ -4,20 +4,53 @@ from eight import *
 
 from bw2speedups import consolidate
 from future.utils import python_2_unicode_compatible
+from scipy.signal import convolve
 import numpy as np
 import datetime
 
+#minimum fraction of the points of a regular grid that must have a value to convolute TDs as dense arrays
+DENSE_FILL_RATIO = 0.25
+
+
+def resolution_to_seconds(resolution):
+    """Convert a resolution given as a numpy datetime unit (e.g. 'D', 'M', 'Y'), a `timedelta64` or a number of seconds to an integer number of seconds"""
+    if isinstance(resolution, str):
+        resolution = np.timedelta64(1, resolution)
+    if isinstance(resolution, np.timedelta64):
+        resolution = resolution.astype('timedelta64[s]').astype(np.int64)
+    resolution = int(resolution)
+    if resolution <= 0:
+        raise ValueError(u"Resolution must be positive")
+    return resolution
+
+
+def _snap(times, step):
+    """Round integer `times` to the nearest multiple of `step`"""
+    return (times + step // 2) // step * step
+
+
+def _coarsest(resolution, other):
+    """Return the coarsest of two resolutions in seconds (either can be None)"""
+    if resolution is None or other is None:
+        return resolution if other is None else other
+    return max(resolution, other)
+
 @python_2_unicode_compatible
 class TemporalDistribution(object):
     """A container for a series of values spread over time.
 Args:
     * *times* (ndarray): 1D array containg temporal info of `values` with type `timedelta64` or `datetime64` .
     * *values* (ndarray): 1D array containg values with type `float` 
+    * *resolution* (str, timedelta64 or int, default=None): If passed times are rounded to multiples of it (a numpy datetime unit e.g. 'D', 'M', 'Y', a `timedelta64` or seconds)
+      and values with the same time summed. The resolution is kept by the TemporalDistribution resulting from operations, so that their length is bounded by horizon/resolution
     
     Times and values must have same lenght and element of `values` must correspond to the element of `times`
     with the same index.
     """
-    def __init__(self, times, values):
+    #resolution in seconds, class attribute for TD pickled before it was introduced
+    resolution = None
+
+    def __init__(self, times, values, resolution=None):
         # #GIU: check if using non numpy datetime and timedelta does not slow down too much        
         try:
             assert isinstance(times, np.ndarray)
@@ -27,42 +60,86 @@ Args:
             assert 'timedelta64' in str(times.dtype) or \
                    'datetime64' in str(times.dtype) or \
                     isinstance(times[0], datetime.datetime),'times must be of type numpy datetime64 or timedelta64'
-            # Type conversion needed for consolidate cython function
-            values = values.astype(np.float64)
+            # Type conversion needed for consolidate cython function (without copy if already float, e.g. memory mapped constants)
+            values = values.astype(np.float64, copy=False)
         except AssertionError:
             raise ValueError(u"Invalid input values")
             
         #use always seconds as resolution (maybe not necessary?)
         if 'datetime64' in str(times.dtype):
-            self.times = times.astype("datetime64[s]")
+            self.times = times.astype("datetime64[s]", copy=False)
         elif 'timedelta64' in str(times.dtype):
-            self.times = times.astype("timedelta64[s]")
+            self.times = times.astype("timedelta64[s]", copy=False)
         else:
             self.times=times #for datetime
         self.values = values
-        
-        
+        if resolution is not None:
+            assert 'timedelta64' in str(self.times.dtype) or 'datetime64' in str(self.times.dtype),"resolution possible only for numpy datetime64 or timedelta64"
+            self.resolution = resolution_to_seconds(resolution)
+            t_view, self.values = consolidate(_snap(self.times.view('int64'), self.resolution), self.values)
+            self.times = t_view.astype(self.times.dtype)
+
+    def _new(self, times, values, resolution=None):
+        """Return a TemporalDistribution with times already rounded to `resolution` (same as `self` if not passed)"""
+        td = TemporalDistribution(times, values)
+        td.resolution = self.resolution if resolution is None else resolution
+        return td
+
+    def snap(self, resolution):
+        """Return a new TemporalDistribution with times rounded to multiples of `resolution` (see `__init__`)"""
+        return TemporalDistribution(self.times, self.values, resolution=resolution)
+
     def __getitem__(self, val):
-        return TemporalDistribution(np.array(self.times[val]), np.array(self.values[val]))
+        return self._new(np.array(self.times[val]), np.array(self.values[val]))
 
     def __mul__(self, other):
         if isinstance(other, TemporalDistribution):            
-            assert 'timedelta64' in str(self.times.dtype) and 'timedelta64' in str(other.times.dtype),"Multiplication between two TemporalDistribution possible only for timedelta"
-            times = (self.times.reshape((-1, 1)) +
-                     other.times.reshape((1, -1))).ravel()
-            values = (self.values.reshape((-1, 1)) *
-                      other.values.reshape((1, -1))).ravel()
-            #use array view in consolidate, see http://stackoverflow.com/a/33528073/4929813
-            #need to reconvert times.view to timedelta64[s]
-            t_view,v=consolidate(times.view('int64'), values) 
-            return TemporalDistribution(t_view.astype('timedelta64[s]'),v)
+            return self.convolve(other)
         else:
             try:
-                return TemporalDistribution(self.times, self.values * float(other))
+                return self._new(self.times, self.values * float(other))
             except:
                 raise ValueError(u"Can't multiply TemporalDistribution and %s" \
                                  % type(other))
 
+    def convolve(self, other, resolution=None):
+        """Convolute two TemporalDistribution with timedelta times (same as `self * other`).
+
+        When the times of both TDs are (mostly) on a regular grid the convolution is done with dense arrays (direct or FFT depending on the size),
+        otherwise with the outer product of times and values. If a `resolution` is passed (a numpy datetime unit e.g. 'D', a `timedelta64` or seconds) times are first
+        rounded to multiples of it, the dense convolution is used unless its grid is longer than the outer product, and the result keeps the resolution.
+        By default the coarsest `resolution` of the two TDs is used.
+        """
+        assert 'timedelta64' in str(self.times.dtype) and 'timedelta64' in str(other.times.dtype),"Multiplication between two TemporalDistribution possible only for timedelta"
+        #use array view, see http://stackoverflow.com/a/33528073/4929813
+        times, other_times = self.times.view('int64'), other.times.view('int64')
+        if resolution is None:
+            resolution = _coarsest(self.resolution, other.resolution)
+        if resolution is not None:
+            step = resolution = resolution_to_seconds(resolution)
+            times, other_times = _snap(times, step), _snap(other_times, step)
+        else:
+            step = np.gcd.reduce(np.hstack((times - times.min(), other_times - other_times.min())))
+        if step:
+            grid, other_grid = (times.max() - times.min()) // step + 1, (other_times.max() - other_times.min()) // step + 1
+        if resolution is not None:
+            #sparse TDs far apart on a fine grid are faster with the outer product
+            dense = grid + other_grid - 1 <= times.shape[0] * other_times.shape[0]
+        else:
+            dense = step and (
+                times.shape[0] > 1 and other_times.shape[0] > 1 and
+                times.shape[0] >= DENSE_FILL_RATIO * grid and
+                other_times.shape[0] >= DENSE_FILL_RATIO * other_grid)
+        if dense:
+            t_view, v = _dense_convolution(times, self.values, other_times, other.values, step)
+        else:
+            t_view, v = consolidate(
+                (times.reshape((-1, 1)) + other_times.reshape((1, -1))).ravel(),
+                (self.values.reshape((-1, 1)) * other.values.reshape((1, -1))).ravel()
+            )
+        #need to reconvert times.view to timedelta64[s]
+        return self._new(t_view.astype('timedelta64[s]'), v, resolution)
+
     def __div__(self, other):
         # Python 2
         try:
@@ -71,7 +148,7 @@ Args:
             raise ValueError(
                 u"Can only divide a TemporalDistribution by a number"
             )
-        return TemporalDistribution(self.times, self.values / other)
+        return self._new(self.times, self.values / other)
 
     def __truediv__(self, other):
         # Python 3
@@ -95,12 +172,15 @@ Args:
             times = np.hstack((self.times, other.times))
             values = np.hstack((self.values, other.values))
             #same as in __mul__
+            resolution = _coarsest(self.resolution, other.resolution)
+            if resolution is not None:
+                return TemporalDistribution(times, values, resolution=resolution)
             t_view,v=consolidate(times.view('int64'), values) 
             return TemporalDistribution(t_view.astype('timedelta64[s]'),v)
 
         else:
             try:
-                return TemporalDistribution(self.times, self.values + float(other))
+                return self._new(self.times, self.values + float(other))
             except:
                 raise ValueError(u"Can't add TemporalDistribution and %s" \
                                  % type(other))        
@@ -122,7 +202,7 @@ Args:
 
     def cumulative(self):
         """Return new temporal distribution with cumulative values"""
-        return TemporalDistribution(self.times, np.cumsum(self.values))
+        return self._new(self.times, np.cumsum(self.values))
         
     def datetime_to_timedelta(self, dt):
         """Convert TD.times of type datetime64 to timedelta64 based on the datetime64 passed
@@ -139,3 +219,16 @@ Args:
         assert 'timedelta64' in str(self.times.dtype),'TemporalDistribution.times must be numpy.datetime64'
         assert isinstance(dt,np.datetime64),'datetime must be numpy.datetime64'
         return  TemporalDistribution((self.times + dt).astype(datetime.datetime) , self.values)
+
+
+def _dense_convolution(times, values, other_times, other_values, step):
+    """Convolute two series with integer `times` that are multiple of `step` (from their minimum) as dense arrays.
+    Return sorted times and values only where at least a couple of points of the two series fall, as in the outer product"""
+    index, other_index = (times - times.min()) // step, (other_times - other_times.min()) // step
+    counts, other_counts = np.bincount(index), np.bincount(other_index)
+    result = convolve(np.bincount(index, weights=values), np.bincount(other_index, weights=other_values))
+    if counts.all() and other_counts.all():
+        support = np.arange(result.shape[0])
+    else:
+        support = np.flatnonzero(convolve((counts > 0).astype(np.float64), (other_counts > 0).astype(np.float64)) > 0.5)
+    return times.min() + other_times.min() + support * step, result[support]
@@ -1,3 +1,6 @@
+from .cache import LRUCacheTestCase, ResultCacheTestCase
 from .dlca import DynamicLCATestCase
 from .ia import DynamicIATestCase
 from .td import TemporalDistributionTestCase
+from .timeline import TimelineTestCase
+from .multi import MultiDynamicLCATestCase
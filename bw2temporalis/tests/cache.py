@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+from eight import *
+
+from ..cache import LRUCache, ResultCache
+from ..timeline import Timeline
+import datetime
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = LRUCache(100)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1, 10)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_eviction_by_size(self):
+        """least recently used values are evicted when the size is exceeded"""
+        cache = LRUCache(100)
+        cache.set("a", 1, 40)
+        cache.set("b", 2, 40)
+        cache.get("a")
+        cache.set("c", 3, 40)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.size, 80)
+
+    def test_value_larger_than_cache(self):
+        cache = LRUCache(10)
+        cache.set("a", 1, 20)
+        self.assertEqual(len(cache), 0)
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    def create_timeline(self, n=1):
+        tl = Timeline()
+        for x in range(n):
+            tl.add(datetime.datetime(2010 + x, 1, 1), "bad", "first", x)
+        return tl
+
+    def setUp(self):
+        self.dirpath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirpath)
+
+    def test_get_set_invalidate(self):
+        cache = ResultCache(self.dirpath)
+        key = cache.key(("a", 1))
+        self.assertEqual(key, cache.key(("a", 1)))
+        self.assertNotEqual(key, cache.key(("a", 2)))
+        self.assertIsNone(cache.get(key))
+        cache.set(key, self.create_timeline(2))
+        self.assertEqual(cache.get(key).raw, self.create_timeline(2).raw)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.invalidate(key)
+        self.assertNotIn(key, cache)
+        cache.set(key, self.create_timeline(2))
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+
+    def test_release_memory_maps(self):
+        """timelines returned by `get` are loaded in memory before their file is deleted or overwritten"""
+        cache = ResultCache(self.dirpath)
+        cache.set("a", self.create_timeline(3))
+        timeline = cache.get("a")
+        self.assertIsInstance(timeline._amounts, np.memmap)
+        cache.invalidate("a")
+        self.assertNotIn("a", cache)
+        self.assertNotIsInstance(timeline._amounts, np.memmap)
+        self.assertEqual(timeline.raw, self.create_timeline(3).raw)
+        cache.set("b", self.create_timeline(3))
+        timeline = cache.get("b")
+        cache.set("b", self.create_timeline(2))
+        self.assertNotIsInstance(timeline._times, np.memmap)
+        self.assertEqual(len(cache.get("b")), 2)
+        self.assertEqual(timeline.raw, self.create_timeline(3).raw)
+
+    def test_eviction_by_size(self):
+        """least recently used results are deleted when the size is exceeded"""
+        cache = ResultCache(self.dirpath)
+        cache.set("a", self.create_timeline(100))
+        cache.max_size = 2 * cache.size
+        cache.set("b", self.create_timeline(100))
+        os.utime(cache._path("a"), (0, 0))
+        cache.get("a")
+        os.utime(cache._path("b"), (1, 1))
+        cache.set("c", self.create_timeline(100))
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
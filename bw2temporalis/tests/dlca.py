@@ -2,12 +2,17 @@
 from __future__ import print_function, unicode_literals
 from eight import *
 
+from ..cache import ResultCache
 from ..dynamic_ia_methods import DynamicIAMethod, dynamic_methods
 from ..dynamic_lca import DynamicLCA
+from ..exchange_index import ExchangeIndex
+from ..temporal_distribution import TemporalDistribution
 from bw2data import Database, Method, databases, methods
 from bw2calc import LCA
 from bw2data.tests import BW2DataTest as BaseTestCase
 import numpy as np
+import tempfile
+import warnings
 
 
 class DynamicLCATestCase(BaseTestCase):
@@ -472,3 +477,792 @@ class DynamicLCATestCase(BaseTestCase):
 
         # self.assertTrue(np.allclose(static_score, 2 / 4. - 5 / 4. * 10. / 20.))
         self.assertTrue(np.allclose(static_score, dynamic_score))
+
+    def test_precompute_scores(self):
+        """test that cutoff with precomputed unit scores gives the same timeline of the one with LCA for each edge"""
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 10,
+                        'input': ('b', 'second'),
+                        "temporal distribution": [(x, 1) for x in range(10)],
+                        'type': 'technosphere'
+                    },
+                    {
+                        'amount': 1e-6,
+                        'input': ('b', 'third'),
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'second'): {
+                'exchanges': [
+                    {
+                        'amount': 2,
+                        'input': ('b', 'bad'),
+                        "temporal distribution": [(x, 0.5) for x in range(4)],
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'third'): {
+                'exchanges': [
+                    {
+                        'amount': 10,
+                        'input': ('b', 'bad'),
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            }
+        }
+        self.create_database("b", data)
+        self.create_methods()
+
+        method, fu = ("foo",), {("b", "first"): 1}
+
+        dlca = DynamicLCA(fu, method, t0="2017-01-01")
+        dlca_unit = DynamicLCA(fu, method, t0="2017-01-01", precompute_scores=True)
+        expected = dlca.calculate().characterize_static(method)
+        self.assertEqual(expected, dlca_unit.calculate().characterize_static(method))
+        self.assertTrue(np.allclose(
+            dlca_unit.unit_scores[dlca_unit.lca.product_dict[("b", "second")]],
+            2
+        ))
+        #third is discarded
+        self.assertNotIn(("b", "third"), dlca_unit.timeline.processes())
+
+        #the factorization is reused by the calculations sharing the LCA object
+        solver = dlca_unit.lca._temporalis_splu[1]
+        shared = DynamicLCA(fu, method, t0="2018-01-01", precompute_scores=True, lca_object=dlca_unit.lca)
+        shared.calculate()
+        self.assertIs(dlca_unit.lca._temporalis_splu[1], solver)
+        self.assertTrue(np.allclose(shared.unit_scores, dlca_unit.unit_scores))
+
+    def test_exchange_index(self):
+        """test that traversal reading the graph from an ExchangeIndex gives the same timeline"""
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 10,
+                        'input': ('b', 'second'),
+                        "temporal distribution": [(x, 1) for x in range(10)],
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'second'): {
+                'exchanges': [
+                    {
+                        'amount': 2,
+                        'input': ('b', 'bad'),
+                        "temporal distribution": [(x, 0.5) for x in range(4)],
+                        'type': 'biosphere'
+                    },
+                    {
+                        'amount': 2,
+                        'input': ('b', 'second'),
+                        'type': 'production'
+                    },
+                ],
+                'type': 'process',
+            }
+        }
+        self.create_database("b", data)
+        self.create_methods()
+
+        method, fu = ("foo",), {("b", "first"): 1}
+
+        index = ExchangeIndex(["b"])
+        self.assertEqual(len(index), 3)
+        self.assertEqual(
+            [exc['input'] for exc in index.exchanges(('b', 'second'), 'biosphere')],
+            [("b", "bad")]
+        )
+        expected = DynamicLCA(fu, method, t0="2017-01-01").calculate().characterize_static(method)
+        self.assertEqual(
+            expected,
+            DynamicLCA(fu, method, t0="2017-01-01", exchange_index=True).calculate().characterize_static(method)
+        )
+        self.assertEqual(
+            expected,
+            DynamicLCA(fu, method, t0="2017-01-01", exchange_index=index).calculate().characterize_static(method)
+        )
+
+    def test_static_inventory_cache(self):
+        """test that the inventory of a static dataset reached many times is calculated only once"""
+        static = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'electricity'): {
+                'exchanges': [
+                    {
+                        'amount': 2,
+                        'input': ('b', 'bad'),
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+        }
+        data = {
+            ('a', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('a', 'second'),
+                        'type': 'technosphere'
+                    },
+                    {
+                        'amount': 1,
+                        'input': ('b', 'electricity'),
+                        "temporal distribution": [(x, 0.5) for x in range(2)],
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('a', 'second'): {
+                'exchanges': [
+                    {
+                        'amount': 3,
+                        'input': ('b', 'electricity'),
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            }
+        }
+        self.create_database("b", static)
+        databases["b"]['static'] = True
+        databases.flush()
+        self.create_database("a", data)
+        self.create_methods()
+
+        method, dmethod, fu = ("foo",), "Dynamic foo", {("a", "first"): 1}
+
+        dlca = DynamicLCA(fu, method)
+        dlca.calculate()
+        self.assertEqual(dlca.static_cache.misses, 1)
+        self.assertEqual(dlca.static_cache.hits, 1)
+        self.assertTrue(np.allclose(
+            sum([x.amount for x in dlca.timeline.raw]),
+            self.get_lca_score(fu, method)
+        ))
+
+    def test_precompute_static(self):
+        """test that static inventories calculated with a single solve give the same timeline"""
+        static = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'electricity'): {
+                'exchanges': [
+                    {
+                        'amount': 2,
+                        'input': ('b', 'bad'),
+                        'type': 'biosphere'
+                    },
+                    {
+                        'amount': 0.5,
+                        'input': ('b', 'transport'),
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'transport'): {
+                'exchanges': [
+                    {
+                        'amount': 4,
+                        'input': ('b', 'bad'),
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+        }
+        data = {
+            ('a', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('a', 'second'),
+                        'type': 'technosphere'
+                    },
+                    {
+                        'amount': 1,
+                        'input': ('b', 'electricity'),
+                        "temporal distribution": [(x, 0.5) for x in range(2)],
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('a', 'second'): {
+                'exchanges': [
+                    {
+                        'amount': 3,
+                        'input': ('b', 'transport'),
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            }
+        }
+        self.create_database("b", static)
+        databases["b"]['static'] = True
+        databases.flush()
+        self.create_database("a", data)
+        self.create_methods()
+
+        method, fu = ("foo",), {("a", "first"): 1}
+
+        dlca = DynamicLCA(fu, method, t0="2017-01-01", precompute_static=True)
+        expected = DynamicLCA(fu, method, t0="2017-01-01").calculate().characterize_static(method)
+        self.assertEqual(expected, dlca.calculate().characterize_static(method))
+        self.assertEqual(set(dlca.static_columns), {('b', 'electricity'), ('b', 'transport')})
+        self.assertEqual(dlca.static_cache.misses, 0)
+
+        solver = dlca.lca._temporalis_splu[1]
+        shared = DynamicLCA(fu, method, t0="2018-01-01", precompute_static=True, lca_object=dlca.lca)
+        shared.calculate()
+        self.assertIs(shared._get_solver(), solver)
+
+    def test_time_resolution(self):
+        """test that rounding TDs to a resolution merges times without changing the total"""
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 10,
+                        'input': ('b', 'second'),
+                        "temporal distribution": TemporalDistribution(
+                            np.arange(0, 100, 10, dtype='timedelta64[D]'), np.ones(10)),
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'second'): {
+                'exchanges': [
+                    {
+                        'amount': 2,
+                        'input': ('b', 'bad'),
+                        "temporal distribution": TemporalDistribution(
+                            np.array([0, 1, 2, 3], dtype='timedelta64[h]'), np.ones(4) * 0.5),
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            }
+        }
+        self.create_database("b", data)
+        self.create_methods()
+
+        method, fu = ("foo",), {("b", "first"): 1}
+
+        expected = DynamicLCA(fu, method, t0="2017-01-01").calculate()
+        timeline = DynamicLCA(fu, method, t0="2017-01-01", time_resolution='D').calculate()
+        self.assertEqual(len(expected.raw), 40)
+        self.assertEqual(len(timeline.raw), 10)
+        self.assertTrue(np.allclose(
+            sum(expected.characterize_static(method)[1]),
+            sum(timeline.characterize_static(method)[1])
+        ))
+
+    def test_target_error(self):
+        """test that nodes are traversed by score and the traversal stops at the target error"""
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('b', 'small'),
+                        'type': 'technosphere'
+                    },
+                    {
+                        'amount': 9,
+                        'input': ('b', 'big'),
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'small'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('b', 'bad'),
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'big'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('b', 'bad'),
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+        }
+        self.create_database("b", data)
+        self.create_methods()
+
+        method, fu = ("foo",), {("b", "first"): 1}
+
+        dlca = DynamicLCA(fu, method, t0="2017-01-01")
+        self.assertTrue(np.allclose(sum(dlca.calculate().characterize_static(method)[1]), 10))
+        self.assertTrue(np.allclose(dlca.completeness, 1))
+
+        dlca = DynamicLCA(fu, method, t0="2017-01-01", target_error=0.2)
+        self.assertTrue(np.allclose(sum(dlca.calculate().characterize_static(method)[1]), 9))
+        self.assertTrue(np.allclose(dlca.completeness, 0.9))
+        self.assertEqual(len(dlca.heap), 1)
+
+    def test_loop_series(self):
+        """test that a loop is calculated once as a series of convolutions"""
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('b', 'second'),
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'second'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('b', 'bad'),
+                        'type': 'biosphere'
+                    },
+                    #loop
+                    {
+                        'amount': 0.5,
+                        'input': ('b', 'first'),
+                        "temporal distribution": TemporalDistribution(
+                            np.array([1], dtype='timedelta64[Y]'), np.array([0.5])),
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+        }
+        self.create_database("b", data)
+        self.create_methods()
+
+        method, fu = ("foo",), {("b", "first"): 1}
+
+        dlca = DynamicLCA(fu, method, t0="2017-01-01", cutoff=1e-9, loop_series=True)
+        times, values = dlca.calculate().characterize_static(method, cumulative=False)
+        self.assertEqual(set(dlca.loop_components), {("b", "first"), ("b", "second")})
+        self.assertTrue(np.allclose(sum(values), self.get_lca_score(fu, method)))
+        self.assertTrue(np.allclose(sum(values), 2))
+        self.assertTrue(np.allclose(values[:3], [1, 0.5, 0.25]))
+        self.assertEqual(dlca.calc_number, 2)
+        self.assertEqual(len(dlca.loop_component_data), 1)
+        #the response of the loop to one unit is calculated once and reused
+        responses = list(dlca.loop_component_data.values())[0][3]
+        self.assertEqual(list(responses), [("b", "first")])
+        self.assertTrue(np.allclose(responses[("b", "first")][("b", "first")].total, 2))
+        #without `time_resolution` times are not rounded
+        t0 = np.datetime64("2017-01-01", 's').astype(np.int64)
+        self.assertEqual(sorted(set(dlca.timeline.times - t0))[:3], [0, 31556952, 2 * 31556952])
+
+        #the matrix engine follows the loop up to the horizon
+        dlca = DynamicLCA(fu, method, t0="2017-01-01", engine='matrix')
+        times, values = dlca.calculate().characterize_static(method, cumulative=False)
+        self.assertTrue(np.allclose(sum(values), self.get_lca_score(fu, method)))
+        self.assertTrue(np.allclose(values[:3], [1, 0.5, 0.25]))
+
+    def test_memoize(self):
+        """test that the profile of a dataset reached from many paths is calculated once and gives the same timeline"""
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('b', 'left'),
+                        'type': 'technosphere'
+                    },
+                    {
+                        'amount': 2,
+                        'input': ('b', 'right'),
+                        "temporal distribution": [(x, 1) for x in range(2)],
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'left'): {
+                'exchanges': [
+                    {
+                        'amount': 3,
+                        'input': ('b', 'common'),
+                        "temporal distribution": [(x, 1) for x in range(3)],
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'right'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('b', 'common'),
+                        'type': 'technosphere'
+                    },
+                    {
+                        'amount': 1,
+                        'input': ('b', 'bad'),
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'common'): {
+                'exchanges': [
+                    {
+                        'amount': 2,
+                        'input': ('b', 'bad'),
+                        "temporal distribution": [(x, 0.5) for x in range(4)],
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+        }
+        self.create_database("b", data)
+        self.create_methods()
+
+        method, fu = ("foo",), {("b", "first"): 1}
+
+        traversal = DynamicLCA(fu, method, t0="2017-01-01")
+        expected = traversal.calculate()
+        dlca = DynamicLCA(fu, method, t0="2017-01-01", memoize=True)
+        timeline = dlca.calculate()
+        self.assertEqual(dlca.nodes, traversal.nodes)
+        self.assertEqual(
+            expected.characterize_static(method, cumulative=False),
+            timeline.characterize_static(method, cumulative=False)
+        )
+        self.assertEqual(
+            set(expected.processes()),
+            set(timeline.processes())
+        )
+        self.assertEqual(dlca.profile_stats['misses'], 4)
+        self.assertEqual(dlca.profile_stats['hits'], 1)
+
+    def test_memoize_loop(self):
+        """test that the profiles stored while calculating a loop are the same calculated starting from their dataset"""
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('b', 'second'),
+                        "temporal distribution": [(x, 0.5) for x in range(2)],
+                        'type': 'technosphere'
+                    },
+                    {
+                        'amount': 1,
+                        'input': ('b', 'third'),
+                        "temporal distribution": [(2, 1)],
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'second'): {
+                'exchanges': [
+                    {
+                        'amount': 0.5,
+                        'input': ('b', 'third'),
+                        "temporal distribution": [(1, 0.5)],
+                        'type': 'technosphere'
+                    },
+                    {
+                        'amount': 1,
+                        'input': ('b', 'bad'),
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'third'): {
+                'exchanges': [
+                    {
+                        'amount': 0.5,
+                        'input': ('b', 'second'),
+                        "temporal distribution": [(1, 0.5)],
+                        'type': 'technosphere'
+                    },
+                    {
+                        'amount': 2,
+                        'input': ('b', 'bad'),
+                        "temporal distribution": [(x, 1) for x in range(2)],
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+        }
+        self.create_database("b", data)
+        self.create_methods()
+
+        method, fu = ("foo",), {("b", "first"): 1}
+        dlca = DynamicLCA(fu, method, t0="2017-01-01", memoize=True)
+        dlca.calculate()
+        self.assertGreater(dlca.profile_stats['loops'], 0)
+        fresh = DynamicLCA(fu, method, t0="2017-01-01", memoize=True)
+        fresh.calculate()
+        for key, (unit_cutoff, profile, discarded, visited) in dlca.profiles.items():
+            fresh.profiles.clear()
+            expected = fresh._get_profile(key, unit_cutoff)[0]
+            self.assertEqual(set(expected), set(profile))
+            for flow in profile:
+                self.assertEqual(list(expected[flow].times), list(profile[flow].times))
+                self.assertTrue(np.allclose(expected[flow].values, profile[flow].values))
+
+    def test_matrix_engine(self):
+        """test that the time expanded technosphere gives the same timeline of the traversal"""
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('b', 'second'),
+                        "temporal distribution": [(x, 0.5) for x in range(2)],
+                        'type': 'technosphere'
+                    },
+                    {
+                        'amount': 2,
+                        'input': ('b', 'third'),
+                        "temporal distribution": [(x, 1) for x in range(-1, 1)],
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'second'): {
+                'exchanges': [
+                    {
+                        'amount': 3,
+                        'input': ('b', 'third'),
+                        "temporal distribution": [(x, 1) for x in range(3)],
+                        'type': 'technosphere'
+                    },
+                    {
+                        'amount': 2,
+                        'input': ('b', 'second'),
+                        'type': 'production'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'third'): {
+                'exchanges': [
+                    {
+                        'amount': 2,
+                        'input': ('b', 'bad'),
+                        "temporal distribution": [(x, 0.5) for x in range(4)],
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+        }
+        self.create_database("b", data)
+        self.create_methods()
+
+        method, fu = ("foo",), {("b", "first"): 1}
+
+        expected = DynamicLCA(fu, method, t0="2017-01-01").calculate().characterize_static(method, cumulative=False)
+        dlca = DynamicLCA(fu, method, t0="2017-01-01", engine='matrix')
+        times, values = dlca.calculate().characterize_static(method, cumulative=False)
+        self.assertTrue(np.allclose(expected[0], times))
+        self.assertTrue(np.allclose(expected[1], values))
+        self.assertEqual(dlca.nodes, {('b', 'first'), ('b', 'second'), ('b', 'third')})
+        with self.assertRaises(ValueError):
+            DynamicLCA(fu, method, group=True, engine='matrix')
+
+    def test_lca_object(self):
+        """test that a factorized LCA object can be reused for different demands and methods"""
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 2,
+                        'input': ('b', 'second'),
+                        "temporal distribution": [(x, 1) for x in range(2)],
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'second'): {
+                'exchanges': [
+                    {
+                        'amount': 3,
+                        'input': ('b', 'bad'),
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+        }
+        self.create_database("b", data)
+        self.create_methods()
+        method = Method(("bar",))
+        method.register()
+        method.write([[("b", "bad"), 2]])
+        method.process()
+
+        lca = LCA({("b", "first"): 1, ("b", "second"): 1}, ("foo",))
+        lca.lci(factorize=True)
+        lca.lcia()
+        for fu, method in [({("b", "first"): 1}, ("foo",)), ({("b", "second"): 2}, ("bar",))]:
+            expected = DynamicLCA(fu, method, t0="2017-01-01").calculate()
+            dlca = DynamicLCA(fu, method, t0="2017-01-01", lca_object=lca)
+            self.assertEqual(
+                expected.characterize_static(method),
+                dlca.calculate().characterize_static(method)
+            )
+            self.assertTrue(dlca.lca is lca)
+
+    def test_many_worst_case_methods(self):
+        """test that with many worst case methods a node is discarded only if below the cutoff for all of them"""
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ("b", "other"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('b', 'bad'),
+                        'type': 'biosphere'
+                    },
+                    {
+                        'amount': 1,
+                        'input': ('b', 'second'),
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'second'): {
+                'exchanges': [
+                    {
+                        'amount': 1,
+                        'input': ('b', 'other'),
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+        }
+        self.create_database("b", data)
+        self.create_methods()
+        method = Method(("baz",))
+        method.register()
+        method.write([[("b", "other"), 1]])
+        method.process()
+
+        fu = {("b", "first"): 1}
+        for precompute_scores in (False, True):
+            dlca = DynamicLCA(fu, ("foo",), precompute_scores=precompute_scores)
+            self.assertEqual(set(dlca.calculate().flows()), {("b", "bad")})
+            dlca = DynamicLCA(fu, [("foo",), ("baz",)], precompute_scores=precompute_scores)
+            self.assertEqual(set(dlca.calculate().flows()), {("b", "bad"), ("b", "other")})
+            self.assertEqual(dlca.worst_case_method, ("foo",))
+
+    def test_result_cache(self):
+        """test that a cached timeline is returned without calculating and that writing a database or a method invalidates it"""
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 2,
+                        'input': ('b', 'bad'),
+                        "temporal distribution": [(x, 1) for x in range(2)],
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+        }
+        self.create_database("b", data)
+        self.create_methods()
+
+        cache = ResultCache(tempfile.mkdtemp())
+        fu, method = {("b", "first"): 1}, ("foo",)
+        expected = DynamicLCA(fu, method, t0="2017-01-01", cache=cache).calculate()
+        dlca = DynamicLCA(fu, method, t0="2017-01-01", cache=cache)
+        timeline = dlca.calculate()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(timeline.raw, expected.raw)
+        self.assertFalse(hasattr(dlca, 'lca'))
+        DynamicLCA(fu, method, t0="2018-01-01", cache=cache).calculate()
+        self.assertEqual(cache.misses, 2)
+        cache.invalidate(dlca.cache_key)
+        DynamicLCA(fu, method, t0="2017-01-01", cache=cache).calculate()
+        self.assertEqual(cache.misses, 3)
+        Method(method).write([[("b", "bad"), 2]])
+        Method(method).process()
+        DynamicLCA(fu, method, t0="2017-01-01", cache=cache).calculate()
+        self.assertEqual(cache.misses, 4)
+        self.create_database("b", data)
+        DynamicLCA(fu, method, t0="2017-01-01", cache=cache).calculate()
+        self.assertEqual(cache.misses, 5)
+        with warnings.catch_warnings(record=True) as wrn:
+            warnings.simplefilter("always")
+            DynamicLCA(fu, method, cache=cache)
+            self.assertTrue(wrn)
@@ -2,13 +2,18 @@
 from __future__ import print_function, unicode_literals
 from eight import *
 
+from .. import dynamic_ia_methods
 from ..dynamic_ia_methods import DynamicIAMethod, dynamic_methods
-from ..utils import get_function_name
+from ..utils import get_function_name, get_maximum_value
 # from bw2data import Database, Method, databases, methods
 # from bw2calc import LCA
 from bw2data.tests import BW2DataTest as BaseTestCase
 import arrow
+import importlib
 import numpy as np
+import os
+import shutil
+import tempfile
 import warnings
 
 
@@ -16,6 +21,11 @@ valid_func = """def f(x):
     return x
 """
 
+peak_func = """def peak(dt):
+    import datetime
+    return -abs((dt - datetime.date(2030, 7, 1)).days)
+"""
+
 deprecated_func = """def %s(x):
     return x
 """
@@ -56,6 +66,86 @@ class DynamicIATestCase(BaseTestCase):
             self.assertEqual(list(functions.keys()), ['foo'])
             self.assertEqual(functions['foo'](42), 42)
 
+    def test_functions_cache(self):
+        method = DynamicIAMethod("a test method")
+        method.write({"foo": valid_func})
+        functions = method.create_functions()
+        self.assertIs(method.create_functions()['foo'].function, functions['foo'].function)
+        method.write({"foo": valid_func.replace("return x", "return 2 * x")})
+        self.assertEqual(method.create_functions()['foo'](42), 84)
+
+    def test_bytecode_cache(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            dynamic_ia_methods.BYTECODE_CACHE = dirpath
+            dynamic_ia_methods._code_cache.clear()
+            method = DynamicIAMethod("a test method")
+            method.write({"foo": valid_func})
+            method.create_functions()
+            self.assertEqual(len(os.listdir(dirpath)), 1)
+            dynamic_ia_methods._code_cache.clear()
+            method.write({"foo": valid_func})
+            self.assertEqual(method.create_functions()['foo'](42), 42)
+        finally:
+            dynamic_ia_methods.BYTECODE_CACHE = None
+            shutil.rmtree(dirpath)
+
+    def test_bytecode_cache_not_writable(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            #a file where the folder of the cache should be
+            dynamic_ia_methods.BYTECODE_CACHE = os.path.join(dirpath, "file")
+            open(dynamic_ia_methods.BYTECODE_CACHE, 'w').close()
+            dynamic_ia_methods._code_cache.clear()
+            method = DynamicIAMethod("a test method")
+            method.write({"foo": valid_func})
+            self.assertEqual(method.create_functions()['foo'](42), 42)
+        finally:
+            dynamic_ia_methods.BYTECODE_CACHE = None
+            shutil.rmtree(dirpath)
+
+    def test_maximum_value(self):
+        method = DynamicIAMethod("a test method")
+        method.register()
+        method.write({"foo": peak_func, "bar": peak_func, "baz": 3})
+        function = method.create_functions()['foo']
+        lower, upper = np.datetime64('2020-01-01T00:00:00'), np.datetime64('2040-01-01T00:00:00')
+        expected = get_maximum_value(function, lower, upper)
+        self.assertEqual(get_maximum_value(function, lower, upper, coarse_step=13), expected)
+        for workers in (None, 2):
+            dynamic_ia_methods._maximum_cache.clear()
+            worst_case = dict(method.to_worst_case_method("wc", lower, upper, register=False, workers=workers))
+            self.assertEqual(worst_case, {"foo": abs(expected), "bar": abs(expected), "baz": 3})
+            self.assertEqual(len(dynamic_ia_methods._maximum_cache), 1)
+
+    def test_lazy_constants(self):
+        from ..dyn_methods import constants
+        name = "co2_agtp_ar5_td"
+        paths = constants._cache_paths(name)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        #importing the module does not calculate the constants
+        importlib.reload(constants)
+        self.assertEqual(constants._constants, {})
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        #the first access calculates and saves it
+        calculated = getattr(constants, name)
+        self.assertEqual(list(constants._constants), [name])
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+        #later it is loaded memory mapped
+        constants._constants.clear()
+        loaded = getattr(constants, name)
+        self.assertIsInstance(loaded.values, np.memmap)
+        self.assertTrue(np.array_equal(loaded.times, calculated.times))
+        self.assertTrue(np.array_equal(loaded.values, calculated.values))
+        #same behaviour for Python versions without module `__getattr__`
+        lazy = constants._LazyModule(constants)
+        self.assertIs(getattr(lazy, name), loaded)
+        self.assertIn("ch4_rf_td", dir(lazy))
+        with self.assertRaises(AttributeError):
+            lazy.not_a_constant
+
     # def create_methods(self):
     #     gw = [
     #         [("b", "bad"), 1],
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+from eight import *
+
+from ..multi_dlca import MultiDynamicLCA
+from bw2data import Database, Method, calculation_setups
+from bw2data.tests import BW2DataTest as BaseTestCase
+import numpy as np
+import os
+import tempfile
+
+
+class MultiDynamicLCATestCase(BaseTestCase):
+    def create_database(self):
+        data = {
+            ("b", "bad"): {
+                'type': 'emission'
+            },
+            ("b", "worse"): {
+                'type': 'emission'
+            },
+            ('b', 'first'): {
+                'exchanges': [
+                    {
+                        'amount': 2,
+                        'input': ('b', 'bad'),
+                        "temporal distribution": [(x, 1) for x in range(2)],
+                        'type': 'biosphere'
+                    },
+                    {
+                        'amount': 4,
+                        'input': ('b', 'second'),
+                        "temporal distribution": [(x, 2) for x in range(-1, 1)],
+                        'type': 'technosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+            ('b', 'second'): {
+                'exchanges': [
+                    {
+                        'amount': 3,
+                        'input': ('b', 'worse'),
+                        "temporal distribution": [(x, 1) for x in range(3)],
+                        'type': 'biosphere'
+                    },
+                ],
+                'type': 'process',
+            },
+        }
+        db = Database("b")
+        db.register()
+        db.write(data)
+        db.process()
+
+        for name, cfs in ((("foo",), [(("b", "bad"), 1), (("b", "worse"), 2)]), (("bar",), [(("b", "worse"), 5)])):
+            method = Method(name)
+            method.register()
+            method.write(cfs)
+            method.process()
+
+        calculation_setups['cs'] = {
+            'inv': [{("b", "first"): 1}, {("b", "second"): 2}, {("b", "first"): 3}],
+            'ia': [("foo",), ("bar",)],
+        }
+
+    def assertResultsEqual(self, results, expected):
+        self.assertEqual(set(results), set(expected))
+        for key, (years, impacts) in expected.items():
+            self.assertTrue(np.allclose(results[key][0], years))
+            self.assertTrue(np.allclose(results[key][1], impacts))
+
+    def test_multi_lcia_from_saved_LCI(self):
+        """test that the saved dynamic LCI characterized serially and by workers give the results of `multi_lca`"""
+        self.create_database()
+        mdlca = MultiDynamicLCA('cs', dLCA_kwargs={'t0': "2017-01-01"})
+        mdlca.multi_lca()
+        folderpath = tempfile.mkdtemp()
+        mdlca.save_multi_lci(folderpath)
+        folderpath = os.path.join(folderpath, 'cs_static')
+        self.assertEqual(len(os.listdir(folderpath)), 6)
+
+        for workers in (None, 2):
+            progress = []
+            saved = MultiDynamicLCA('cs')
+            saved.multi_lcia_from_saved_LCI(folderpath, workers=workers, progress=lambda done, total: progress.append((done, total)))
+            self.assertResultsEqual(saved.dlca_results, mdlca.dlca_results)
+            if workers is None:
+                order = list(saved.dlca_results)
+            self.assertEqual(list(saved.dlca_results), order)
+            self.assertEqual(progress, [(x, 6) for x in range(1, 7)])
+            self.assertIn('characterization', saved.timings)
+
+    def test_multi_lca_workers(self):
+        """test that `multi_lca` with workers gives the results of the serial calculation with the same `t0`"""
+        self.create_database()
+        mdlca = MultiDynamicLCA('cs')
+        self.assertIsNotNone(mdlca.dLCA_kwargs['t0'])
+        mdlca.multi_lca()
+        parallel = MultiDynamicLCA('cs', dLCA_kwargs={'t0': mdlca.dLCA_kwargs['t0']})
+        parallel.multi_lca(workers=2)
+        self.assertResultsEqual(parallel.dlca_results, mdlca.dlca_results)
+        self.assertEqual(len(parallel.dlca_results), 6)
+        self.assertEqual(len(parallel.timelines), 0)
+
+    def test_get_timeline(self):
+        """test that with `reuse_timelines` the timeline of one unit is stored and rescaled, otherwise every functional unit is calculated"""
+        self.create_database()
+        mdlca = MultiDynamicLCA('cs', dLCA_kwargs={'t0': "2017-01-01"})
+        timeline = mdlca._get_timeline({("b", "first"): 3}, ("foo",))
+        self.assertEqual(len(mdlca.timelines), 0)
+
+        reuse = MultiDynamicLCA('cs', dLCA_kwargs={'t0': "2017-01-01"}, reuse_timelines=True)
+        reused = reuse._get_timeline({("b", "first"): 1}, ("foo",))
+        self.assertEqual(len(reuse.timelines), 1)
+        traversal = reuse.timings['traversal']
+        rescaled = reuse._get_timeline({("b", "first"): 3}, ("foo",))
+        self.assertEqual(reuse.timings['traversal'], traversal)
+        self.assertEqual(len(reuse.timelines), 1)
+        self.assertTrue(np.allclose(rescaled.amounts, 3 * reused.amounts))
+        years, impacts = rescaled.characterize_static(("foo",))
+        expected = timeline.characterize_static(("foo",))
+        self.assertEqual(list(years), list(expected[0]))
+        self.assertTrue(np.allclose(impacts, expected[1]))
+
+        reuse._get_timeline({("b", "first"): 1, ("b", "second"): 2}, ("foo",))
+        self.assertEqual(len(reuse.timelines), 1)
+
+    def test_portfolio(self):
+        """test that `portfolio` combines the stored timelines as the calculation of the whole demand"""
+        self.create_database()
+        mdlca = MultiDynamicLCA('cs', dLCA_kwargs={'t0': "2017-01-01"}, reuse_timelines=True)
+        mdlca.multi_lca(workers=2)
+        self.assertEqual(len(mdlca.timelines), 4)
+        demand = {("b", "first"): 2, ("b", "second"): 5}
+        expected = mdlca._calculate(demand, ("foo",)).timeline.characterize_static(("foo",))
+        years, impacts = mdlca.portfolio(demand, ("foo",)).characterize_static(("foo",))
+        self.assertEqual(list(years), list(expected[0]))
+        self.assertTrue(np.allclose(impacts, expected[1]))
+        with self.assertRaises(KeyError):
+            mdlca.portfolio(demand, ("baz",))
+        with self.assertRaises(KeyError):
+            MultiDynamicLCA('cs', dLCA_kwargs={'t0': "2017-01-01"}).portfolio(demand, ("foo",))
+
+    def test_single_traversal(self):
+        """test that traversing each functional unit once for all the methods gives the results of a traversal per method"""
+        self.create_database()
+        mdlca = MultiDynamicLCA('cs', dLCA_kwargs={'t0': "2017-01-01"})
+        mdlca.multi_lca()
+        single = MultiDynamicLCA('cs', dLCA_kwargs={'t0': "2017-01-01"})
+        single.multi_lca(single_traversal=True)
+        self.assertResultsEqual(single.dlca_results, mdlca.dlca_results)
+
+    def test_shared_lca(self):
+        """test that a single LCA object is used for all the functional units and that the time of each step is counted"""
+        self.create_database()
+        mdlca = MultiDynamicLCA('cs', dLCA_kwargs={'t0': "2017-01-01"})
+        lcas = []
+        calculate = mdlca._calculate
+
+        def _calculate(fu, method):
+            dynlca = calculate(fu, method)
+            lcas.append(dynlca.lca)
+            return dynlca
+
+        mdlca._calculate = _calculate
+        mdlca.multi_lca()
+        self.assertEqual(len(lcas), 6)
+        self.assertTrue(all(lca is mdlca.lca for lca in lcas))
+        self.assertEqual(set(mdlca.timings), {'factorization', 'traversal', 'characterization'})
+        self.assertTrue(all(seconds >= 0 for seconds in mdlca.timings.values()))
+
+        passed = MultiDynamicLCA('cs', dLCA_kwargs={'t0': "2017-01-01", 'lca_object': mdlca.lca})
+        passed.multi_lca()
+        self.assertIs(passed.lca, mdlca.lca)
+        self.assertNotIn('factorization', passed.timings)
+        self.assertResultsEqual(passed.dlca_results, mdlca.dlca_results)
@@ -114,6 +114,57 @@ class TemporalDistributionTestCase(unittest.TestCase):
         ))
         
 
+    def test_mul_td_dense(self):
+        times = np.arange(0, 200, dtype='timedelta64[Y]')
+        td = TD(times, np.linspace(1, 2, 200))
+        td2 = TD(times[::2], np.ones(100))
+        multiplied = td.convolve(td2)
+        outer_times = (td.times.reshape((-1, 1)) + td2.times.reshape((1, -1))).ravel()
+        outer_values = (td.values.reshape((-1, 1)) * td2.values.reshape((1, -1))).ravel()
+        self.assertTrue(np.array_equal(np.unique(outer_times), multiplied.times))
+        for t, v in zip(multiplied.times, multiplied.values):
+            self.assertAlmostEqual(v, outer_values[outer_times == t].sum())
+
+    def test_mul_td_resolution(self):
+        td = TD(
+            np.array([0, 10, 370], dtype='timedelta64[D]'),
+            np.array([1., 1., 2.])
+        )
+        td2 = TD(np.array([1], dtype='timedelta64[Y]'), np.array([3.]))
+        multiplied = td.convolve(td2, resolution='Y')
+        self.assertTrue(np.array_equal(
+            np.array([1, 2], dtype='timedelta64[Y]').astype('timedelta64[s]'),
+            multiplied.times
+        ))
+        self.assertTrue(np.allclose(multiplied.values, [6, 6]))
+
+    def test_mul_td_resolution_sparse(self):
+        #a dense grid of 1e9 seconds would not fit in memory, the outer product is used
+        td = TD(np.array([0, 10 ** 9], dtype='timedelta64[s]'), np.array([1., 2.]))
+        td2 = TD(np.array([0, 10 ** 9], dtype='timedelta64[s]'), np.array([3., 4.]))
+        multiplied = td.convolve(td2, resolution=1)
+        self.assertEqual(multiplied.resolution, 1)
+        self.assertTrue(np.array_equal(
+            np.array([0, 10 ** 9, 2 * 10 ** 9], dtype='timedelta64[s]'),
+            multiplied.times
+        ))
+        self.assertTrue(np.allclose(multiplied.values, [3, 10, 8]))
+
+    def test_resolution(self):
+        td = TD(np.array([0, 1, 25, 47], dtype='timedelta64[h]'), np.ones(4), resolution='D')
+        self.assertEqual(td.resolution, 86400)
+        self.assertTrue(np.array_equal(
+            np.array([0, 1, 2], dtype='timedelta64[D]').astype('timedelta64[s]'),
+            td.times
+        ))
+        self.assertTrue(np.allclose(td.values, [2, 1, 1]))
+        td2 = TD(np.array([0, 6, 30], dtype='timedelta64[h]'), np.ones(3))
+        for result in (td * td2, td2 * td, td + td2, td * 2, td / 2):
+            self.assertEqual(result.resolution, 86400)
+            self.assertFalse((result.times.view('int64') % 86400).any())
+        self.assertEqual((td * td2).total, 12)
+        self.assertIsNone((td2 * td2).resolution)
+
     def test_iter(self):
         td = iter(self.create_td())
         self.assertEqual(next(td), (np.timedelta64(0,'Y').astype('timedelta64[s]'), 2))
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+from eight import *
+
+from ..dynamic_ia_methods import DynamicIAMethod
+from ..timeline import Timeline, data_point, load_dLCI, load_timeline, save_timeline
+from bw2data import Database, Method
+from bw2data.tests import BW2DataTest as BaseTestCase
+import numpy as np
+import datetime
+import gzip
+import os
+import pickle
+import shutil
+import tempfile
+
+
+decay_function = """def decay(dt):
+    import collections
+    from datetime import timedelta
+    return_tuple = collections.namedtuple('return_tuple', ['dt', 'amount'])
+    return [return_tuple(dt + timedelta(days=365.25 * x), {} * 0.9 ** x) for x in range(100)]"""
+
+array_decay_function = """def decay(dts):
+    import numpy as np
+    return np.arange(100) * np.timedelta64(31557600, 's'), {} * 0.9 ** np.arange(100)"""
+
+class TimelineTestCase(BaseTestCase):
+    def create_timeline(self):
+        tl = Timeline()
+        tl.add(datetime.datetime(2010, 1, 1), ("b", "bad"), ("b", "first"), 1)
+        tl.add_many(
+            np.array(['2010-01-01', '2011-01-01', '2012-01-01'], dtype='datetime64[s]'),
+            ("b", "worse"), ("b", "second"), np.array([1., 2., 3.])
+        )
+        return tl
+
+    def create_method(self):
+        method = Method(("foo",))
+        method.register()
+        method.write([[("b", "bad"), 2], [("b", "worse"), 10]])
+        method.process()
+
+    def test_raw_compatibility(self):
+        tl = self.create_timeline()
+        self.assertEqual(len(tl), 4)
+        self.assertEqual(tl.raw[0], data_point(datetime.datetime(2010, 1, 1), ("b", "bad"), ("b", "first"), 1.))
+        self.assertEqual(Timeline(tl.raw).raw, tl.raw)
+        self.assertEqual(tl.times.dtype, np.int64)
+
+    def test_flows_and_processes(self):
+        tl = self.create_timeline()
+        self.assertEqual(tl.flows(), {("b", "bad"), ("b", "worse")})
+        self.assertEqual(tl.processes(), {("b", "first"), ("b", "second")})
+        self.assertEqual(len(tl.timeline_for_flow(("b", "worse"))), 3)
+        self.assertEqual(len(tl.timeline_for_activity(("b", "first"))), 1)
+        self.assertEqual(len(tl.timeline_for_flow("missing")), 0)
+        self.assertEqual(tl.total_amount_for_flow(("b", "worse")), 6)
+        self.assertEqual(tl.total_flow_for_activity(("b", "worse"), ("b", "first")), 0)
+
+    def test_scaled_and_add(self):
+        tl = self.create_timeline()
+        scaled = tl.scaled(2)
+        self.assertTrue(np.allclose(scaled.amounts, [2, 2, 4, 6]))
+        self.assertTrue(np.allclose(tl.amounts, [1, 1, 2, 3]))
+        other = Timeline()
+        other.add(datetime.datetime(2013, 1, 1), ("b", "other"), ("b", "second"), 5)
+        added = tl + other
+        self.assertEqual(len(added), 5)
+        self.assertEqual(added.raw[:4], tl.raw)
+        self.assertEqual(added.raw[4], other.raw[0])
+        self.assertEqual(added.processes(), {("b", "first"), ("b", "second")})
+
+    def test_characterize_static(self):
+        self.create_method()
+        tl = self.create_timeline()
+        years, impact = tl.characterize_static(("foo",))
+        self.assertEqual(len(years), 3)
+        self.assertTrue(np.allclose(impact, [12, 32, 62]))
+        years, impact = tl.characterize_static(("foo",), cumulative=False, stepped=True)
+        self.assertEqual(len(years), 6)
+        self.assertTrue(np.allclose(impact, [0, 12, 12, 20, 20, 30]))
+        self.assertTrue(np.allclose(sum([x.amount for x in tl.characterized]), 62))
+
+    def test_pickle(self):
+        tl = self.create_timeline()
+        self.assertEqual(pickle.loads(pickle.dumps(tl)).raw, tl.raw)
+        #timeline pickled before the columnar storage
+        old = Timeline.__new__(Timeline)
+        old.__setstate__({'raw': tl.raw, 'characterized': [], 'dp_groups': []})
+        self.assertEqual(old.raw, tl.raw)
+
+    def test_save_and_load(self):
+        tl = self.create_timeline()
+        dirpath = tempfile.mkdtemp()
+        try:
+            filepath = os.path.join(dirpath, "tl.bw2lci")
+            save_timeline(filepath, tl, demand={("b", "first"): 1}, wc_method=("foo",))
+            for mmap in (True, False):
+                loaded, metadata = load_timeline(filepath, mmap=mmap)
+                self.assertEqual(loaded.raw, tl.raw)
+                self.assertEqual(metadata, {'demand': {("b", "first"): 1}, 'wc_method': ("foo",)})
+            loaded.add(datetime.datetime(2013, 1, 1), ("b", "bad"), ("b", "third"), 4)
+            self.assertEqual(len(loaded), 5)
+            self.assertEqual(load_timeline(filepath)[0].raw, tl.raw)
+            self.assertEqual(load_dLCI(filepath)['wc_method'], ("foo",))
+            #old gzip pickle format
+            with gzip.open(filepath, 'wb') as f:
+                pickle.dump({'timeline': tl, 'demand': {("b", "first"): 1}, 'wc_method': ("foo",)}, f)
+            self.assertEqual(load_dLCI(filepath)['timeline'].raw, tl.raw)
+        finally:
+            shutil.rmtree(dirpath)
+
+    def test_characterize_dynamic_kernels(self):
+        """test that characterization with kernels gives the same results of the one point by point"""
+        method = DynamicIAMethod("Dynamic foo")
+        method.register(shift_invariant=True)
+        method.write({("b", "bad"): decay_function.format(2), ("b", "worse"): decay_function.format(10)})
+        self.assertTrue(method.shift_invariant)
+        tl = self.create_timeline()
+        tl.add(datetime.datetime(2010, 6, 1, 23, 0), ("b", "bad"), ("b", "first"), 5)
+        for kwargs in ({}, {'cumulative': False}, {'stepped': True}):
+            expected = tl.characterize_dynamic("Dynamic foo", use_kernels=False, **kwargs)
+            years, impact = tl.characterize_dynamic("Dynamic foo", **kwargs)
+            self.assertTrue(np.allclose(expected[0], years))
+            self.assertTrue(np.allclose(expected[1], impact))
+
+    def test_characterize_by_process_and_flow(self):
+        """test that the breakdowns by process and flow are the same of characterizing the timeline of each process or flow"""
+        database = Database("b")
+        database.register()
+        database.write({("b", key): {'name': key} for key in ("bad", "worse", "first", "second")})
+        self.create_method()
+        method = DynamicIAMethod("Dynamic foo")
+        method.register(shift_invariant=True)
+        method.write({("b", "bad"): decay_function.format(2), ("b", "worse"): decay_function.format(10)})
+        tl = self.create_timeline()
+        tl.add(datetime.datetime(2012, 6, 1), ("b", "bad"), ("b", "second"), 5)
+        for kwargs in ({}, {'cumulative': False}, {'stepped': True}, {'cumulative': False, 'stepped': True}):
+            static = tl.characterize_static_by_process(("foo",), kwargs)
+            self.assertEqual(set(static), {"first", "second"})
+            for process in tl.processes():
+                expected = tl.timeline_for_activity(process).characterize_static(("foo",), **kwargs)
+                self.assertTrue(np.allclose(expected[0], static[process[1]][0][0]))
+                self.assertTrue(np.allclose(expected[1], static[process[1]][0][1]))
+            for use_kernels in (True, False):
+                dynamic = tl.characterize_dynamic_by_flow("Dynamic foo", dict(kwargs, use_kernels=use_kernels))
+                self.assertEqual(set(dynamic), {"bad", "worse"})
+                for flow in tl.flows():
+                    expected = tl.timeline_for_flow(flow).characterize_dynamic("Dynamic foo", use_kernels=use_kernels, **kwargs)
+                    self.assertTrue(np.allclose(expected[0], dynamic[flow[1]][0][0]))
+                    self.assertTrue(np.allclose(expected[1], dynamic[flow[1]][0][1]))
+        keys, years, impacts = tl.characterize_static_grouped(("foo",), by='flow', cumulative=False)
+        self.assertEqual(impacts.shape, (2, len(years)))
+        self.assertTrue(np.allclose(impacts.sum(axis=0), tl.characterize_static(("foo",), cumulative=False)[1]))
+        keys, years, impacts = tl.characterize_dynamic_grouped("Dynamic foo")
+        self.assertEqual(set(keys), {("b", "first"), ("b", "second")})
+        self.assertTrue(np.allclose(impacts.sum(axis=0), tl.characterize_dynamic("Dynamic foo")[1]))
+
+    def test_characterize_many(self):
+        """test that characterizing with many methods at once gives the same results of characterizing with each method"""
+        self.create_method()
+        for name, shift_invariant in (("Dynamic foo", True), ("Dynamic bar", False)):
+            method = DynamicIAMethod(name)
+            method.register(shift_invariant=shift_invariant)
+            method.write({("b", "bad"): decay_function.format(2), ("b", "worse"): decay_function.format(10 if shift_invariant else 3)})
+        tl = self.create_timeline()
+        tl.add(datetime.datetime(2010, 6, 1, 23, 0), ("b", "bad"), ("b", "first"), 5)
+        methods_list = [("foo",), "Dynamic foo", "Dynamic bar"]
+        for kwargs in ({}, {'cumulative': False}):
+            years, impacts = tl.characterize_many(methods_list, **kwargs)
+            self.assertEqual(impacts.shape, (3, len(years)))
+            for method, row in zip(methods_list, impacts):
+                if isinstance(method, tuple):
+                    expected = tl.characterize_static(method, **kwargs)
+                else:
+                    expected = tl.characterize_dynamic(method, **kwargs)
+                values = dict(zip(years, row))
+                self.assertTrue(np.allclose(expected[1], [values[year] for year in expected[0]]))
+                self.assertTrue(np.allclose(sum(expected[1]) if kwargs else expected[1][-1], sum(row) if kwargs else row[-1]))
+
+    def test_characterize_array_protocol(self):
+        """test that functions of the array protocol give the same results of the scalar ones"""
+        database = Database("b")
+        database.register()
+        database.write({("b", key): {'name': key} for key in ("bad", "worse", "first", "second")})
+        for name, function, protocol in (("Dynamic foo", decay_function, None), ("Array foo", array_decay_function, 'array')):
+            method = DynamicIAMethod(name)
+            method.register(function_protocol=protocol)
+            method.write({("b", "bad"): function.format(2), ("b", "worse"): function.format(10)})
+        self.assertTrue(DynamicIAMethod("Array foo").vectorized)
+        tl = self.create_timeline()
+        tl.add(datetime.datetime(2010, 6, 1, 23, 0), ("b", "bad"), ("b", "second"), 5)
+        for kwargs in ({}, {'cumulative': False}):
+            expected = tl.characterize_dynamic("Dynamic foo", use_kernels=False, **kwargs)
+            for use_kernels in (False, True):
+                years, impact = tl.characterize_dynamic("Array foo", use_kernels=use_kernels, **kwargs)
+                self.assertTrue(np.allclose(expected[0], years))
+                self.assertTrue(np.allclose(expected[1], impact))
+            by_process = tl.characterize_dynamic_by_process("Array foo", dict(kwargs, use_kernels=False))
+            for name, value in tl.characterize_dynamic_by_process("Dynamic foo", dict(kwargs, use_kernels=False)).items():
+                self.assertTrue(np.allclose(value[0][1], by_process[name][0][1]))
+        bounds = {'lower': np.datetime64('2020-01-01T00:00:00'), 'upper': np.datetime64('2025-01-01T00:00:00')}
+        expected = dict(DynamicIAMethod("Dynamic foo").to_worst_case_method("wc", register=False, **bounds))
+        for key, value in DynamicIAMethod("Array foo").to_worst_case_method("wc", register=False, **bounds):
+            self.assertAlmostEqual(expected[key], value)
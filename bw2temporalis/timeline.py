@@ -3,13 +3,15 @@ from __future__ import print_function, unicode_literals
 from eight import *
 
 from .dynamic_ia_methods import DynamicIAMethod, dynamic_methods
-from bw2data import Method, methods, get_activity
+from .utils import get_names
+from bw2data import Method, methods
+from scipy.signal import convolve
 import collections
-import itertools
 import numpy as np
 import datetime
 import os
 import gzip
+import struct
 try:
     import cPickle as pickle
 except ImportError:
@@ -18,120 +20,295 @@ except ImportError:
 data_point = collections.namedtuple('data_point', ['dt', 'flow', 'ds', 'amount'])
 grouped_dp=collections.namedtuple('grouped_dp', ['dt', 'flow', 'amount']) #groups by flow and datetime
 
+#initial number of elements of the Timeline buffers
+INITIAL_CAPACITY = 1024
+SECONDS_PER_DAY = 86400
+#columnar file format of `save_timeline`: magic, version, length of the pickled header, header and arrays aligned to ALIGNMENT bytes
+FORMAT_MAGIC = b'BW2TL'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+COLUMNS = (('_times', np.int64), ('_flows', np.int32), ('_processes', np.int32), ('_amounts', np.float64))
+
 class EmptyTimeline(Exception):
     pass
 
 
 class Timeline(object):
     """Sum and group elements over time.
-    Timeline calculations produce a list of [(datetime, amount)] tuples."""
+    Timeline calculations produce a list of [(datetime, amount)] tuples.
+
+    Data are stored in columns: `times` (int64 seconds since epoch), `flow_indices` and `process_indices` (int32 codes of
+    `flow_keys` and `process_keys`) and `amounts` (float64). `raw` returns the same data as a list of `data_point`
+    and is kept only for compatibility."""
 
     def __init__(self, data=None):
-        self.raw = data or []
-        self.characterized = []
-        self.dp_groups=[]
+        self._clear()
+        if data:
+            for dp in data:
+                self.add(*dp)
+
+    def _clear(self):
+        self.flow_keys, self._flow_codes = [], {}
+        self.process_keys, self._process_codes = [], {}
+        self._times = np.zeros(0, dtype=np.int64)
+        self._flows = np.zeros(0, dtype=np.int32)
+        self._processes = np.zeros(0, dtype=np.int32)
+        self._amounts = np.zeros(0, dtype=np.float64)
+        self._size = 0
+        self._characterized = None
+        self._dp_groups = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def times(self):
+        return self._times[:self._size]
+
+    @property
+    def flow_indices(self):
+        return self._flows[:self._size]
+
+    @property
+    def process_indices(self):
+        return self._processes[:self._size]
+
+    @property
+    def amounts(self):
+        return self._amounts[:self._size]
+
+    @property
+    def raw(self):
+        """Return the timeline as a list of `data_point` (compatibility accessor, slow for large timelines)"""
+        return [data_point(dt, self.flow_keys[flow], self.process_keys[ds], amount)
+                for dt, flow, ds, amount in zip(_to_datetime(self.times), self.flow_indices, self.process_indices, self.amounts.tolist())]
+
+    @raw.setter
+    def raw(self, data):
+        self._clear()
+        for dp in data:
+            self.add(*dp)
+
+    @property
+    def characterized(self):
+        """Characterized data of the last characterization as a list of `grouped_dp` sorted by datetime"""
+        return self._to_grouped_dp(self._characterized)
+
+    @property
+    def dp_groups(self):
+        """Data of the last characterization grouped by datetime and flow as a list of `grouped_dp`"""
+        return self._to_grouped_dp(self._dp_groups)
 
     def sort(self):
         """Sort the raw timeline data. Characterized data is already sorted."""
-        self.raw.sort(key=lambda x: x.dt)
+        order = np.argsort(self.times, kind='mergesort')
+        for name in ('_times', '_flows', '_processes', '_amounts'):
+            setattr(self, name, getattr(self, name)[:self._size][order])
 
     def add(self, dt, flow, ds, amount):
         """Add a new flow from a dataset at a certain time."""
-        self.raw.append(data_point(dt, flow, ds, amount))
+        self._reserve(1)
+        self._times[self._size] = np.datetime64(dt, 's').astype(np.int64)
+        self._flows[self._size] = self._flow_code(flow)
+        self._processes[self._size] = self._process_code(ds)
+        self._amounts[self._size] = amount
+        self._size += 1
+
+    def add_many(self, dts, flow, ds, amounts):
+        """Add many values of the same flow from a dataset. `dts` is an array of datetime (either `numpy.datetime64` or `datetime.datetime`) and `amounts` an array of the same length."""
+        n = len(amounts)
+        self._reserve(n)
+        end = self._size + n
+        self._times[self._size:end] = np.asarray(dts).astype('datetime64[s]').astype(np.int64)
+        self._flows[self._size:end] = self._flow_code(flow)
+        self._processes[self._size:end] = self._process_code(ds)
+        self._amounts[self._size:end] = amounts
+        self._size = end
+
+    def scaled(self, factor):
+        """Create a new Timeline with all the amounts multiplied by `factor`"""
+        return combine([self], [factor])
+
+    def __add__(self, other):
+        """Create a new Timeline with the elements of both timelines"""
+        return combine([self, other])
 
     def flows(self):
         """Get set of flows in timeline"""
-        return {pt.flow for pt in self.raw}
+        return {self.flow_keys[code] for code in np.unique(self.flow_indices)}
 
     def processes(self):
         """Get set of processes in timeline"""
-        return {pt.ds for pt in self.raw}
+        return {self.process_keys[code] for code in np.unique(self.process_indices)}
 
     def timeline_for_flow(self, flow):
         """Create a new Timeline for a particular flow."""
-        return Timeline([x for x in self.raw if x.flow == flow])
+        return self._subset(self._flow_mask(flow))
 
     def timeline_for_activity(self, activity):
         """Create a new Timeline for a particular activity."""
-        return Timeline([x for x in self.raw if x.ds == activity])
+        return self._subset(self._process_mask(activity))
 
     def total_flow_for_activity(self, flow, activity):
         """Return cumulative amount of the flow passed for the activity passed"""
-        return sum([x.amount for x in self.raw if x.ds == activity and x.flow == flow])
+        return float(self.amounts[self._flow_mask(flow) & self._process_mask(activity)].sum())
         
     def total_amount_for_flow(self, flow):
         """Return cumulative amount of the flow passed"""
-        return sum([x.amount for x in self.raw if x.flow == flow])
+        return float(self.amounts[self._flow_mask(flow)].sum())
 
     def characterize_static(self, method, data=None, cumulative=True, stepped=False):
         """Characterize a Timeline object with a static impact assessment method.
         
         Args:
             * *method* (tuple): The static impact assessment method.
-            * *data* (Timeline object; default=None): ....
+            * *data* (Timeline object or list of `data_point`; default=None): data to characterize instead of the ones of this timeline.
             * *cumulative* (bool; default=True): when True return cumulative impact over time.
             * *stepped* (bool; default=True):...
         """
         if method not in methods:
             raise ValueError(u"LCIA static method %s not found" % method)
-        if data is None and not self.raw:
+        if data is None and not self._size:
             raise EmptyTimeline("No data to characterize")
         self.method_data = {x[0]: x[1] for x in Method(method).load()}    
-        self.dp_groups=self._groupby_sum_by_flow(self.raw if data is None else data)
+        timeline = self._as_timeline(data)
+        times, flows, amounts = self._groupby_sum_by_flow(timeline)
         
-        self.characterized = [
-                    grouped_dp(nt.dt, nt.flow, nt.amount * self.method_data.get(nt.flow, 0))
-                    # grouped_dp(nt.dt, nt.flow, nt.amount * method_data.get(nt.flow, 0))
-                    for nt in self.dp_groups
-                ]
-        self.characterized.sort(key=lambda x: x.dt)
-        return self._summer(self.characterized, cumulative, stepped)
+        cfs = np.array([self.method_data.get(flow, 0) for flow in timeline.flow_keys], dtype=np.float64)
+        self._set_characterized(times, flows, amounts * cfs[flows], timeline.flow_keys)
+        return self._summer(self._characterized[0], self._characterized[2], cumulative, stepped)
 
 
-    def characterize_dynamic(self, method, data=None, cumulative=True, stepped=False):
+    def characterize_dynamic(self, method, data=None, cumulative=True, stepped=False, use_kernels=None):
         """Characterize a Timeline object with a dynamic impact assessment method.
         Return a nested list of year and impact
         Args:
             * *method* (tuple): The dynamic impact assessment method.
-            * *data* (Timeline object; default=None): ....
+            * *data* (Timeline object or list of `data_point`; default=None): data to characterize instead of the ones of this timeline.
             * *cumulative* (bool; default=True): when True return cumulative impact over time.
             * *stepped* (bool; default=True):...
+            * *use_kernels* (bool; default=None): when True the CF functions are evaluated once as numerical kernels and convolved with the emissions of each flow on a daily grid (the characterized data have daily resolution). Default is True for methods registered as `shift_invariant`
         """
         if method not in dynamic_methods:
             raise ValueError(u"LCIA dynamic method %s not found" % method)
-        if data is None and not self.raw:
+        if data is None and not self._size:
             raise EmptyTimeline("No data to characterize")
         method = DynamicIAMethod(method)
         self.method_data = method.load()
+        if use_kernels is None:
+            use_kernels = method.shift_invariant
+
+        timeline = self._as_timeline(data)
+        times, flows, amounts = self._groupby_sum_by_flow(timeline)
+
+        if use_kernels:
+            self._set_characterized(*self._convolve_kernels(times, flows, amounts, method.create_kernels(self.method_data), timeline.flow_keys))
+            return self._summer(self._characterized[0], self._characterized[2], cumulative, stepped)
+
         method_functions = method.create_functions(self.method_data)
 
-        self.characterized = []
-        self.dp_groups=self._groupby_sum_by_flow(self.raw if data is None else data)
-
-        for obj in self.dp_groups:
-            # if obj.flow in method_functions:
-            self.characterized.extend([
-                grouped_dp(
-                    item.dt,
-                    obj.flow,
-                    item.amount * obj.amount
-                ) for item in method_functions[obj.flow](obj.dt)
-            ])
-            # else:
-                # continue
-                #GIU: I would skipe this,we save time plus memory, in groupby_sum_by_flow already skips datapoint not in method_data
-                #also more consistent in my opinion (the impact is not 0 but is simply not measurable)
-                
-                # self.characterized.append(grouped_dp(
-                    # obj.dt,
-                    # obj.flow,
-                    # obj.amount * method_data.get(obj.flow, 0)
-                # ))
-                
-        self.characterized.sort(key=lambda x: x.dt)
-
-        return self._summer(self.characterized, cumulative, stepped)
+        #GIU: flows not in method_data are already skipped in `_groupby_sum_by_flow`, we save time plus memory
+        #also more consistent in my opinion (the impact is not 0 but is simply not measurable)
+        char_times, char_flows, char_amounts = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int32)], [np.zeros(0, dtype=np.float64)]
+        for flow in np.unique(flows):
+            selected = flows == flow
+            flow_times, _, flow_amounts = _evaluate_function(method_functions[timeline.flow_keys[flow]], times[selected], amounts[selected])
+            char_times.append(flow_times)
+            char_flows.append(np.full(flow_times.shape[0], flow, dtype=np.int32))
+            char_amounts.append(flow_amounts)
+
+        self._set_characterized(np.hstack(char_times), np.hstack(char_flows), np.hstack(char_amounts), timeline.flow_keys)
+        return self._summer(self._characterized[0], self._characterized[2], cumulative, stepped)
         
+    def characterize_many(self, methods_list, cumulative=True, stepped=False, use_kernels=None):
+        """Characterize a Timeline object with many static and/or dynamic impact assessment methods grouping the data only once.
+        Static methods are applied with a matrix of CFs (flows x methods), dynamic ones with kernels are convolved with the emissions of each flow stacked on the same daily grid.
+        Return the list of years and a 2D array of impacts (methods x years). Years are the ones where at least one method has values (impacts of the other methods are 0 or constant if cumulative).
+        Args:
+            * *methods_list* (list): static (as registered in `methods`) and dynamic (as registered in `dynamic_methods`) impact assessment methods.
+            * *cumulative* (bool; default=True): when True return cumulative impact over time.
+            * *stepped* (bool; default=False):...
+            * *use_kernels* (bool; default=None): see `characterize_dynamic`, used for all the dynamic methods
+        """
+        if not self._size:
+            raise EmptyTimeline("No data to characterize")
+        static, dynamic = {}, {}
+        for index, method in enumerate(methods_list):
+            if method in methods:
+                static[index] = {x[0]: x[1] for x in Method(method).load()}
+            elif method in dynamic_methods:
+                dynamic[index] = DynamicIAMethod(method)
+            else:
+                raise ValueError(u"LCIA method %s not found" % (method,))
+        dynamic_data = {index: method.load() for index, method in dynamic.items()}
+        in_method = np.array([any(flow in data for data in list(static.values()) + list(dynamic_data.values())) for flow in self.flow_keys], dtype=bool)
+        times, flows, amounts = self._groupby_time_and_flow(self, in_method)
+
+        #characterized data as arrays of days since epoch, method indices and amounts
+        char_days, char_methods, char_amounts = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.float64)]
+        if static:
+            indices = np.array(sorted(static))
+            cfs = np.array([[static[index].get(flow, 0) for index in indices] for flow in self.flow_keys], dtype=np.float64).reshape((-1, indices.shape[0]))
+            char_days.append(np.repeat(times // SECONDS_PER_DAY, indices.shape[0]))
+            char_methods.append(np.tile(indices, times.shape[0]))
+            char_amounts.append((amounts.reshape((-1, 1)) * cfs[flows]).ravel())
+        kernel_methods = [index for index in sorted(dynamic) if (dynamic[index].shift_invariant if use_kernels is None else use_kernels)]
+        kernels = {index: dynamic[index].create_kernels(dynamic_data[index]) for index in kernel_methods}
+        for flow in np.unique(flows):
+            key = self.flow_keys[flow]
+            indices = [index for index in kernel_methods if key in kernels[index]]
+            if not indices:
+                continue
+            #kernels of all the methods on the union of their offsets
+            offsets = np.unique(np.hstack([kernels[index][key][0] for index in indices]))
+            values = np.zeros((len(indices), offsets.shape[0]))
+            for row, index in enumerate(indices):
+                values[row, np.searchsorted(offsets, kernels[index][key][0])] = kernels[index][key][1]
+            selected = flows == flow
+            days, flow_amounts = _convolve_kernel(times[selected], amounts[selected], (offsets, values))
+            char_days.append(np.tile(days, len(indices)))
+            char_methods.append(np.repeat(indices, days.shape[0]))
+            char_amounts.append(flow_amounts.ravel())
+        for index in sorted(set(dynamic).difference(kernel_methods)):
+            functions = dynamic[index].create_functions(dynamic_data[index])
+            for flow in np.unique(flows):
+                if self.flow_keys[flow] not in functions:
+                    continue
+                selected = flows == flow
+                flow_times, _, flow_amounts = _evaluate_function(functions[self.flow_keys[flow]], times[selected], amounts[selected])
+                char_days.append(flow_times // SECONDS_PER_DAY)
+                char_methods.append(np.full(flow_times.shape[0], index, dtype=np.int64))
+                char_amounts.append(flow_amounts)
+
+        days, day_inverse = np.unique(np.hstack(char_days), return_inverse=True)
+        shape = (len(methods_list), days.shape[0])
+        data = np.bincount(np.hstack(char_methods) * shape[1] + day_inverse.ravel(), weights=np.hstack(char_amounts), minlength=shape[0] * shape[1])
+        return self._grouped((methods_list, days, data.reshape(shape), None), cumulative, stepped)[1:]
+
+    def characterize_static_grouped(self, method, by='process', cumulative=True, stepped=False):
+        """Characterize a Timeline object with a static impact assessment method separately by process or flow in a single pass.
+        Return the list of process (or flow) keys, the list of years and a 2D array of impacts (keys x years)
+        Args:
+            * *method* (tuple): The static impact assessment method.
+            * *by* (str; default='process'): group by 'process' or 'flow'.
+            * *cumulative* (bool; default=True): when True return cumulative impact over time.
+            * *stepped* (bool; default=False):...
+        """
+        return self._grouped(self._characterize_static_grouped(method, by), cumulative, stepped)
+
+    def characterize_dynamic_grouped(self, method, by='process', cumulative=True, stepped=False, use_kernels=None):
+        """Characterize a Timeline object with a dynamic impact assessment method separately by process or flow in a single pass.
+        CF functions are evaluated once for each datetime and flow, whatever the number of processes emitting it.
+        Return the list of process (or flow) keys, the list of years and a 2D array of impacts (keys x years)
+        Args:
+            * *method* (tuple): The dynamic impact assessment method.
+            * *by* (str; default='process'): group by 'process' or 'flow'.
+            * *cumulative* (bool; default=True): when True return cumulative impact over time.
+            * *stepped* (bool; default=False):...
+            * *use_kernels* (bool; default=None): see `characterize_dynamic`
+        """
+        return self._grouped(self._characterize_dynamic_grouped(method, by, use_kernels), cumulative, stepped)
+
     def characterize_static_by_process(self, method, characterize_static_kwargs={}):
         """Characterize a Timeline object with a static impact assessment method separately by process
         Return a dictionary with process name as key and a nested list of year and impact as value
@@ -139,8 +316,7 @@ class Timeline(object):
             * *method* (tuple): The static impact assessment method.
             * *characterize_static_kwargs* (dictionary; default={}): optional arguments (passed as key=argument name, value= argument value) passed to the called function `characterize_static` (e.g.'cumulative':True). See `characterize_static` for the possible arguments to pass
         """
-        #skip None that is returned from DynamicLCA when the overlall LCA impact of the demand is==0
-        return {get_activity(process)['name']:[self.timeline_for_activity(process).characterize_static(method,**characterize_static_kwargs)] for process in self.processes() if process is not None} 
+        return self._grouped_to_dict(self._characterize_static_grouped(method, 'process'), **characterize_static_kwargs)
         
     def characterize_dynamic_by_process(self, method, characterize_dynamic_kwargs={}):
         """Characterize a Timeline object with a static impact assessment method separately by process
@@ -149,9 +325,9 @@ class Timeline(object):
             * *method* (tuple): The dynamic impact assessment method.
             * *characterize_dynamic_kwargs* (dictionary; default={}): optional arguments (passed as key=argument name, value= argument value) passed to the called function `characterize_dynamic` (e.g. 'cumulative':True). See `characterize_dynamic` for the possible arguments to pass
         """
-        
-        #skip None that is returned from DynamicLCA when the overla LCA impact of the demand is==0
-        return {get_activity(process)['name']:[self.timeline_for_activity(process).characterize_dynamic(method,**characterize_dynamic_kwargs)] for process in self.processes() if process is not None} 
+        kwargs = dict(characterize_dynamic_kwargs)
+        use_kernels = kwargs.pop('use_kernels', None)
+        return self._grouped_to_dict(self._characterize_dynamic_grouped(method, 'process', use_kernels), **kwargs)
 
     def characterize_static_by_flow(self, method, characterize_static_kwargs={}):
         """Characterize a Timeline object with a static impact assessment method separately by flow
@@ -160,8 +336,7 @@ class Timeline(object):
             * *method* (tuple): The static impact assessment method.
             * *characterize_static_kwargs* (dictionary; default={}): optional arguments (passed as key=argument name, value= argument value) passed to the called function `characterize_static` (e.g.'cumulative':True). See `characterize_static` for the possible arguments to pass
         """
-        #skip None that is return from DynamicLCA when the overla LCA impact of the demand is==0
-        return {get_activity(flow)['name']:[self.timeline_for_flow(flow).characterize_static(method,**characterize_static_kwargs)] for flow in self.flows() if flow is not None} 
+        return self._grouped_to_dict(self._characterize_static_grouped(method, 'flow'), **characterize_static_kwargs)
         
     def characterize_dynamic_by_flow(self, method, characterize_dynamic_kwargs={}):
         """Characterize a Timeline object with a static impact assessment method separately by flow
@@ -170,72 +345,414 @@ class Timeline(object):
             * *method* (tuple): The dynamic impact assessment method.
             * *characterize_dynamic_kwargs* (dictionary; default={}): optional arguments (passed as key=argument name, value= argument value) passed to the called function `characterize_dynamic` (e.g. 'cumulative':True). See `characterize_dynamic` for the possible arguments to pass
         """
-        
-        #skip None that is return from DynamicLCA when the overla LCA impact of the demand is==0
-        return {get_activity(flow)['name']:[self.timeline_for_flow(flow).characterize_dynamic(method,**characterize_dynamic_kwargs)] for flow in self.flows() if flow is not None} 
+        kwargs = dict(characterize_dynamic_kwargs)
+        use_kernels = kwargs.pop('use_kernels', None)
+        return self._grouped_to_dict(self._characterize_dynamic_grouped(method, 'flow', use_kernels), **kwargs)
         
 ##############
 #INTERNAL USE#
 ##############
 
-    #~1.5 times faster than using Counter() and ~3 than using groupby that need sorting before but still not great (e.g. pandas ~2 times faster, check if possible to use numpy_groupies somehow )
-    #CHECK WHAT IS THIS APPROACH AND IF APPLICABLE http://stackoverflow.com/a/18066479/4929813    
-    def _groupby_sum_by_flow(self,iterable):
-        """group and sum datapoint by flow, it makes much faster characterization"""
-        c = collections.defaultdict(int)
-        for dp in iterable:
-            c[dp.dt,dp.flow] += dp.amount
-        return[grouped_dp(dt_fl[0],dt_fl[1],amount) for dt_fl,amount in c.items() 
-                        if dt_fl[1] in self.method_data and amount != 0 ] # skip datapoints with flows without dyn_met and 0 bio_flows  
-
-    def _summer(self, iterable, cumulative, stepped=False):
+    def _reserve(self, n):
+        """Grow the buffers (doubling their size) to have space for `n` more elements"""
+        if self._size + n <= self._times.shape[0]:
+            return
+        capacity = max(INITIAL_CAPACITY, 2 * self._times.shape[0], self._size + n)
+        for name in ('_times', '_flows', '_processes', '_amounts'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _flow_code(self, flow):
+        if flow not in self._flow_codes:
+            self._flow_codes[flow] = len(self.flow_keys)
+            self.flow_keys.append(flow)
+        return self._flow_codes[flow]
+
+    def _process_code(self, ds):
+        if ds not in self._process_codes:
+            self._process_codes[ds] = len(self.process_keys)
+            self.process_keys.append(ds)
+        return self._process_codes[ds]
+
+    def _flow_mask(self, flow):
+        if flow not in self._flow_codes:
+            return np.zeros(self._size, dtype=bool)
+        return self.flow_indices == self._flow_codes[flow]
+
+    def _process_mask(self, ds):
+        if ds not in self._process_codes:
+            return np.zeros(self._size, dtype=bool)
+        return self.process_indices == self._process_codes[ds]
+
+    def _subset(self, mask):
+        """Create a new Timeline with the elements selected by the boolean array `mask` (code tables are copied)"""
+        timeline = Timeline()
+        timeline.flow_keys, timeline._flow_codes = list(self.flow_keys), dict(self._flow_codes)
+        timeline.process_keys, timeline._process_codes = list(self.process_keys), dict(self._process_codes)
+        timeline._times = self.times[mask]
+        timeline._flows = self.flow_indices[mask]
+        timeline._processes = self.process_indices[mask]
+        timeline._amounts = self.amounts[mask]
+        timeline._size = timeline._times.shape[0]
+        return timeline
+
+    def _as_timeline(self, data):
+        """Return this timeline if `data` is None, otherwise `data` as Timeline"""
+        if data is None:
+            return self
+        return data if isinstance(data, Timeline) else Timeline(data)
+
+    def _set_characterized(self, times, flows, amounts, flow_keys):
+        """Store the characterized data sorted by datetime"""
+        order = np.argsort(times, kind='mergesort')
+        self._characterized = (times[order], flows[order], amounts[order], flow_keys)
+
+    def _to_grouped_dp(self, data):
+        if data is None:
+            return []
+        times, flows, amounts, flow_keys = data
+        return [grouped_dp(dt, flow_keys[flow], amount) for dt, flow, amount in zip(_to_datetime(times), flows, amounts.tolist())]
+
+    def _groupby_sum_by_flow(self, timeline):
+        """group and sum datapoint by datetime and flow, it makes much faster characterization.
+        Return the arrays of times, flow codes and amounts of the groups, skipping datapoints with flows without CF in `self.method_data` and 0 amounts"""
+        in_method = np.array([flow in self.method_data for flow in timeline.flow_keys], dtype=bool)
+        times, flows, amounts = self._groupby_time_and_flow(timeline, in_method)
+        self._dp_groups = (times, flows, amounts, timeline.flow_keys)
+        return times, flows, amounts
+
+    def _groupby_time_and_flow(self, timeline, in_method):
+        """group and sum datapoint of `timeline` by datetime and flow, skipping flows whose code is False in the boolean array `in_method` and 0 amounts.
+        Return the arrays of times, flow codes and amounts of the groups"""
+        if not len(timeline):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64)
+        order = np.lexsort((timeline.flow_indices, timeline.times))
+        times, flows = timeline.times[order], timeline.flow_indices[order]
+        start = np.flatnonzero(np.r_[True, (times[1:] != times[:-1]) | (flows[1:] != flows[:-1])])
+        times, flows = times[start], flows[start]
+        amounts = np.add.reduceat(timeline.amounts[order], start)
+        mask = in_method[flows] & (amounts != 0)
+        return times[mask], flows[mask], amounts[mask]
+
+    def _groupby_sum_by_flow_and_group(self, by):
+        """group and sum datapoint by datetime, flow and process (or flow if `by` is 'flow'), as `_groupby_sum_by_flow`.
+        Return the arrays of times, flow codes, group codes (codes of `process_keys` or `flow_keys`) and amounts of the groups"""
+        if by not in ('process', 'flow'):
+            raise ValueError(u"Can group only by 'process' or 'flow', not %s" % by)
+        group_indices = self.process_indices if by == 'process' else self.flow_indices
+        order = np.lexsort((group_indices, self.flow_indices, self.times))
+        times, flows, groups = self.times[order], self.flow_indices[order], group_indices[order]
+        start = np.flatnonzero(np.r_[True, (times[1:] != times[:-1]) | (flows[1:] != flows[:-1]) | (groups[1:] != groups[:-1])])
+        if not len(self):
+            start = start[:0]
+        times, flows, groups = times[start], flows[start], groups[start]
+        amounts = np.add.reduceat(self.amounts[order], start) if start.shape[0] else np.zeros(0, dtype=np.float64)
+        in_method = np.array([flow in self.method_data for flow in self.flow_keys], dtype=bool)
+        mask = in_method[flows] & (amounts != 0)
+        return times[mask], flows[mask], groups[mask], amounts[mask]
+
+    def _characterize_static_grouped(self, method, by):
+        """Characterize with a static method grouping by process or flow, return the data of `_sum_by_group`"""
+        if method not in methods:
+            raise ValueError(u"LCIA static method %s not found" % method)
+        self.method_data = {x[0]: x[1] for x in Method(method).load()}
+        times, flows, groups, amounts = self._groupby_sum_by_flow_and_group(by)
+        cfs = np.array([self.method_data.get(flow, 0) for flow in self.flow_keys], dtype=np.float64)
+        return self._sum_by_group(times, groups, amounts * cfs[flows], by)
+
+    def _characterize_dynamic_grouped(self, method, by, use_kernels=None):
+        """Characterize with a dynamic method grouping by process or flow, return the data of `_sum_by_group`"""
+        if method not in dynamic_methods:
+            raise ValueError(u"LCIA dynamic method %s not found" % method)
+        method = DynamicIAMethod(method)
+        self.method_data = method.load()
+        if use_kernels is None:
+            use_kernels = method.shift_invariant
+        times, flows, groups, amounts = self._groupby_sum_by_flow_and_group(by)
+
+        if use_kernels:
+            #convolve separately each couple of group and flow, identified by its index in `pairs`
+            pairs, pair_indices = np.unique(np.vstack((groups, flows)), axis=1, return_inverse=True)
+            char_times, char_pairs, char_amounts, _ = self._convolve_kernels(
+                times, pair_indices.ravel(), amounts, method.create_kernels(self.method_data), [self.flow_keys[flow] for flow in pairs[1]]
+            )
+            return self._sum_by_group(char_times, pairs[0][char_pairs], char_amounts, by)
+
+        method_functions = method.create_functions(self.method_data)
+        char_times, char_groups, char_amounts = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int32)], [np.zeros(0, dtype=np.float64)]
+        for flow in np.unique(flows):
+            selected = flows == flow
+            #evaluate once for each time, then expand to the groups emitting at that time
+            unique_times, inverse = np.unique(times[selected], return_inverse=True)
+            inverse = inverse.ravel()
+            flow_times, indices, flow_amounts = _evaluate_function(method_functions[self.flow_keys[flow]], unique_times, np.ones(unique_times.shape[0]))
+            counts = np.bincount(indices, minlength=unique_times.shape[0])
+            starts = np.cumsum(counts) - counts
+            row_counts = counts[inverse]
+            positions = np.repeat(starts[inverse] - (np.cumsum(row_counts) - row_counts), row_counts) + np.arange(row_counts.sum())
+            char_times.append(flow_times[positions])
+            char_groups.append(np.repeat(groups[selected], row_counts))
+            char_amounts.append(flow_amounts[positions] * np.repeat(amounts[selected], row_counts))
+        return self._sum_by_group(np.hstack(char_times), np.hstack(char_groups), np.hstack(char_amounts), by)
+
+    def _sum_by_group(self, times, groups, amounts, by):
+        """group by date and group code and sum amounts.
+        Return the keys of the groups with values, the days since epoch, the 2D array of amounts (groups x days) and the boolean 2D array of the days where each group has values"""
+        group_keys = self.process_keys if by == 'process' else self.flow_keys
+        codes, group_inverse = np.unique(groups, return_inverse=True)
+        days, day_inverse = np.unique(times // SECONDS_PER_DAY, return_inverse=True)
+        index = group_inverse.ravel() * days.shape[0] + day_inverse.ravel()
+        shape = (codes.shape[0], days.shape[0])
+        data = np.bincount(index, weights=amounts, minlength=shape[0] * shape[1]).reshape(shape).astype(np.float64)
+        support = np.bincount(index, minlength=shape[0] * shape[1]).reshape(shape) > 0
+        return [group_keys[code] for code in codes], days, data, support
+
+    def _grouped(self, grouped, cumulative, stepped):
+        """Return keys, years and 2D array of impacts (cumulated if `cumulative`) of the data of `_sum_by_group`, as `_summer` does for a single group"""
+        keys, days, data, _ = grouped
         if cumulative:
-            data =  self._cumsum_amount_over_time(iterable)
-        else:
-            data =  self._sum_amount_over_time(iterable)
+            data = np.cumsum(data, axis=1)
+        if stepped:
+            data = np.hstack((np.zeros((data.shape[0], 1)), np.repeat(data, 2, axis=1)[:, :-1]))
+            return keys, self._to_year(np.repeat(days, 2)), data
+        return keys, self._to_year(days), data
+
+    def _grouped_to_dict(self, grouped, cumulative=True, stepped=False):
+        """Return the data of `_sum_by_group` as a dictionary with process (or flow) name as key and a nested list of year and impact, only for the days where the
+        process (or flow) has values, as value"""
+        keys, days, data, support = grouped
+        #skip None that is returned from DynamicLCA when the overall LCA impact of the demand is==0
+        names = get_names([key for key in keys if key is not None])
+        return {names[key]: [self._summer_days(days[mask], row[mask], cumulative, stepped)] for key, row, mask in zip(keys, data, support) if key is not None}
+
+    def _convolve_kernels(self, times, flows, amounts, kernels, flow_keys):
+        """Characterize grouped data convolving the emissions of each flow with the kernel of its CF on a daily grid.
+        Return arrays of times (at the beginning of the day), flow codes, amounts and the flow keys"""
+        char_times, char_flows, char_amounts = [], [], []
+        for flow in np.unique(flows):
+            selected = flows == flow
+            days, amounts_flow = _convolve_kernel(times[selected], amounts[selected], kernels[flow_keys[flow]])
+            char_times.append(days * SECONDS_PER_DAY)
+            char_flows.append(np.full(days.shape[0], flow, dtype=np.int32))
+            char_amounts.append(amounts_flow)
+        if not char_times:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64), flow_keys
+        return np.hstack(char_times), np.hstack(char_flows), np.hstack(char_amounts), flow_keys
+
+    def _summer(self, times, amounts, cumulative, stepped=False):
+        """group by date and sum amounts (cumulated if `cumulative`), return a list of fractional years and a list of amounts"""
+        days, inverse = np.unique(times // SECONDS_PER_DAY, return_inverse=True)
+        data = np.bincount(inverse.ravel(), weights=amounts, minlength=days.shape[0])
+        return self._summer_days(days, data, cumulative, stepped)
+
+    def _summer_days(self, days, data, cumulative, stepped=False):
+        """as `_summer` for amounts already summed by days since epoch"""
+        if cumulative:
+            data = np.cumsum(data)
         if stepped:
-            return self._stepper(data)
+            return self._stepper(days, data)
         else:
-            return self._to_year([x[0] for x in data]), [x[1] for x in data]
+            return self._to_year(days), data.tolist()
 
-    def _to_year(self, lst):
-        """convert datetime to fractional years"""
-        to_yr = lambda x: x.year + x.month / 12. + x.day / 365.24
-        return [to_yr(obj) for obj in lst]
+    def _to_year(self, days):
+        """convert days since epoch to fractional years"""
+        days = np.asarray(days).astype('datetime64[D]')
+        months = days.astype('datetime64[M]')
+        year = days.astype('datetime64[Y]').astype(np.int64) + 1970
+        month = months.astype(np.int64) % 12 + 1
+        day = (days - months).astype(np.int64) + 1
+        return (year + month / 12. + day / 365.24).tolist()
 
-    def _stepper(self, iterable):
-        xs, ys = zip(*iterable)
-        xs = list(itertools.chain(*zip(xs, xs)))
-        ys = [0] + list(itertools.chain(*zip(ys, ys)))[:-1]
+    def _stepper(self, days, data):
+        xs = np.repeat(days, 2)
+        ys = [0] + np.repeat(data, 2).tolist()[:-1]
         return self._to_year(xs), ys
 
-    def _sum_amount_over_time(self, iterable):
-        """groupby date and sum amount"""
-        #GIU: Think here, wiith different data structure we could use consolidate maybe
-        return sorted([
-            (dt, sum([x.amount for x in res]))
-            for dt, res in
-            itertools.groupby(iterable, key=lambda x: x.dt.date())
-            # itertools.groupby(iterable, key=lambda x: x.dt.astype(object).date()) # to work with numpy datetime. leave for now
-
-        ])
-
-    def _cumsum_amount_over_time(self, iterable):
-        """"""
-        data = self._sum_amount_over_time(iterable)
-        values = [float(x) for x in np.cumsum(np.array([x[1] for x in data]))]
-        return list(zip([x[0] for x in data], values))
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in ('_times', '_flows', '_processes', '_amounts'):
+            state[name] = np.asarray(state[name][:self._size])
+        return state
+
+    def __setstate__(self, state):
+        if 'raw' in state:
+            #timeline saved before the columnar storage
+            raw = state.pop('raw')
+            for name in ('characterized', 'dp_groups'):
+                state.pop(name, None)
+            self._clear()
+            self.__dict__.update(state)
+            for dp in raw:
+                self.add(*dp)
+        else:
+            self.__dict__.update(state)
+
+
+def combine(timelines, factors=None):
+    """Create a new Timeline with the elements of all the `timelines`, with the amounts of each one multiplied by the respective element of `factors` if passed"""
+    result = Timeline()
+    if factors is None:
+        factors = [1.] * len(timelines)
+    times, flows, processes, amounts = [result._times], [result._flows], [result._processes], [result._amounts]
+    for timeline, factor in zip(timelines, factors):
+        flow_codes = np.array([result._flow_code(key) for key in timeline.flow_keys], dtype=np.int32)
+        process_codes = np.array([result._process_code(key) for key in timeline.process_keys], dtype=np.int32)
+        times.append(timeline.times)
+        flows.append(flow_codes[timeline.flow_indices] if len(timeline) else timeline.flow_indices)
+        processes.append(process_codes[timeline.process_indices] if len(timeline) else timeline.process_indices)
+        amounts.append(timeline.amounts * factor)
+    result._times, result._flows = np.concatenate(times), np.concatenate(flows)
+    result._processes, result._amounts = np.concatenate(processes), np.concatenate(amounts)
+    result._size = result._times.shape[0]
+    return result
+
+
+def _evaluate_function(function, times, amounts):
+    """Characterize the emissions of a flow (`times` in seconds since epoch and `amounts`) with a CF function, at once if it follows the array protocol
+    (see `ArrayFunctionWrapper`) otherwise calling it for each emission.
+    Return the arrays of characterized times (seconds since epoch), indices of the emission (sorted) and amounts"""
+    if getattr(function, 'vectorized', False):
+        offsets, values = function.evaluate(times.astype('datetime64[s]'))
+        return (
+            (times.reshape((-1, 1)) + offsets.reshape((1, -1))).ravel(),
+            np.repeat(np.arange(times.shape[0]), offsets.shape[0]),
+            (values * amounts.reshape((-1, 1))).ravel()
+        )
+    char_times, indices, char_amounts = [], [], []
+    for index, (dt, amount) in enumerate(zip(_to_datetime(times), amounts)):
+        items = function(dt)
+        char_times.extend([item.dt for item in items])
+        indices.extend([index] * len(items))
+        char_amounts.extend([item.amount * amount for item in items])
+    return (
+        np.array(char_times, dtype='datetime64[s]').astype(np.int64),
+        np.array(indices, dtype=np.int64),
+        np.array(char_amounts, dtype=np.float64)
+    )
+
+
+def _convolve_kernel(times, amounts, kernel):
+    """Convolve emissions (`times` in seconds since epoch and `amounts`) with a CF kernel (offsets in seconds and values) on a daily grid.
+    The day of each result depends also on the second of the day of the emission, so emissions are convolved separately for each second of the day
+    (normally only a few different values) to have exactly the same days of the characterization point by point.
+    Return the arrays of days since epoch and amounts, only for the days where at least one emission and kernel value fall.
+    Values can also be a 2D array of stacked kernels with the same offsets (kernels x offsets), then amounts are a 2D array (kernels x days)"""
+    offsets, values = kernel
+    days, seconds = np.divmod(times, SECONDS_PER_DAY)
+    stacked = values.ndim == 2
+    values = values.reshape((-1, offsets.shape[0]))
+    result_days, result_amounts = [np.zeros(0, dtype=np.int64)], [np.zeros((values.shape[0], 0), dtype=np.float64)]
+    if not offsets.shape[0]:
+        return result_days[0], result_amounts[0] if stacked else result_amounts[0][0]
+    for second in np.unique(seconds):
+        selected = seconds == second
+        emission_days = days[selected]
+        kernel_days = (second + offsets) // SECONDS_PER_DAY
+        first = emission_days.min() + kernel_days.min()
+        emissions = np.bincount(emission_days - emission_days.min(), weights=amounts[selected])
+        #days where there is at least a characterized value (also if zero) as in the characterization point by point
+        support = np.flatnonzero(convolve(
+            (np.bincount(emission_days - emission_days.min()) > 0).astype(np.float64),
+            (np.bincount(kernel_days - kernel_days.min()) > 0).astype(np.float64)
+        ) > 0.5)
+        result_days.append(first + support)
+        result_amounts.append(np.vstack([
+            convolve(emissions, np.bincount(kernel_days - kernel_days.min(), weights=row))[support] for row in values
+        ]))
+    result_amounts = np.hstack(result_amounts)
+    return np.hstack(result_days), result_amounts if stacked else result_amounts[0]
+
+
+def _to_datetime(times):
+    """Convert an array of seconds since epoch to a list of `datetime.datetime`"""
+    return times.astype('datetime64[s]').astype(datetime.datetime).tolist()
         
         
-def load_dLCI(filepath):
+def save_timeline(filepath, timeline, **metadata):
+    """Save a Timeline in columnar format: a small pickled header with the code tables and the `metadata` passed, followed by the raw arrays of
+    times, flow codes, process codes and amounts. Load it with `load_timeline`.
+    Args:
+        * *filepath* (str) filepath of the file
+        * *timeline* (Timeline) timeline to save
+        * *metadata* additional (picklable) data to save with the timeline, returned by `load_timeline`
+    """
+    columns = [np.ascontiguousarray(getattr(timeline, name)[:len(timeline)], dtype=dtype) for name, dtype in COLUMNS]
+    offsets, offset = [], 0
+    for column in columns:
+        offsets.append(offset)
+        offset += -(-column.nbytes // ALIGNMENT) * ALIGNMENT
+    header = pickle.dumps({
+        'size': len(timeline),
+        'flow_keys': timeline.flow_keys,
+        'process_keys': timeline.process_keys,
+        'offsets': offsets,
+        'metadata': metadata,
+    }, protocol=2)
+    start = -(-(len(FORMAT_MAGIC) + 9 + len(header)) // ALIGNMENT) * ALIGNMENT
+    #write to a temporary file and rename, so that a file is never left half written
+    with open(filepath + '.tmp', 'wb') as f:
+        f.write(FORMAT_MAGIC + struct.pack('<BQ', FORMAT_VERSION, len(header)) + header)
+        for column, column_offset in zip(columns, offsets):
+            f.seek(start + column_offset)
+            f.write(column.tobytes())
+        f.truncate(start + offset)
+    os.replace(filepath + '.tmp', filepath)
+
+
+def load_timeline(filepath, mmap=True):
+    """Load a Timeline saved with `save_timeline`. Return the timeline and the dictionary of metadata saved with it.
+    Args:
+        * *filepath* (str) filepath of the file
+        * *mmap* (bool; default=True): if True the arrays are memory mapped (copy on write) and read from disk only when used
+    """
+    with open(filepath, 'rb') as f:
+        magic = f.read(len(FORMAT_MAGIC))
+        if magic != FORMAT_MAGIC:
+            raise ValueError(u"%s is not a timeline file" % filepath)
+        version, length = struct.unpack('<BQ', f.read(9))
+        if version > FORMAT_VERSION:
+            raise ValueError(u"Timeline file version %s not supported (maximum %s)" % (version, FORMAT_VERSION))
+        header = pickle.loads(f.read(length))
+        start = -(-(len(FORMAT_MAGIC) + 9 + length) // ALIGNMENT) * ALIGNMENT
+        timeline = Timeline()
+        timeline.flow_keys = list(header['flow_keys'])
+        timeline._flow_codes = {key: code for code, key in enumerate(timeline.flow_keys)}
+        timeline.process_keys = list(header['process_keys'])
+        timeline._process_codes = {key: code for code, key in enumerate(timeline.process_keys)}
+        size = header['size']
+        for (name, dtype), offset in zip(COLUMNS, header['offsets']):
+            if not size:
+                column = np.zeros(0, dtype=dtype)
+            elif mmap:
+                column = np.memmap(filepath, dtype=dtype, mode='c', offset=start + offset, shape=(size,))
+            else:
+                f.seek(start + offset)
+                column = np.fromfile(f, dtype=dtype, count=size)
+            setattr(timeline, name, column)
+        timeline._size = size
+    return timeline, header['metadata']
+
+
+def load_dLCI(filepath, mmap=True):
     """Load the dynamic lci saved with `bw2temporalis.DynamicLCA.save_dLCI`.
+    Return a dictionary with keys 'timeline', 'demand' and 'wc_method'. Files in the old gzip pickle format are also read.
     Args:
         * *filepath* (str) filepath of the file
+        * *mmap* (bool; default=True): if True the timeline arrays are memory mapped, see `load_timeline`
 
     """   
-    f = gzip.open(filepath,'rb')
-    timeline_raw = pickle.load(f)
-    f.close()
-    
-    return timeline_raw
+    with open(filepath, 'rb') as f:
+        magic = f.read(len(FORMAT_MAGIC))
+    if magic != FORMAT_MAGIC:
+        #old format, gzip pickle of the whole dictionary
+        f = gzip.open(filepath,'rb')
+        timeline_raw = pickle.load(f)
+        f.close()
+        return timeline_raw
+
+    timeline, metadata = load_timeline(filepath, mmap)
+    metadata['timeline'] = timeline
+    return metadata
         
@@ -2,8 +2,9 @@
 from __future__ import print_function, unicode_literals
 from eight import *
 
-from bw2data import Database
+from bw2data import Database, databases, get_activity
 from numbers import Number
+import collections
 import numpy as np
 import warnings
 import re
@@ -11,8 +12,10 @@ import datetime
 
 
 #also here need conversion from numpy to datetime
-def get_maximum_value(maybe_func, lower=None, upper=None, dynamic=True):
-    """Get maximum CF values by calculating each week from now for 100 years. Poor computers."""
+def get_maximum_value(maybe_func, lower=None, upper=None, dynamic=True, coarse_step=1):
+    """Get maximum CF values by calculating each week from now for 100 years. Poor computers.
+    If `coarse_step` is more than 1 week, functions not following the array protocol are first calculated every `coarse_step` weeks and then every week only
+    around the local maxima, so maxima narrower than `coarse_step` can be missed."""
     #GIU: approach below ~20 times faster than before
     if lower is None:
         lower = np.datetime64('now')
@@ -20,14 +23,33 @@ def get_maximum_value(maybe_func, lower=None, upper=None, dynamic=True):
         upper = lower+np.timedelta64(100,'Y').astype('timedelta64[s]') 
     if isinstance(maybe_func, Number):
         return maybe_func
+    if getattr(maybe_func, 'vectorized', False):
+        #array protocol, all the emission times at once
+        times = np.arange(lower, upper, dtype='datetime64[W]') if dynamic else np.array([lower])
+        return float(maybe_func.evaluate(times)[1].sum(axis=1).max())
     def _(obj):
         if isinstance(obj, Number):
             return obj
         else:
             return sum([x.amount for x in obj])
     if dynamic:
-        return max([_(maybe_func(x))
-            for x in np.arange(lower, upper, dtype='datetime64[W]').astype(datetime.timedelta)]) 
+        weeks = np.arange(lower, upper, dtype='datetime64[W]').astype(datetime.timedelta)
+        if coarse_step <= 1 or weeks.shape[0] <= 2 * coarse_step:
+            return max([_(maybe_func(x)) for x in weeks])
+        values = {}
+        coarse = list(range(0, weeks.shape[0], coarse_step))
+        if coarse[-1] != weeks.shape[0] - 1:
+            coarse.append(weeks.shape[0] - 1)
+        for index in coarse:
+            values[index] = _(maybe_func(weeks[index]))
+        padded = [-np.inf] + [values[index] for index in coarse] + [-np.inf]
+        for position, index in enumerate(coarse, 1):
+            if padded[position] >= padded[position - 1] and padded[position] >= padded[position + 1]:
+                #refine every week around the local maximum
+                for other in range(max(0, index - coarse_step + 1), min(weeks.shape[0], index + coarse_step)):
+                    if other not in values:
+                        values[other] = _(maybe_func(weeks[other]))
+        return max(values.values())
     else:
         #If total CF not a function of time of emission,
         #don't need to do all this work, just calculate
@@ -35,6 +57,73 @@ def get_maximum_value(maybe_func, lower=None, upper=None, dynamic=True):
         # return _(maybe_func(lower))
         return _(maybe_func(lower.astype(datetime.datetime)))
 
+def get_names(keys):
+    """Return a dictionary {key: name} of the activities `keys`.
+    Names of activities in SQLite databases are read with a query for each database, the others with `get_activity`"""
+    try:
+        from bw2data.backends import ActivityDataset
+    except ImportError:
+        try:
+            #older bw2data
+            from bw2data.backends.peewee import ActivityDataset
+        except ImportError:
+            ActivityDataset = None
+    codes = collections.defaultdict(set)
+    for key in keys:
+        codes[key[0]].add(key[1])
+    names = {}
+    for name, database_codes in codes.items():
+        database_codes = sorted(database_codes)
+        if ActivityDataset is not None and databases[name].get('backend', 'sqlite') == 'sqlite':
+            #in chunks to stay below the maximum number of parameters of SQLite
+            for start in range(0, len(database_codes), 500):
+                query = ActivityDataset.select(ActivityDataset.code, ActivityDataset.name).where(
+                    (ActivityDataset.database == name) & (ActivityDataset.code << database_codes[start:start + 500])
+                )
+                names.update({(name, code): activity_name for code, activity_name in query.tuples()})
+        for code in database_codes:
+            if (name, code) not in names:
+                names[(name, code)] = get_activity((name, code))['name']
+    return names
+
+
+def strongly_connected_components(graph):
+    """Return the strongly connected components of `graph` (dict node -> iterable of successors) as a list of sets.
+    Iterative Tarjan's algorithm, successors that are not keys of `graph` are nodes without successors"""
+    index, lowlink, on_stack, stack, components = {}, {}, set(), [], []
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph.get(root, ())))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(graph.get(successor, ()))))
+                    break
+                elif successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    lowlink[work[-1][0]] = min(lowlink[work[-1][0]], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
 #GIU:not needed anymore
 # def check_temporal_distribution_totals(name):
     # """Check that temporal distributions sum to total `amount` value"""